@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Times the batched bootstrap confidence interval of the MSE against a loop over replicates.
+
+Usage:
+    python benchmarks/bench_bootstrap.py --rows 1000000 --replicates 1000
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from _scripts import load_script
+
+evaluation = load_script("evaluate/evaluate_xgboost/main.py", "evaluate_xgboost")
+sys.modules["evaluate_xgboost"] = evaluation  # bootstrap batches are pickled by reference to the pool workers
+
+
+def loop_interval(squared_errors, replicates, confidence=0.95, seed=0):
+    """One resample per Python iteration, the straightforward implementation."""
+    rng = np.random.default_rng(seed)
+    means = [squared_errors[rng.integers(0, len(squared_errors), len(squared_errors))].mean() for _ in range(replicates)]
+    return np.quantile(means, [(1 - confidence) / 2, (1 + confidence) / 2])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--replicates", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, None])
+    args = parser.parse_args()
+
+    squared_errors = np.random.default_rng(0).exponential(4.0, size=args.rows)
+    print(f"{'method':<22}{'seconds':>10}{'lower':>10}{'upper':>10}")
+    start = time.perf_counter()
+    lower, upper = loop_interval(squared_errors, args.replicates)
+    print(f"{'loop':<22}{time.perf_counter() - start:>10.2f}{lower:>10.4f}{upper:>10.4f}")
+    for workers in args.workers:
+        start = time.perf_counter()
+        interval = evaluation.bootstrap_confidence_interval(squared_errors, args.replicates, workers=workers)
+        name = f"batched, {workers or 'all'} worker(s)"
+        print(f"{name:<22}{time.perf_counter() - start:>10.2f}{interval['lower']:>10.4f}{interval['upper']:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Times the startup of the pipeline CLIs: --help, the import of the pipeline module, and generating its definition
+with and without the on-disk definition cache.
+
+Definitions are generated offline, with S3 mocked by moto and the image URIs pre-seeded in the image URI cache.
+
+Usage:
+    python benchmarks/bench_cli_startup.py --repeat 3 --top 12
+"""
+import argparse
+import json
+import os
+import pathlib
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+MODEL_BUILD = pathlib.Path(__file__).resolve().parents[1]
+ML_PIPELINES = MODEL_BUILD / "ml_pipelines"
+
+# run in a subprocess: generate the definition through the cache, report the time and whether the SDK was imported
+GENERATE = """
+import json, sys, time
+from moto import mock_aws
+import boto3
+from _utils import PipelineDefinitionCache, get_cached_definition
+with mock_aws():
+    boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="bench-bucket")
+    start = time.perf_counter()
+    cache = PipelineDefinitionCache(ttl_seconds=int(sys.argv[2]))
+    name, definition, pipeline = get_cached_definition("training.pipeline", sys.argv[1], cache)
+    seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "cache_hit": pipeline is None, "sdk_imported": "sagemaker" in sys.modules}))
+"""
+
+
+def wall_time(command, repeat, **kwargs):
+    """Best wall time of `repeat` runs of a command."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def import_times(module, cwd):
+    """Cumulative import time in seconds and nesting level of each module `import module` imports (-X importtime)."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd, capture_output=True, text=True
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            # nesting level from the indentation, 0 for the module itself
+            times[match.group(3)] = (int(match.group(1)) / 1e6, (len(match.group(2)) - 1) // 2)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--levels", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'--help':<40}{'seconds':>10}")
+    for name, command in {
+        "get_pipeline_definition": [sys.executable, "-m", "ml_pipelines.get_pipeline_definition", "--help"],
+        "run_pipeline": [sys.executable, "ml_pipelines/run_pipeline.py", "--help"],
+        "run_pipeline_locally": [sys.executable, "ml_pipelines/run_pipeline_locally.py", "--help"],
+    }.items():
+        print(f"{name:<40}{wall_time(command, args.repeat, cwd=MODEL_BUILD):>10.3f}")
+
+    times = import_times("training.pipeline", ML_PIPELINES)
+    print(f"\n{'import training.pipeline (cumulative)':<40}{'seconds':>10}")
+    # the slowest modules down to a few levels below the pipeline module
+    shallow = {name: seconds for name, (seconds, level) in times.items() if level <= args.levels}
+    for name, seconds in sorted(shallow.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"{name:<40}{seconds:>10.3f}")
+
+    sys.path.insert(0, str(ML_PIPELINES))
+    from training._utils import ImageUriCache
+
+    with tempfile.TemporaryDirectory() as home:
+        image_cache = ImageUriCache(os.path.join(home, ".cache", "ml_pipelines", "image_uris"), ttl_seconds=3600)
+        for kind in ["processing", "training", "inference"]:
+            image_name = f"sagemaker-SageMakerProjectId-{kind}imagebuild"
+            image_cache.put(["describe_image_version", "us-east-1", image_name], f"123456789012.dkr.ecr/{kind}:1")
+        env = {
+            **os.environ,
+            "HOME": home,
+            "PYTHONPATH": str(ML_PIPELINES),
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+        }
+        role = "arn:aws:iam::123456789012:role/bench"
+        kwargs = f"{{'region': 'us-east-1', 'role': '{role}', 'default_bucket': 'bench-bucket'}}"
+        print(f"\n{'definition':<28}{'seconds':>10}{'process':>10}  SDK imported")
+        for name, ttl in [("generated (cache disabled)", 0), ("generated, cache miss", 3600), ("cache hit", 3600)]:
+            start = time.perf_counter()
+            stdout = subprocess.run(
+                [sys.executable, "-c", GENERATE, kwargs, str(ttl)],
+                cwd=MODEL_BUILD,
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            process_seconds = time.perf_counter() - start
+            result = json.loads(stdout.strip().splitlines()[-1])
+            print(f"{name:<28}{result['seconds']:>10.3f}{process_seconds:>10.3f}  {result['sdk_imported']}")
+
+
+if __name__ == "__main__":
+    main()
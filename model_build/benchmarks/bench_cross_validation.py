@@ -0,0 +1,68 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Compares the wall time of k concurrent cross-validation folds with running them one after another.
+
+The abalone rows are replicated `--copies` times so that a fold takes long
+enough to time.
+
+Usage:
+    python benchmarks/bench_cross_validation.py --folds 5 --copies 20
+"""
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+
+import numpy as np
+
+from _scripts import SOURCE_SCRIPTS, load_script
+
+preprocess = load_script("preprocessing/prepare_abalone_data/main.py", "prepare_abalone_data")
+cv = load_script("evaluate/cross_validate_xgboost/main.py", "cross_validate_xgboost")
+sys.modules["cross_validate_xgboost"] = cv  # folds are pickled by reference to the pool workers
+
+DATASET = SOURCE_SCRIPTS.parent / "ml_pipelines" / "data" / "abalone-dataset.csv"
+PARAMS = {"max_depth": 5, "eta": 0.2, "gamma": 4, "min_child_weight": 6, "subsample": 0.7}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--copies", type=int, default=20)
+    parser.add_argument("--num-round", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        for name in preprocess.split_names:
+            pathlib.Path(base_dir, name).mkdir()
+        numeric_features = preprocess.feature_columns_names[1:]
+        preprocess.preprocess_in_memory([str(DATASET)], base_dir, numeric_features, ["sex"], seed=0)
+        splits = [cv.load_split(os.path.join(base_dir, name)) for name in ["train", "validation"]]
+    splits = [(np.tile(X, (args.copies, 1)), np.tile(y, args.copies)) for X, y in splits]
+
+    print(f"{'workers':<10}{'seconds':>10}{'slowest fold':>14}{'MSE':>10}")
+    for workers in [1, args.folds]:
+        report = cv.cross_validate(splits, PARAMS, args.num_round, args.folds, workers)
+        print(
+            f"{workers:<10}{report['wall_seconds']:>10.2f}{report['max_fold_seconds']:>14.2f}"
+            f"{report['mse']['value']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
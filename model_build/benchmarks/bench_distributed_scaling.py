@@ -0,0 +1,70 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Measures training throughput of the local multi-process stand-in against the worker count.
+
+Each worker trains on its share of the part files, as the instances of a
+multi-instance training job do; scaling efficiency is the speed-up over one
+worker divided by the number of workers.
+
+Usage:
+    python benchmarks/bench_distributed_scaling.py --rows 1000000 --workers 1 2 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from _scripts import load_script
+from bench_split_formats import make_split
+
+preprocess = load_script("preprocessing/prepare_abalone_data/main.py", "prepare_abalone_data")
+train = load_script("training/xgboost/__main__.py", "train_xgboost")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--num-round", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        train_dir = os.path.join(work_dir, "train")
+        os.makedirs(train_dir)
+        X = make_split(args.rows)
+        parts = max(args.workers)
+        for i in range(parts):
+            writer = preprocess.ParquetSplitWriter(os.path.join(train_dir, f"train-part{i:03d}.parquet"))
+            writer.write(X[i::parts])
+            writer.close()
+
+        print(f"{'workers':<10}{'seconds':>10}{'rows/s':>14}{'efficiency':>12}")
+        baseline = None
+        for workers in args.workers:
+            argv = ["--train", train_dir, "--data-format", "parquet", "--num-round", str(args.num_round)]
+            argv += ["--model-dir", os.path.join(work_dir, f"model-{workers}"), "--workers", str(workers)]
+            start = time.perf_counter()
+            train.main(argv)
+            seconds = time.perf_counter() - start
+            rows_per_sec = args.rows * args.num_round / seconds
+            baseline = baseline or rows_per_sec / workers
+            print(f"{workers:<10}{seconds:>10.2f}{rows_per_sec:>14.0f}{rows_per_sec / baseline / workers:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Compares step times with the splits handed over as CSV or as a binary DMatrix cache.
+
+Runs the preprocessing, a training stand-in (load train + validation, 50
+hist rounds) and the evaluation (load test, predict) on a synthetic input.
+
+Usage:
+    python benchmarks/bench_dmatrix_cache.py --rows 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+from _scripts import load_script
+
+preprocess = load_script("preprocessing/prepare_abalone_data/main.py", "prepare_abalone_data")
+evaluate = load_script("evaluate/evaluate_xgboost/main.py", "evaluate_xgboost")
+
+PARAMS = {"objective": "reg:squarederror", "tree_method": "hist", "max_depth": 5, "eta": 0.2}
+
+
+def make_input(path, rows, seed=0):
+    """Writes a headerless abalone-like CSV."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.random((rows, 7)), columns=preprocess.feature_columns_names[1:])
+    df.insert(0, "sex", rng.choice(["M", "F", "I"], rows))
+    df["rings"] = rng.integers(1, 30, rows)
+    df.to_csv(path, header=False, index=False)
+
+
+def load_split(base_dir, name, dmatrix_cache):
+    if dmatrix_cache:
+        return xgboost.DMatrix(f"{base_dir}/dmatrix/{name}/{name}.buffer")
+    y, dmatrix = evaluate.load_test_data(f"{base_dir}/{name}")
+    dmatrix.set_label(y)
+    return dmatrix
+
+
+def run(input_path, base_dir, dmatrix_cache):
+    """Returns the preprocess, train and evaluate seconds."""
+    for name in preprocess.split_names:
+        os.makedirs(f"{base_dir}/{name}")
+    numeric_features = preprocess.feature_columns_names[1:]
+
+    start = time.perf_counter()
+    preprocess.preprocess_in_memory(
+        [input_path], base_dir, numeric_features, ["sex"], seed=0, dmatrix_cache=dmatrix_cache
+    )
+    preprocess_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dtrain = load_split(base_dir, "train", dmatrix_cache)
+    dvalidation = load_split(base_dir, "validation", dmatrix_cache)
+    booster = xgboost.train(PARAMS, dtrain, 50, evals=[(dvalidation, "validation")], verbose_eval=False)
+    train_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if dmatrix_cache:
+        shards = evaluate.load_dmatrix_cache(f"{base_dir}/dmatrix/test")
+        np.concatenate([booster.predict(shard) for shard in shards])
+    else:
+        _, dtest = evaluate.load_test_data(f"{base_dir}/test")
+        booster.predict(dtest)
+    evaluate_s = time.perf_counter() - start
+    return preprocess_s, train_s, evaluate_s
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_path = os.path.join(work_dir, "input.csv")
+        make_input(input_path, args.rows)
+        results = {
+            "csv": run(input_path, os.path.join(work_dir, "csv"), dmatrix_cache=False),
+            "dmatrix": run(input_path, os.path.join(work_dir, "dmatrix"), dmatrix_cache=True),
+        }
+
+    print(f"{'handover':<10}{'preprocess s':>14}{'train s':>10}{'evaluate s':>12}{'total s':>10}")
+    for handover, (preprocess_s, train_s, evaluate_s) in results.items():
+        total_s = preprocess_s + train_s + evaluate_s
+        print(f"{handover:<10}{preprocess_s:>14.2f}{train_s:>10.2f}{evaluate_s:>12.2f}{total_s:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Compares the peak RSS of the in-memory evaluation with the streaming evaluation as the test split grows.
+
+The abalone test split is replicated into test splits of increasing size;
+each evaluation runs in a fresh process so its peak RSS is its own.
+
+Usage:
+    python benchmarks/bench_evaluation_memory.py --copies 100 400 1600
+"""
+import argparse
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from _scripts import SOURCE_SCRIPTS, load_script
+
+DATASET = SOURCE_SCRIPTS.parent / "ml_pipelines" / "data" / "abalone-dataset.csv"
+
+
+def peak_rss_mb():
+    # VmHWM, unlike ru_maxrss, is not carried over from the parent across fork + exec
+    for line in pathlib.Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024
+
+
+def evaluate(test_dir, model_path, batch_size):
+    """Scores the model on the test split in this process and prints its peak RSS in MB."""
+    evaluation = load_script("evaluate/evaluate_xgboost/main.py", "evaluate_xgboost")
+    model = evaluation.xgboost.Booster(model_file=model_path)
+    if batch_size:
+        batches = evaluation.iter_test_batches(test_dir, batch_size=batch_size)
+        mse = evaluation.evaluate_streaming([model], batches)[0].mse
+    else:
+        y, dtest = evaluation.load_test_data(test_dir)
+        mse = np.mean((y - model.predict(dtest)) ** 2)
+    print(mse, peak_rss_mb())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, nargs="+", default=[100, 400, 1600])
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--evaluate", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.evaluate:
+        evaluate(args.evaluate[0], args.evaluate[1], int(args.evaluate[2]))
+        return
+
+    preprocess = load_script("preprocessing/prepare_abalone_data/main.py", "prepare_abalone_data")
+    with tempfile.TemporaryDirectory() as base_dir:
+        base_dir = pathlib.Path(base_dir)
+        for name in preprocess.split_names:
+            (base_dir / name).mkdir()
+        numeric_features = preprocess.feature_columns_names[1:]
+        preprocess.preprocess_in_memory([str(DATASET)], base_dir, numeric_features, ["sex"], seed=0)
+        import xgboost
+
+        rows = np.loadtxt(base_dir / "train" / "train.csv", delimiter=",", dtype=np.float32)
+        model_path = str(base_dir / "xgboost-model.json")
+        xgboost.train({"max_depth": 5}, xgboost.DMatrix(rows[:, 1:], label=rows[:, 0]), 50).save_model(model_path)
+        test_lines = (base_dir / "test" / "test.csv").read_text()
+
+        print(f"{'test rows':<12}{'in-memory MB':>14}{'streaming MB':>14}")
+        for copies in args.copies:
+            test_dir = base_dir / f"test-{copies}"
+            test_dir.mkdir()
+            (test_dir / "test.csv").write_text(test_lines * copies)
+            peaks = []
+            for batch_size in [0, args.batch_size]:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--evaluate", str(test_dir), model_path, str(batch_size)],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                peaks.append(float(output.split()[-1]))
+            print(f"{test_lines.count(chr(10)) * copies:<12}{peaks[0]:>14.0f}{peaks[1]:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
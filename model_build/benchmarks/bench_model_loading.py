@@ -0,0 +1,93 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Compares loading a large booster from model.tar.gz by extracting and unpickling it with streaming the native model.
+
+Usage:
+    python benchmarks/bench_model_loading.py --num-round 2000 --max-depth 10
+"""
+import argparse
+import os
+import pathlib
+import pickle
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+import xgboost
+
+from _scripts import load_script
+
+evaluation = load_script("evaluate/evaluate_xgboost/main.py", "evaluate_xgboost")
+
+
+def extract_and_unpickle(archive_path):
+    """The previous evaluation path: extract the whole archive, then unpickle xgboost-model."""
+    work_dir = tempfile.mkdtemp(dir=pathlib.Path(archive_path).parent)
+    with tarfile.open(archive_path) as tar:
+        tar.extractall(path=work_dir)
+    with open(os.path.join(work_dir, "xgboost-model"), "rb") as f:
+        return pickle.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-round", type=int, default=2000)
+    parser.add_argument("--max-depth", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(100_000, 10)).astype(np.float32)
+    y = X @ rng.normal(size=10) + rng.normal(size=len(X))
+    params = {"max_depth": args.max_depth, "tree_method": "hist", "eta": 0.1}
+    booster = xgboost.train(params, xgboost.DMatrix(X, label=y), args.num_round)
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        base_dir = pathlib.Path(base_dir)
+        archives = {}
+        for name in ["xgboost-model", "xgboost-model.json", "xgboost-model.ubj"]:
+            model_dir = base_dir / name.replace(".", "-")
+            model_dir.mkdir()
+            if name == "xgboost-model":
+                (model_dir / name).write_bytes(pickle.dumps(booster))
+            else:
+                booster.save_model(model_dir / name)
+            archives[name] = model_dir / "model.tar.gz"
+            with tarfile.open(archives[name], "w:gz") as tar:
+                tar.add(model_dir / name, arcname=name)
+
+        loaders = {
+            "extractall + pickle": ("xgboost-model", extract_and_unpickle),
+            "stream pickle": ("xgboost-model", evaluation.load_model),
+            "stream json": ("xgboost-model.json", evaluation.load_model),
+            "stream ubj": ("xgboost-model.ubj", evaluation.load_model),
+        }
+        print(f"{args.num_round} rounds of depth {args.max_depth}")
+        print(f"{'loader':<22}{'archive MB':>12}{'seconds':>10}")
+        for name, (model_name, loader) in loaders.items():
+            seconds = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                loaded = loader(archives[model_name])
+                seconds.append(time.perf_counter() - start)
+            assert loaded.num_boosted_rounds() == args.num_round
+            print(f"{name:<22}{archives[model_name].stat().st_size / 2**20:>12.1f}{min(seconds):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
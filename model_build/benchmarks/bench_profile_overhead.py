@@ -0,0 +1,82 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Measures what the data profile adds to the preprocessing fit pass.
+
+Compares the plain fit pass, the fit pass with the profile fused into the
+same read loop, and a fit pass followed by a separate profiling pass.
+
+Usage:
+    python benchmarks/bench_profile_overhead.py --rows 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from _scripts import load_script
+
+preprocess = load_script("preprocessing/prepare_abalone_data/main.py", "prepare_abalone_data")
+
+
+def make_input(path, rows, seed=0):
+    """Writes a headerless abalone-like CSV with a few missing values."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.random((rows, 7)), columns=preprocess.feature_columns_names[1:])
+    df = df.mask(rng.random(df.shape) < 0.01)
+    df.insert(0, "sex", rng.choice(["M", "F", "I"], rows))
+    df["rings"] = rng.integers(1, 30, rows)
+    df.to_csv(path, header=False, index=False)
+
+
+def time_fit(sources, chunk_size, profile=None, separate=False):
+    numeric_features = preprocess.feature_columns_names[1:]
+    start = time.perf_counter()
+    preprocess.fit_streaming(sources, numeric_features, ["sex"], chunk_size, None if separate else profile)
+    if separate:
+        for _ in preprocess.read_input_chunks(sources, chunk_size, profile):
+            pass
+    if profile is not None:
+        profile.report()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as input_dir:
+        path = os.path.join(input_dir, "input.csv")
+        make_input(path, args.rows)
+        sources = [path]
+
+        baseline = time_fit(sources, args.chunk_size)
+        fused = time_fit(sources, args.chunk_size, preprocess.DataProfile())
+        separate = time_fit(sources, args.chunk_size, preprocess.DataProfile(), separate=True)
+
+    print(f"{'variant':<20}{'seconds':>10}{'overhead':>10}")
+    for name, seconds in [("fit only", baseline), ("fused profile", fused), ("separate pass", separate)]:
+        print(f"{name:<20}{seconds:>10.2f}{(seconds / baseline - 1):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
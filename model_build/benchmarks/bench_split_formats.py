@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Compares write+read time and size of the preprocessing split formats.
+
+Usage:
+    python benchmarks/bench_split_formats.py --rows 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from _scripts import load_script
+
+preprocess = load_script("preprocessing/prepare_abalone_data/main.py", "prepare_abalone_data")
+evaluate = load_script("evaluate/evaluate_xgboost/main.py", "evaluate_xgboost")
+
+
+def make_split(rows, seed=0):
+    """A transformed abalone-like split: label, 7 scaled numerics, 3 one-hot columns."""
+    rng = np.random.default_rng(seed)
+    X = np.zeros((rows, 11))
+    X[:, 0] = rng.integers(1, 30, rows)
+    X[:, 1:8] = rng.normal(size=(rows, 7))
+    X[np.arange(rows), 8 + rng.integers(0, 3, rows)] = 1.0
+    return X
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    X = make_split(args.rows)
+    print(f"{'format':<10}{'write s':>10}{'read s':>10}{'MB':>10}")
+    for output_format, writer_cls in preprocess.split_writers.items():
+        with tempfile.TemporaryDirectory() as test_dir:
+            start = time.perf_counter()
+            writer = writer_cls(os.path.join(test_dir, f"test.{writer_cls.extension}"))
+            for offset in range(0, len(X), args.chunk_size):
+                writer.write(X[offset : offset + args.chunk_size])
+            writer.close()
+            write_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            y, dmatrix = evaluate.load_test_data(test_dir, output_format)
+            read_s = time.perf_counter() - start
+            assert dmatrix.num_row() == len(X)
+
+            size_mb = os.path.getsize(writer.path) / 2**20
+        print(f"{output_format:<10}{write_s:>10.2f}{read_s:>10.2f}{size_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
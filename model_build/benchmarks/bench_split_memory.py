@@ -0,0 +1,91 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Compares peak RSS of the shuffle-and-split step before and after index-based splits.
+
+Each variant runs in a fresh subprocess and reports its peak RSS above the
+footprint of the transformed matrix it starts from.
+
+Usage:
+    python benchmarks/bench_split_memory.py --rows 2000000
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from _scripts import load_script
+
+preprocess = load_script("preprocessing/prepare_abalone_data/main.py", "prepare_abalone_data")
+
+
+def concatenate_and_shuffle(y, X_pre, writers):
+    """The previous implementation: one concatenated, shuffled copy, split into views."""
+    X = np.concatenate((y.reshape(len(y), 1), X_pre), axis=1)
+    np.random.shuffle(X)
+    for name, rows in zip(preprocess.split_names, np.split(X, [int(0.7 * len(X)), int(0.85 * len(X))])):
+        writers[name].write(rows)
+
+
+def permutation_index(y, X_pre, writers):
+    for name, indices in zip(preprocess.split_names, preprocess.split_indices(len(y), seed=0)):
+        preprocess.write_split_rows(writers[name], y, X_pre, indices)
+
+
+variants = {"concatenate": concatenate_and_shuffle, "permutation": permutation_index}
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(variant, rows, output_format):
+    rng = np.random.default_rng(0)
+    y = rng.integers(1, 30, rows).astype(np.float64)
+    X_pre = rng.normal(size=(rows, 10))
+    baseline = peak_rss_mb()
+    with tempfile.TemporaryDirectory() as base_dir:
+        for name in preprocess.split_names:
+            preprocess.pathlib.Path(base_dir, name).mkdir()
+        writers = preprocess.open_split_writers(base_dir, output_format)
+        variants[variant](y, X_pre, writers)
+        preprocess.close_split_writers(writers)
+    print(f"{variant:<14}{(X_pre.nbytes + y.nbytes) / 2**20:>12.0f}{peak_rss_mb() - baseline:>16.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--output-format", default="parquet", choices=sorted(preprocess.split_writers))
+    parser.add_argument("--variant", choices=sorted(variants), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.rows, args.output_format)
+        return
+
+    print(f"{'variant':<14}{'input MB':>12}{'extra peak MB':>16}")
+    for variant in variants:
+        command = [sys.executable, __file__, "--variant", variant]
+        subprocess.run(command + ["--rows", str(args.rows), "--output-format", args.output_format], check=True)
+
+
+if __name__ == "__main__":
+    main()
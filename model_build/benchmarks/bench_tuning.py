@@ -0,0 +1,70 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Compares successive halving with training every configuration for the full budget.
+
+Both searches try the same sampled configurations on the abalone splits; the
+full-budget search is successive halving with a single rung.
+
+Usage:
+    python benchmarks/bench_tuning.py --num-configs 27 --workers 4
+"""
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+
+from _scripts import SOURCE_SCRIPTS, load_script
+
+preprocess = load_script("preprocessing/prepare_abalone_data/main.py", "prepare_abalone_data")
+tune = load_script("tuning/tune_xgboost/main.py", "tune_xgboost")
+sys.modules["tune_xgboost"] = tune  # trials are pickled by reference to the pool workers
+
+DATASET = SOURCE_SCRIPTS.parent / "ml_pipelines" / "data" / "abalone-dataset.csv"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-configs", type=int, default=27)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=270)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        for name in preprocess.split_names:
+            pathlib.Path(base_dir, name).mkdir()
+        numeric_features = preprocess.feature_columns_names[1:]
+        preprocess.preprocess_in_memory([str(DATASET)], base_dir, numeric_features, ["sex"], seed=0)
+        tune.set_dataset(
+            tune.load_split(os.path.join(base_dir, "train")), tune.load_split(os.path.join(base_dir, "validation"))
+        )
+
+    print(f"{'search':<22}{'seconds':>10}{'trials/h':>10}{'rounds':>10}{'best MSE':>10}")
+    for name, min_rounds in [("successive halving", args.min_rounds), ("full budget", args.max_rounds)]:
+        report = tune.search(args.num_configs, min_rounds, args.max_rounds, workers=args.workers, seed=0)
+        print(
+            f"{name:<22}{report['wall_seconds']:>10.1f}{report['trials_per_hour']:>10.0f}"
+            f"{report['boosting_rounds']:>10}{report['best']['mse']:>10.3f}"
+        )
+        for point in report["best_mse_vs_time"]:
+            print(f"    {point['seconds']:>8.1f}s  best MSE {point['mse']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
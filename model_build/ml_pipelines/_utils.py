@@ -45,6 +45,20 @@
 from __future__ import absolute_import
 
 import ast
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import re
+import shutil
+import time
+
+DEFAULT_DEFINITION_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ml_pipelines", "definitions")
+
+# how run_pipeline records the fingerprint of an execution in its description
+FINGERPRINT_DESCRIPTION = "Definition and input fingerprint: {}"
+FINGERPRINT_PATTERN = re.compile(r"Definition and input fingerprint: ([0-9a-f]{64})")
 
 
 def get_pipeline_driver(module_name, passed_args=None):
@@ -76,6 +90,116 @@ def convert_struct(str_struct=None):
     return ast.literal_eval(str_struct) if str_struct else {}
 
 
+def hash_source(*paths):
+    """Gets the SHA256 hash of the files under code paths, ignoring Python bytecode
+
+    The hash covers the relative name and the content of every file, so it changes
+    when a script is edited, added, renamed or removed.
+
+    Args:
+        paths: files or directories
+
+    Returns:
+        hex digest of the files
+    """
+    sha256 = hashlib.sha256()
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name)
+                for root, dirs, names in os.walk(path)
+                if "__pycache__" not in root.split(os.sep)
+                for name in names
+                if not name.endswith(".pyc")
+            )
+        for file in files:
+            sha256.update(os.path.relpath(file, path).encode() + b"\0")
+            with open(file, "rb") as f:
+                sha256.update(hashlib.sha256(f.read()).digest())
+    return sha256.hexdigest()
+
+
+class PipelineDefinitionCache:
+    """On-disk cache of generated pipeline definitions, so an unchanged pipeline is not rebuilt.
+
+    A definition is keyed by the source of the pipeline module's top-level package,
+    the code directories its steps upload, the installed SageMaker SDK version, the
+    keyword arguments and what the definition looks up in AWS when it is built (the
+    `get_pipeline_lookups(**kwargs)` the module's package exports, if any), so a
+    newly published image is never masked by the cache. Computing the key imports
+    neither the module nor the SDK. Entries expire after `ttl_seconds`; a
+    `ttl_seconds` of 0 disables the cache.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_DEFINITION_CACHE_DIR, ttl_seconds=3600, code_dirs=("source_scripts",)):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.code_dirs = code_dirs
+
+    def key(self, module_name, passed_args=None):
+        """Gets the key of the definition `get_pipeline_driver(module_name, passed_args)` generates."""
+        spec = importlib.util.find_spec(module_name.partition(".")[0])
+        paths = list(spec.submodule_search_locations or [spec.origin])
+        paths += [code_dir for code_dir in self.code_dirs if os.path.isdir(code_dir)]
+        try:
+            sdk_version = importlib.metadata.version("sagemaker")
+        except importlib.metadata.PackageNotFoundError:
+            sdk_version = None
+        kwargs = convert_struct(passed_args)
+        package = importlib.import_module(module_name.rpartition(".")[0]) if "." in module_name else None
+        lookups = package.get_pipeline_lookups(**kwargs) if hasattr(package, "get_pipeline_lookups") else None
+        arguments = [module_name, kwargs, sdk_version, lookups, hash_source(*paths)]
+        return hashlib.sha256(json.dumps(arguments, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key):
+        """Returns (pipeline name, definition JSON) cached for `key`, or None if there is no live entry."""
+        if not self.ttl_seconds:
+            return None
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return None
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry["name"], entry["definition"]
+
+    def put(self, key, name, definition):
+        if not self.ttl_seconds:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+            json.dump({"name": name, "definition": definition}, f)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+
+def get_cached_definition(module_name, passed_args=None, cache=None):
+    """Gets the definition JSON of a pipeline, from `cache` when it holds one for the current source.
+
+    The pipeline module, and with it the SageMaker SDK, is only imported on a cache miss.
+
+    Args:
+        module_name: The module name of your pipeline.
+        passed_args: Optional passed arguments that your pipeline may be templated by.
+        cache: a PipelineDefinitionCache, or None to always generate the definition
+
+    Returns:
+        (pipeline name, definition JSON, the pipeline or None if the definition came from the cache)
+    """
+    key = cache.key(module_name, passed_args) if cache is not None else None
+    entry = cache.get(key) if cache is not None else None
+    if entry is not None:
+        return (*entry, None)
+    pipeline = get_pipeline_driver(module_name, passed_args)
+    definition = pipeline.definition()
+    if cache is not None:
+        cache.put(key, pipeline.name, definition)
+    return pipeline.name, definition, pipeline
+
+
 def get_pipeline_custom_tags(module_name, args, tags):
     """Gets the custom tags for pipeline
 
@@ -88,4 +212,199 @@ def get_pipeline_custom_tags(module_name, args, tags):
         return _imports.get_pipeline_custom_tags(tags, kwargs["region"], kwargs["sagemaker_project_arn"])
     except Exception as e:
         print(f"Error getting project tags: {e}")
-    return tags
\ No newline at end of file
+    return tags
+
+
+def fingerprint_s3_input(s3_client, s3_uri):
+    """Fingerprints the objects under an S3 URI (a single key or a prefix)
+
+    Hashes the key, ETag and size of every non-empty object, in key order, the
+    way the preprocessing script fingerprints its input.
+
+    Args:
+        s3_client: boto3 client for s3
+        s3_uri: S3 URI of the input object or prefix
+
+    Returns:
+        hex digest of the listing
+    """
+    bucket, _, key = s3_uri[len("s3://") :].partition("/")
+    # a URI naming an object is that object alone; any other URI is a prefix ending in "/"
+    prefix = key if not key or key.endswith("/") else f"{key}/"
+    objects = []
+    for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=key):
+        contents = page.get("Contents", [])
+        if not key.endswith("/") and any(obj["Key"] == key for obj in contents):
+            objects = [obj for obj in contents if obj["Key"] == key and obj["Size"] > 0]
+            break
+        objects += [
+            obj
+            for obj in contents
+            if obj["Key"].startswith(prefix) and not obj["Key"].endswith("/") and obj["Size"] > 0
+        ]
+    digest = hashlib.sha256()
+    for obj in sorted(objects, key=lambda obj: obj["Key"]):
+        digest.update(f"{obj['Key']}:{obj['ETag']}:{obj['Size']}\n".encode())
+    return digest.hexdigest()
+
+
+def fingerprint_local_input(path):
+    """Fingerprints the files of a local input (a file or a directory), in name order
+
+    Args:
+        path: local path of the input file or directory
+
+    Returns:
+        hex digest of the files' contents
+    """
+    paths = [path]
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    digest = hashlib.sha256()
+    for file in paths:
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def get_execution_fingerprint(definition, parameters, input_fingerprint=None):
+    """Fingerprints what an execution would run: the definition, its parameter values and its input data
+
+    Args:
+        definition: the pipeline definition JSON
+        parameters: the parameter values the execution is started with
+        input_fingerprint: fingerprint of the input data, e.g. from fingerprint_s3_input
+
+    Returns:
+        hex digest of the execution
+    """
+    execution = {"definition": json.loads(definition), "parameters": parameters, "input": input_fingerprint}
+    return hashlib.sha256(json.dumps(execution, sort_keys=True).encode()).hexdigest()
+
+
+def get_execution_parameters(definition, s3_client):
+    """Gets the parameters to start an execution of a pipeline definition with, and its fingerprint
+
+    The objects under the default InputDataUrl are fingerprinted, and the fingerprint
+    is passed as InputDataFingerprint when the pipeline has that parameter, so the
+    cached preprocessing results are keyed by the contents of the input, not just
+    its URI. The definition should be current, with the lookups it makes when built:
+    a change of them must change the fingerprint.
+
+    Args:
+        definition: the pipeline definition JSON
+        s3_client: boto3 client for s3
+
+    Returns:
+        (parameter values, fingerprint of the input data or None, fingerprint of the execution)
+    """
+    defaults = {parameter["Name"]: parameter.get("DefaultValue") for parameter in json.loads(definition)["Parameters"]}
+    parameters = {}
+    input_fingerprint = None
+    if "InputDataUrl" in defaults:
+        input_fingerprint = fingerprint_s3_input(s3_client, defaults["InputDataUrl"])
+    if "InputDataFingerprint" in defaults:
+        parameters["InputDataFingerprint"] = input_fingerprint
+    return parameters, input_fingerprint, get_execution_fingerprint(definition, parameters, input_fingerprint)
+
+
+def get_last_execution_fingerprint(sagemaker_client, pipeline_name):
+    """Gets the fingerprint recorded in the description of the latest successful execution of a pipeline
+
+    Args:
+        sagemaker_client: boto3 client for sagemaker
+        pipeline_name: name of the pipeline
+
+    Returns:
+        (fingerprint, execution ARN), with None for a pipeline that does not exist or has no
+        successful execution, and a None fingerprint for an execution that recorded none
+    """
+    try:
+        paginator = sagemaker_client.get_paginator("list_pipeline_executions")
+        pages = paginator.paginate(PipelineName=pipeline_name, SortBy="CreationTime", SortOrder="Descending")
+        for page in pages:
+            for summary in page["PipelineExecutionSummaries"]:
+                if summary["PipelineExecutionStatus"] == "Succeeded":
+                    match = FINGERPRINT_PATTERN.search(summary.get("PipelineExecutionDescription", ""))
+                    return (match.group(1) if match else None), summary["PipelineExecutionArn"]
+    except sagemaker_client.exceptions.ResourceNotFound:
+        pass
+    return None, None
+
+
+def get_cache_hit_report(step_summaries):
+    """Counts the steps of an execution whose results were reused from an earlier one
+
+    Args:
+        step_summaries: the PipelineExecutionSteps of an execution, as returned by list_steps()
+
+    Returns:
+        dict of the cacheable steps, the cache hits among them and the hit rate
+    """
+    # condition, fail and register steps are never cached
+    steps = [
+        step["StepName"]
+        for step in step_summaries
+        if "CacheHitResult" in step or {"ProcessingJob", "TrainingJob"} & set(step.get("Metadata", {}))
+    ]
+    hits = [step["StepName"] for step in step_summaries if "CacheHitResult" in step]
+    return {
+        "steps": len(steps),
+        "cache_hits": len(hits),
+        "hit_rate": len(hits) / len(steps) if steps else 0.0,
+        "cached_steps": hits,
+    }
+
+
+class LocalStepCache:
+    """Content-addressed cache of the outputs of locally run pipeline steps.
+
+    A step is keyed by its arguments in the pipeline definition, whose code paths
+    are named by the hash of the code, and by the keys of the steps it reads from,
+    so editing a script invalidates its step and every step downstream of it.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = []
+        self.misses = []
+
+    @staticmethod
+    def key(step_arguments, upstream_keys=()):
+        """Gets the key of a step from its (resolved) arguments and its upstream steps' keys."""
+        digest = hashlib.sha256(json.dumps(step_arguments, sort_keys=True, default=str).encode())
+        for upstream_key in sorted(upstream_keys):
+            digest.update(upstream_key.encode())
+        return digest.hexdigest()
+
+    def get(self, step_name, key):
+        """Returns the directory holding the cached outputs of `key`, or None on a miss."""
+        path = os.path.join(self.cache_dir, key)
+        if os.path.isdir(path):
+            self.hits.append(step_name)
+            return path
+        self.misses.append(step_name)
+        return None
+
+    def put(self, key, outputs_dir):
+        """Stores a copy of `outputs_dir` as the outputs of `key`, and returns its directory."""
+        path = os.path.join(self.cache_dir, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copytree(outputs_dir, tmp_path)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # stored concurrently by another run with the same key
+            shutil.rmtree(tmp_path)
+        return path
+
+    def report(self):
+        """Gets the number of steps looked up, the hits among them and the hit rate."""
+        steps = len(self.hits) + len(self.misses)
+        return {
+            "steps": steps,
+            "cache_hits": len(self.hits),
+            "hit_rate": len(self.hits) / steps if steps else 0.0,
+            "cached_steps": list(self.hits),
+        }
@@ -22,7 +22,7 @@ from __future__ import absolute_import
 import argparse
 import sys
 
-from ml_pipelines._utils import get_pipeline_driver
+from ml_pipelines._utils import PipelineDefinitionCache, get_cached_definition
 
 
 def main():  # pragma: no cover
@@ -54,6 +54,14 @@ def main():  # pragma: no cover
         default=None,
         help="Dict string of keyword arguments for the pipeline generation (if supported)",
     )
+    parser.add_argument(
+        "-cache-ttl",
+        "--cache-ttl",
+        dest="cache_ttl",
+        type=int,
+        default=3600,
+        help="Seconds a generated definition is reused for while the pipeline source is unchanged (0 disables).",
+    )
     args = parser.parse_args()
 
     if args.module_name is None:
@@ -61,8 +69,8 @@ def main():  # pragma: no cover
         sys.exit(2)
 
     try:
-        pipeline = get_pipeline_driver(args.module_name, args.kwargs)
-        content = pipeline.definition()
+        cache = PipelineDefinitionCache(ttl_seconds=args.cache_ttl)
+        _, content, _ = get_cached_definition(args.module_name, args.kwargs, cache)
         if args.file_name:
             with open(args.file_name, "w") as f:
                 f.write(content)
@@ -23,7 +23,18 @@ import json
 import sys
 
 #from ml_pipelines._utils import get_pipeline_driver, convert_struct, get_pipeline_custom_tags
-from _utils import get_pipeline_driver, convert_struct, get_pipeline_custom_tags
+from _utils import (
+    FINGERPRINT_DESCRIPTION,
+    PipelineDefinitionCache,
+    get_cached_definition,
+    get_pipeline_driver,
+    convert_struct,
+    get_pipeline_custom_tags,
+    get_cache_hit_report,
+    get_execution_fingerprint,
+    get_execution_parameters,
+    get_last_execution_fingerprint,
+)
 
 
 def main():  # pragma: no cover
@@ -69,6 +80,22 @@ def main():  # pragma: no cover
         default=None,
         help="""List of dict strings of '[{"Key": "string", "Value": "string"}, ..]'""",
     )
+    parser.add_argument(
+        "-cache-ttl",
+        "--cache-ttl",
+        dest="cache_ttl",
+        type=int,
+        default=3600,
+        help="Seconds a generated definition is reused for while the pipeline source is unchanged (0 disables).",
+    )
+    parser.add_argument(
+        "-force",
+        "--force",
+        dest="force",
+        action="store_true",
+        help="Upsert and start the pipeline even if its definition and input data are unchanged since the "
+        "last successful execution.",
+    )
     args = parser.parse_args()
 
     if args.module_name is None or args.role_arn is None:
@@ -77,11 +104,33 @@ def main():  # pragma: no cover
     tags = convert_struct(args.tags)
 
     try:
-        pipeline = get_pipeline_driver(args.module_name, args.kwargs)
+        import boto3
+
+        # the cache key holds the lookups the definition makes when built, so a cached
+        # definition is current and the fingerprint below sees a new image at once
+        cache = PipelineDefinitionCache(ttl_seconds=args.cache_ttl)
+        pipeline_name, definition, pipeline = get_cached_definition(args.module_name, args.kwargs, cache)
+        boto_session = boto3.Session(region_name=convert_struct(args.kwargs).get("region"))
+
+        parameters, input_fingerprint, fingerprint = get_execution_parameters(definition, boto_session.client("s3"))
+        print(f"###### Input data fingerprint: {input_fingerprint}")
+        if not args.force:
+            last_fingerprint, last_execution = get_last_execution_fingerprint(
+                boto_session.client("sagemaker"), pipeline_name
+            )
+            if fingerprint == last_fingerprint:
+                print(f"###### {pipeline_name} and its input data are unchanged since {last_execution}.")
+                print("Not upserting or starting it; pass --force to run it anyway.")
+                return
+
         print("###### Creating/updating a SageMaker Pipeline with the following definition:")
-        parsed = json.loads(pipeline.definition())
-        print(json.dumps(parsed, indent=2, sort_keys=True))
+        print(json.dumps(json.loads(definition), indent=2, sort_keys=True))
 
+        if pipeline is None:
+            # the definition came from the cache; upserting needs the pipeline object, and the
+            # execution records the fingerprint of the definition that is upserted
+            pipeline = get_pipeline_driver(args.module_name, args.kwargs)
+            fingerprint = get_execution_fingerprint(pipeline.definition(), parameters, input_fingerprint)
         all_tags = get_pipeline_custom_tags(args.module_name, args.kwargs, tags)
 
         upsert_response = pipeline.upsert(
@@ -89,7 +138,10 @@ def main():  # pragma: no cover
         print("\n###### Created/Updated SageMaker Pipeline: Response received:")
         print(upsert_response)
 
-        execution = pipeline.start()
+        # recorded so the next run can tell whether anything changed
+        execution = pipeline.start(
+            parameters=parameters, execution_description=FINGERPRINT_DESCRIPTION.format(fingerprint)
+        )
         print(f"\n###### Execution started with PipelineExecutionArn: {execution.arn}")
 
         #         TODO removiong wait time as training can take some time
@@ -97,7 +149,10 @@ def main():  # pragma: no cover
         execution.wait()
         print("\n#####Execution completed. Execution step details:")
 
-        print(execution.list_steps())
+        steps = execution.list_steps()
+        print(steps)
+        print("\n###### Step cache hits:")
+        print(json.dumps(get_cache_hit_report(steps), indent=2))
     except Exception as e:  # pylint: disable=W0703
         print(f"Exception: {e}")
         sys.exit(1)
@@ -0,0 +1,524 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""A CLI to run pipelines locally, each step's script in a subprocess."""
+from __future__ import absolute_import
+
+import argparse
+import datetime
+import json
+import logging
+import operator
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import time
+import uuid
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from _utils import LocalStepCache, convert_struct, fingerprint_local_input, get_pipeline_driver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ml_pipelines", "local")
+
+# tokens of a property or JSON path such as ProcessingOutputConfig.Outputs['train'].S3Output.S3Uri
+PATH_TOKEN = re.compile(r"\.?([^.\[\]]+)|\['([^']*)'\]|\[(\d+)\]")
+
+COMPARISONS = {
+    "Equals": operator.eq,
+    "GreaterThan": operator.gt,
+    "GreaterThanOrEqualTo": operator.ge,
+    "LessThan": operator.lt,
+    "LessThanOrEqualTo": operator.le,
+}
+
+
+def get_path(value, path):
+    """Looks up a property or JSON path, e.g. `a.b['c'][0]`, in nested dicts and lists."""
+    for match in PATH_TOKEN.finditer(path):
+        name, key, index = match.groups()
+        if index is not None:
+            value = list(value.values())[int(index)] if isinstance(value, dict) else value[int(index)]
+        else:
+            value = value[name if key is None else key]
+    return value
+
+
+def get_references(value, scope):
+    """Yields the names referenced as `{"Get": "<scope>.<name>..."}` anywhere in a definition value."""
+    if isinstance(value, dict):
+        if isinstance(value.get("Get"), str) and value["Get"].startswith(f"{scope}."):
+            yield re.split(r"[.\[]", value["Get"][len(scope) + 1 :])[0]
+        for item in value.values():
+            yield from get_references(item, scope)
+    elif isinstance(value, list):
+        for item in value:
+            yield from get_references(item, scope)
+
+
+def evaluate_condition(condition, resolve):
+    """Evaluates a condition of a ConditionStep, resolving its operands with `resolve`."""
+    kind = condition["Type"]
+    if kind == "Not":
+        return not evaluate_condition(condition["Expression"], resolve)
+    if kind == "Or":
+        return any(evaluate_condition(other, resolve) for other in condition["Conditions"])
+    if kind == "In":
+        return resolve(condition["QueryValue"]) in [resolve(value) for value in condition["Values"]]
+    return COMPARISONS[kind](resolve(condition["LeftValue"]), resolve(condition["RightValue"]))
+
+
+def get_step_code(steps):
+    """Maps the processing and training steps to their local script and the directory it runs from."""
+    code = {}
+    for step in steps:
+        if isinstance(getattr(step, "code", None), str):
+            code[step.name] = (os.path.abspath(step.code), os.getcwd())
+        estimator = getattr(step, "estimator", None)
+        if estimator is not None and getattr(step, "name", None):
+            source_dir = os.path.abspath(estimator.source_dir or ".")
+            code[step.name] = (os.path.join(source_dir, estimator.entry_point), source_dir)
+        code.update(get_step_code([*getattr(step, "if_steps", []), *getattr(step, "else_steps", [])]))
+    return code
+
+
+def run_job(job):
+    """Runs the script of a processing or training job in a subprocess.
+
+    The inputs are symlinked to their container paths under the job directory, and
+    after a successful run the outputs are moved to `{dir}/outputs/<output name>`,
+    a training job's model directory archived as model.tar.gz.
+
+    Returns:
+        dict of the run time in seconds, with a `failure` reason if the job failed
+    """
+    for source, destination in job["inputs"]:
+        if not os.path.exists(source):
+            return {"seconds": 0.0, "failure": f"No local copy of the input {source}"}
+        if os.path.isdir(source):
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.symlink(os.path.abspath(source), destination)
+        else:
+            os.makedirs(destination, exist_ok=True)
+            os.symlink(os.path.abspath(source), os.path.join(destination, os.path.basename(source)))
+    os.makedirs(os.path.join(job["dir"], "outputs"), exist_ok=True)
+    for directory in job["outputs"].values():
+        os.makedirs(directory, exist_ok=True)
+    if job["model_dir"]:
+        os.makedirs(job["model_dir"], exist_ok=True)
+
+    start = time.perf_counter()
+    with open(job["log"], "w") as log:
+        try:
+            returncode = subprocess.run(
+                job["command"],
+                cwd=job["cwd"],
+                env={**os.environ, **job["environment"]},
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                timeout=job["timeout"],
+            ).returncode
+        except subprocess.TimeoutExpired:
+            return {"seconds": time.perf_counter() - start, "failure": f"Stopped after {job['timeout']} seconds"}
+    seconds = time.perf_counter() - start
+    if returncode != 0:
+        return {"seconds": seconds, "failure": f"Exited with code {returncode}, see {job['log']}"}
+
+    if job["model_dir"]:
+        with tarfile.open(os.path.join(job["outputs"]["model"], "model.tar.gz"), "w:gz") as archive:
+            for name in sorted(os.listdir(job["model_dir"])):
+                archive.add(os.path.join(job["model_dir"], name), arcname=name)
+    for name, directory in job["outputs"].items():
+        shutil.move(directory, os.path.join(job["dir"], "outputs", name))
+    return {"seconds": seconds}
+
+
+class LocalPipelineRunner:
+    """Runs a pipeline definition on this machine, the way the service runs it.
+
+    Processing and training steps run their scripts as subprocesses on a process
+    pool, each as soon as the steps it depends on have succeeded. S3 URIs are mapped
+    to `{local_dir}/s3/<bucket>/<key>`, and the container paths under /opt/ml to a
+    directory per job. Conditions, Std:Join and Std:JsonGet are evaluated against the
+    steps' outputs, a Fail step fails the execution, and the steps of the branch a
+    condition did not take are not executed. Other steps (e.g. RegisterModel) are
+    skipped.
+
+    Steps with caching enabled are looked up in `cache`, a LocalStepCache, by their
+    definition, the parameters they use and the keys of the steps they depend on.
+    """
+
+    def __init__(self, definition, code, local_dir=DEFAULT_LOCAL_DIR, parameters=None, workers=None, cache=None):
+        self.code = code
+        self.local_dir = os.path.abspath(local_dir)
+        self.workers = workers
+        self.cache = cache
+        self.parameters = {parameter["Name"]: parameter.get("DefaultValue") for parameter in definition["Parameters"]}
+        self.parameters.update(parameters or {})
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.execution_id = f"local-{now:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.execution_variables = {
+            "PipelineExecutionId": self.execution_id,
+            "PipelineExecutionArn": f"local:{self.execution_id}",
+            "PipelineName": definition.get("PipelineName", "local"),
+            "StartDateTime": now.isoformat(),
+            "CurrentDateTime": now.isoformat(),
+        }
+        self.steps = {}
+        self.dependencies = {}
+        # steps of a condition's branch -> (condition step, outcome the branch runs on)
+        self.branches = {}
+        self._add_steps(definition["Steps"])
+        for name, dependencies in self.dependencies.items():
+            if not dependencies <= set(self.steps):
+                raise ValueError(f"{name} depends on unknown steps {sorted(dependencies - set(self.steps))}")
+        self.properties = {}
+        self.property_files = {}
+        self.keys = {}
+        self.jobs = {}
+        self.results = {}
+
+    @classmethod
+    def from_pipeline(cls, pipeline, **kwargs):
+        """Gets a runner of a Pipeline's definition, with the steps' scripts taken from the local tree."""
+        definition = json.loads(pipeline.definition())
+        definition.setdefault("PipelineName", pipeline.name)
+        return cls(definition, get_step_code(pipeline.steps), **kwargs)
+
+    def _add_steps(self, steps, condition=None, outcome=None):
+        for step in steps:
+            name = step["Name"]
+            references = step["Arguments"]["Conditions"] if step["Type"] == "Condition" else step.get("Arguments")
+            self.steps[name] = step
+            self.dependencies[name] = set(step.get("DependsOn", [])) | set(get_references(references, "Steps"))
+            if condition is not None:
+                self.dependencies[name].add(condition)
+                self.branches[name] = (condition, outcome)
+            if step["Type"] == "Condition":
+                self._add_steps(step["Arguments"]["IfSteps"], name, True)
+                self._add_steps(step["Arguments"]["ElseSteps"], name, False)
+
+    def local_path(self, uri):
+        """Maps an S3 URI to its path under the local directory; other paths are returned as they are."""
+        if isinstance(uri, str) and uri.startswith("s3://"):
+            return os.path.join(self.local_dir, "s3", uri[len("s3://") :].rstrip("/"))
+        return uri
+
+    def _map_path(self, value, job_dir):
+        # S3 URIs and container paths in job arguments and hyperparameters
+        value = str(value)
+        if value.startswith("/opt/ml/"):
+            return os.path.join(job_dir, value[len("/opt/ml/") :])
+        return self.local_path(value)
+
+    def resolve(self, value):
+        """Evaluates the parameters, properties and functions in a definition value."""
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if "Get" in value:
+            scope, _, path = value["Get"].partition(".")
+            if scope == "Parameters":
+                return self.parameters[path]
+            if scope == "Execution":
+                return self.execution_variables[path]
+            name, _, path = path.partition(".")
+            return get_path(self.properties[name], path)
+        if "Std:Join" in value:
+            values = [self.resolve(item) for item in value["Std:Join"]["Values"]]
+            strings = [json.dumps(item) if isinstance(item, bool) else str(item) for item in values]
+            return value["Std:Join"]["On"].join(strings)
+        if "Std:JsonGet" in value:
+            json_get = value["Std:JsonGet"]
+            name, _, file_name = json_get["PropertyFile"]["Get"][len("Steps.") :].partition(".PropertyFiles.")
+            with open(self.property_files[name][file_name]) as f:
+                return get_path(json.load(f), json_get["Path"])
+        return {key: self.resolve(item) for key, item in value.items()}
+
+    def _get_key(self, name):
+        step = self.steps[name]
+        parameters = {parameter: self.parameters[parameter] for parameter in get_references(step, "Parameters")}
+        upstream_keys = [self.keys[dependency] for dependency in self.dependencies[name]]
+        return LocalStepCache.key({"Step": step, "Parameters": parameters}, upstream_keys)
+
+    def _prepare_processing(self, name, arguments):
+        job_dir = os.path.join(self.local_dir, "jobs", self.execution_id, name)
+        script, cwd = self.code[name]
+        outputs = arguments.get("ProcessingOutputConfig", {}).get("Outputs", [])
+        container_arguments = arguments["AppSpecification"].get("ContainerArguments", [])
+        job = {
+            "dir": job_dir,
+            "command": [sys.executable, script] + [self._map_path(value, job_dir) for value in container_arguments],
+            "cwd": cwd,
+            "environment": {
+                "PROCESSING_DIR": os.path.join(job_dir, "processing"),
+                **arguments.get("Environment", {}),
+            },
+            "inputs": [
+                (self.local_path(item["S3Input"]["S3Uri"]), self._map_path(item["S3Input"]["LocalPath"], job_dir))
+                for item in arguments.get("ProcessingInputs", [])
+                if item["InputName"] != "code"
+            ],
+            "outputs": {item["OutputName"]: self._map_path(item["S3Output"]["LocalPath"], job_dir) for item in outputs},
+            "model_dir": None,
+            "timeout": arguments.get("StoppingCondition", {}).get("MaxRuntimeInSeconds"),
+            "log": os.path.join(job_dir, "job.log"),
+            "destinations": {item["OutputName"]: item["S3Output"]["S3Uri"] for item in outputs},
+        }
+        job["properties"] = {
+            "ProcessingJobName": f"{name}-{self.execution_id}",
+            "ProcessingJobStatus": "Completed",
+            "ProcessingOutputConfig": {"Outputs": {item["OutputName"]: item for item in outputs}},
+        }
+        return job
+
+    def _prepare_training(self, name, arguments):
+        job_dir = os.path.join(self.local_dir, "jobs", self.execution_id, name)
+        script, cwd = self.code[name]
+        command = [sys.executable, script]
+        for key, value in arguments.get("HyperParameters", {}).items():
+            if key.startswith("sagemaker_"):
+                continue
+            try:
+                # the SDK JSON-encodes the hyperparameter values
+                value = json.loads(value)
+            except ValueError:
+                pass
+            command += [f"--{key}", self._map_path(value, job_dir)]
+        channels = {
+            item["ChannelName"]: item["DataSource"]["S3DataSource"]["S3Uri"] for item in arguments["InputDataConfig"]
+        }
+        job_name = f"{name}-{self.execution_id}"
+        output_uri = f"{arguments['OutputDataConfig']['S3OutputPath'].rstrip('/')}/{job_name}/output"
+        job = {
+            "dir": job_dir,
+            "command": command,
+            "cwd": cwd,
+            "environment": {
+                "SM_MODEL_DIR": os.path.join(job_dir, "model"),
+                "SM_OUTPUT_DATA_DIR": os.path.join(job_dir, "output", "data"),
+                "SM_CHANNELS": json.dumps(sorted(channels)),
+                "SM_HOSTS": json.dumps(["algo-1"]),
+                "SM_CURRENT_HOST": "algo-1",
+                **{
+                    f"SM_CHANNEL_{channel.upper().replace('-', '_')}": os.path.join(job_dir, "input", "data", channel)
+                    for channel in channels
+                },
+                **arguments.get("Environment", {}),
+            },
+            "inputs": [
+                (self.local_path(uri), os.path.join(job_dir, "input", "data", channel))
+                for channel, uri in channels.items()
+            ],
+            "outputs": {"model": os.path.join(job_dir, "output", "model")},
+            "model_dir": os.path.join(job_dir, "model"),
+            "timeout": arguments.get("StoppingCondition", {}).get("MaxRuntimeInSeconds"),
+            "log": os.path.join(job_dir, "job.log"),
+            "destinations": {"model": output_uri},
+        }
+        job["properties"] = {
+            "TrainingJobName": job_name,
+            "TrainingJobStatus": "Completed",
+            "ModelArtifacts": {"S3ModelArtifacts": f"{output_uri}/model.tar.gz"},
+        }
+        return job
+
+    def _start(self, name, executor):
+        # runs a condition, fail or skipped step in place; returns the future of a job
+        step = self.steps[name]
+        self.keys[name] = self._get_key(name)
+        try:
+            if step["Type"] == "Condition":
+                conditions = step["Arguments"]["Conditions"]
+                outcome = all(evaluate_condition(condition, self.resolve) for condition in conditions)
+                self.results[name] = {"Status": "Succeeded", "Outcome": outcome}
+            elif step["Type"] == "Fail":
+                reason = self.resolve(step["Arguments"].get("ErrorMessage", ""))
+                self.results[name] = {"Status": "Failed", "FailureReason": reason}
+            elif step["Type"] in ("Processing", "Training"):
+                arguments = self.resolve(step["Arguments"])
+                prepare = self._prepare_processing if step["Type"] == "Processing" else self._prepare_training
+                self.jobs[name] = prepare(name, arguments)
+                cached = None
+                if self.cache is not None and step.get("CacheConfig", {}).get("Enabled"):
+                    cached = self.cache.get(name, self.keys[name])
+                if cached is None:
+                    logger.info(f"Starting {name}")
+                    return executor.submit(run_job, self.jobs[name])
+                self._publish(name, cached)
+                self.results[name] = {"Status": "Succeeded", "CacheHit": True}
+            else:
+                logger.info(f"Skipping {name}: {step['Type']} steps are not run locally")
+                self.results[name] = {"Status": "Skipped"}
+        except Exception as e:  # pylint: disable=W0703
+            self.results[name] = {"Status": "Failed", "FailureReason": f"{type(e).__name__}: {e}"}
+        return None
+
+    def _finish(self, name, future):
+        try:
+            result = future.result()
+        except Exception as e:  # pylint: disable=W0703
+            result = {"seconds": 0.0, "failure": f"{type(e).__name__}: {e}"}
+        if "failure" in result:
+            self.results[name] = {"Status": "Failed", "FailureReason": result["failure"], "Seconds": result["seconds"]}
+            return
+        outputs_dir = os.path.join(self.jobs[name]["dir"], "outputs")
+        if self.cache is not None and self.steps[name].get("CacheConfig", {}).get("Enabled"):
+            outputs_dir = self.cache.put(self.keys[name], outputs_dir)
+        self._publish(name, outputs_dir)
+        self.results[name] = {"Status": "Succeeded", "Seconds": round(result["seconds"], 3)}
+
+    def _publish(self, name, outputs_dir):
+        # copies a job's outputs to the local paths of their S3 destinations
+        job = self.jobs[name]
+        for output_name, uri in job["destinations"].items():
+            destination = self.local_path(uri)
+            shutil.rmtree(destination, ignore_errors=True)
+            shutil.copytree(os.path.join(outputs_dir, output_name), destination)
+        self.properties[name] = job["properties"]
+        self.property_files[name] = {
+            item["PropertyFileName"]: os.path.join(
+                self.local_path(job["destinations"][item["OutputName"]]), item["FilePath"]
+            )
+            for item in self.steps[name].get("PropertyFiles", [])
+        }
+
+    def run(self):
+        """Runs the pipeline, independent steps in parallel.
+
+        Returns:
+            dict of step name to its status (Succeeded, Failed, NotExecuted or
+            Skipped), with the failure reason, run time, cache hits and condition
+            outcomes
+        """
+        pending = dict(self.dependencies)
+        running = {}
+        with ProcessPoolExecutor(self.workers) as executor:
+            while pending or running:
+                progressed = False
+                for name in [name for name, dependencies in pending.items() if dependencies <= set(self.results)]:
+                    del pending[name]
+                    progressed = True
+                    statuses = {self.results[dependency]["Status"] for dependency in self.dependencies[name]}
+                    condition, outcome = self.branches.get(name, (None, None))
+                    failed = any(result["Status"] == "Failed" for result in self.results.values())
+                    if failed or statuses & {"Failed", "NotExecuted"}:
+                        self.results[name] = {"Status": "NotExecuted"}
+                    elif condition is not None and self.results[condition]["Outcome"] != outcome:
+                        self.results[name] = {"Status": "NotExecuted"}
+                    else:
+                        future = self._start(name, executor)
+                        if future is not None:
+                            running[future] = name
+                if progressed:
+                    continue
+                if not running:
+                    raise ValueError(f"Steps {sorted(pending)} depend on each other")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    self._finish(name, future)
+                    logger.info(f"{name}: {self.results[name]['Status']}")
+        return self.results
+
+
+def main():  # pragma: no cover
+    """The main harness that runs the pipeline locally.
+
+    Generates the pipeline and runs its steps on this machine.
+    """
+    parser = argparse.ArgumentParser("Runs the pipeline of the pipeline script locally.")
+
+    parser.add_argument(
+        "-n",
+        "--module-name",
+        dest="module_name",
+        type=str,
+        help="The module name of the pipeline to import.",
+    )
+    parser.add_argument(
+        "-kwargs",
+        "--kwargs",
+        dest="kwargs",
+        default=None,
+        help="Dict string of keyword arguments for the pipeline generation (if supported)",
+    )
+    parser.add_argument(
+        "-parameters",
+        "--parameters",
+        dest="parameters",
+        default=None,
+        help="Dict string of pipeline parameter values, e.g. a local InputDataUrl",
+    )
+    parser.add_argument(
+        "-local-dir",
+        "--local-dir",
+        dest="local_dir",
+        default=DEFAULT_LOCAL_DIR,
+        help="Directory the S3 URIs are mapped to, holding the jobs and the step cache.",
+    )
+    parser.add_argument(
+        "-workers",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=None,
+        help="Number of steps run at the same time (defaults to the number of CPUs).",
+    )
+    parser.add_argument(
+        "-no-cache",
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Run every step instead of reusing the outputs of unchanged steps.",
+    )
+    args = parser.parse_args()
+
+    if args.module_name is None:
+        parser.print_help()
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    pipeline = get_pipeline_driver(args.module_name, args.kwargs)
+    cache = None if args.no_cache else LocalStepCache(os.path.join(args.local_dir, "cache"))
+    parameters = convert_struct(args.parameters)
+    runner = LocalPipelineRunner.from_pipeline(
+        pipeline, local_dir=args.local_dir, parameters=parameters, workers=args.workers, cache=cache
+    )
+    input_path = runner.local_path(runner.parameters.get("InputDataUrl"))
+    if "InputDataFingerprint" in runner.parameters and "InputDataFingerprint" not in parameters:
+        if input_path and os.path.exists(input_path):
+            runner.parameters["InputDataFingerprint"] = fingerprint_local_input(input_path)
+    print(f"###### Running {pipeline.name} locally as {runner.execution_id}")
+    start = time.perf_counter()
+    results = runner.run()
+    print(f"\n###### Execution completed in {time.perf_counter() - start:.1f}s. Execution step details:")
+    print(json.dumps(results, indent=2))
+    if cache is not None:
+        print("\n###### Step cache hits:")
+        print(json.dumps(cache.report(), indent=2))
+    if any(result["Status"] == "Failed" for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Tests for the local pipeline runner, run on a small hand-written definition."""
+import importlib.util
+import json
+import pathlib
+import sys
+import textwrap
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+spec = importlib.util.spec_from_file_location(
+    "run_pipeline_locally", pathlib.Path(__file__).resolve().parents[1] / "run_pipeline_locally.py"
+)
+runner_module = importlib.util.module_from_spec(spec)
+# the process pool pickles the job function by module name
+sys.modules[spec.name] = runner_module
+spec.loader.exec_module(runner_module)
+
+SCRIPT = textwrap.dedent(
+    """
+    import argparse, json, os, pathlib, time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default=None)
+    parser.add_argument("--sleep", type=float, default=0)
+    args = parser.parse_args()
+    base_dir = os.environ["PROCESSING_DIR"]
+    if args.input:
+        values = [float(value) for value in pathlib.Path(args.input).read_text().split()]
+        pathlib.Path(f"{base_dir}/data/values.json").write_text(json.dumps({"mean": sum(values) / len(values)}))
+    else:
+        start = time.time()
+        time.sleep(args.sleep)
+        mean = json.loads(pathlib.Path(f"{base_dir}/data/values.json").read_text())["mean"]
+        times = {"start": start, "end": time.time(), "mean": mean}
+        pathlib.Path(f"{base_dir}/out/times.json").write_text(json.dumps(times))
+    """
+)
+
+
+def processing_step(name, arguments, inputs, output, **extra):
+    uri = {"Std:Join": {"On": "/", "Values": ["s3://bkt", {"Get": "Execution.PipelineExecutionId"}, name, output]}}
+    return {
+        "Name": name,
+        "Type": "Processing",
+        "Arguments": {
+            "AppSpecification": {"ContainerArguments": arguments},
+            "ProcessingInputs": [
+                {"InputName": f"input-{i}", "S3Input": {"S3Uri": source, "LocalPath": destination}}
+                for i, (source, destination) in enumerate(inputs)
+            ],
+            "ProcessingOutputConfig": {
+                "Outputs": [
+                    {"OutputName": output, "S3Output": {"S3Uri": uri, "LocalPath": f"/opt/ml/processing/{output}"}}
+                ]
+            },
+        },
+        "CacheConfig": {"Enabled": True, "ExpireAfter": "P30D"},
+        **extra,
+    }
+
+
+def get_definition():
+    data = {"Get": "Steps.Prepare.ProcessingOutputConfig.Outputs['data'].S3Output.S3Uri"}
+    side_inputs = [(data, "/opt/ml/processing/data")]
+    return {
+        "Parameters": [
+            {"Name": "InputDataUrl", "Type": "String", "DefaultValue": "s3://bkt/input/values.txt"},
+            {"Name": "MaxMean", "Type": "Float", "DefaultValue": 5.0},
+        ],
+        "Steps": [
+            processing_step(
+                "Prepare",
+                ["--input", {"Get": "Parameters.InputDataUrl"}],
+                [],
+                "data",
+                PropertyFiles=[{"PropertyFileName": "Values", "OutputName": "data", "FilePath": "values.json"}],
+            ),
+            {
+                "Name": "Check",
+                "Type": "Condition",
+                "Arguments": {
+                    "Conditions": [
+                        {
+                            "Type": "LessThanOrEqualTo",
+                            "LeftValue": {
+                                "Std:JsonGet": {
+                                    "PropertyFile": {"Get": "Steps.Prepare.PropertyFiles.Values"},
+                                    "Path": "mean",
+                                }
+                            },
+                            "RightValue": {"Get": "Parameters.MaxMean"},
+                        }
+                    ],
+                    "IfSteps": [],
+                    "ElseSteps": [
+                        {"Name": "MeanTooLarge", "Type": "Fail", "Arguments": {"ErrorMessage": "Mean too large"}}
+                    ],
+                },
+            },
+            processing_step("Left", ["--sleep", "1"], side_inputs, "out", DependsOn=["Check"]),
+            processing_step("Right", ["--sleep", "1"], side_inputs, "out", DependsOn=["Check"]),
+        ],
+    }
+
+
+def get_runner(tmp_path, definition, **kwargs):
+    script = tmp_path / "step.py"
+    script.write_text(SCRIPT)
+    input_path = tmp_path / "local" / "s3" / "bkt" / "input" / "values.txt"
+    input_path.parent.mkdir(parents=True, exist_ok=True)
+    input_path.write_text("1 2 3\n")
+    code = {name: (str(script), str(tmp_path)) for name in ["Prepare", "Left", "Right"]}
+    return runner_module.LocalPipelineRunner(definition, code, local_dir=tmp_path / "local", workers=3, **kwargs)
+
+
+def test_runs_independent_steps_in_parallel_and_reuses_unchanged_ones(tmp_path):
+    cache = runner_module.LocalStepCache(tmp_path / "cache")
+    runner = get_runner(tmp_path, get_definition(), cache=cache)
+
+    results = runner.run()
+
+    assert {name: result["Status"] for name, result in results.items()} == {
+        "Prepare": "Succeeded",
+        "Check": "Succeeded",
+        "MeanTooLarge": "NotExecuted",
+        "Left": "Succeeded",
+        "Right": "Succeeded",
+    }
+    assert results["Check"]["Outcome"] is True
+    times = [
+        json.loads((tmp_path / "local" / "s3" / "bkt" / runner.execution_id / name / "out" / "times.json").read_text())
+        for name in ["Left", "Right"]
+    ]
+    assert times[0]["mean"] == 2.0
+    assert max(t["start"] for t in times) < min(t["end"] for t in times)
+
+    definition = get_definition()
+    definition["Steps"][3]["Arguments"]["AppSpecification"]["ContainerArguments"] = ["--sleep", "0"]
+    rerun = get_runner(tmp_path, definition, cache=cache)
+    results = rerun.run()
+
+    assert [name for name, result in results.items() if result.get("CacheHit")] == ["Prepare", "Left"]
+    assert (tmp_path / "local" / "s3" / "bkt" / rerun.execution_id / "Left" / "out" / "times.json").exists()
+    assert cache.report()["cache_hits"] == 2
+
+
+def test_failed_condition_runs_the_fail_step_and_stops_the_execution(tmp_path):
+    definition = get_definition()
+    definition["Parameters"][1]["DefaultValue"] = 1.0
+
+    results = get_runner(tmp_path, definition).run()
+
+    assert results["Check"] == {"Status": "Succeeded", "Outcome": False}
+    assert results["MeanTooLarge"] == {"Status": "Failed", "FailureReason": "Mean too large"}
+    assert results["Left"]["Status"] == results["Right"]["Status"] == "NotExecuted"
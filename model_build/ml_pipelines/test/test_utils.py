@@ -0,0 +1,216 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Tests for the pipeline CLI utilities."""
+import importlib.util
+import json
+import pathlib
+
+import boto3
+
+from botocore.stub import Stubber
+
+spec = importlib.util.spec_from_file_location("cli_utils", pathlib.Path(__file__).resolve().parents[1] / "_utils.py")
+utils = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(utils)
+
+
+def test_input_fingerprint_follows_the_listing():
+    client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="x")
+    objects = [
+        {"Key": "data/b.csv", "ETag": '"2"', "Size": 20},
+        {"Key": "data/", "ETag": '"0"', "Size": 0},
+        {"Key": "data/a.csv", "ETag": '"1"', "Size": 10},
+    ]
+    fingerprints = []
+    with Stubber(client) as stubber:
+        for listing in [objects, objects[::-1], [{**objects[0], "ETag": '"3"'}, *objects[1:]]]:
+            stubber.add_response("list_objects_v2", {"Contents": listing}, {"Bucket": "bkt", "Prefix": "data/"})
+            fingerprints.append(utils.fingerprint_s3_input(client, "s3://bkt/data/"))
+
+    assert fingerprints[0] == fingerprints[1]
+    assert fingerprints[2] != fingerprints[0]
+
+    # a URI naming an object ignores its siblings, and one naming no object is a prefix
+    with Stubber(client) as stubber:
+        listing = [objects[2], {"Key": "data/a.csv.bak", "ETag": '"4"', "Size": 10}]
+        stubber.add_response("list_objects_v2", {"Contents": listing}, {"Bucket": "bkt", "Prefix": "data/a.csv"})
+        stubber.add_response("list_objects_v2", {"Contents": listing[:1]}, {"Bucket": "bkt", "Prefix": "data/a.csv"})
+        stubber.add_response("list_objects_v2", {"Contents": objects}, {"Bucket": "bkt", "Prefix": "data"})
+        assert utils.fingerprint_s3_input(client, "s3://bkt/data/a.csv") == utils.fingerprint_s3_input(
+            client, "s3://bkt/data/a.csv"
+        )
+        assert utils.fingerprint_s3_input(client, "s3://bkt/data") == fingerprints[0]
+
+
+def test_cache_hit_report_counts_cacheable_steps():
+    steps = [
+        {"StepName": "CheckMSEAbaloneEvaluation", "Metadata": {"Condition": {"Outcome": "True"}}},
+        {"StepName": "EvaluateAbaloneModel", "Metadata": {"ProcessingJob": {"Arn": "arn:eval"}}},
+        {"StepName": "TrainAbaloneModel", "CacheHitResult": {"SourcePipelineExecutionArn": "arn:1"}},
+        {"StepName": "PreprocessAbaloneData", "CacheHitResult": {"SourcePipelineExecutionArn": "arn:1"}},
+    ]
+
+    report = utils.get_cache_hit_report(steps)
+
+    assert report["steps"] == 3
+    assert report["cache_hits"] == 2
+    assert report["cached_steps"] == ["TrainAbaloneModel", "PreprocessAbaloneData"]
+
+
+def test_local_step_cache_is_keyed_by_arguments_and_upstream_steps(tmp_path):
+    cache = utils.LocalStepCache(tmp_path / "cache")
+    outputs = tmp_path / "outputs"
+    (outputs / "train").mkdir(parents=True)
+    (outputs / "train" / "train.csv").write_text("1,2\n")
+    arguments = {"AppSpecification": {"ContainerEntrypoint": ["python3", "s3://bkt/Preprocess-264c0612f610/main.py"]}}
+    key = cache.key(arguments)
+
+    assert cache.get("Preprocess", key) is None
+    cache.put(key, outputs)
+    cached = cache.get("Preprocess", cache.key(arguments))
+    assert (pathlib.Path(cached) / "train" / "train.csv").read_text() == "1,2\n"
+
+    edited = {"AppSpecification": {"ContainerEntrypoint": ["python3", "s3://bkt/Preprocess-0b1c2d3e4f50/main.py"]}}
+    assert cache.key(edited) != key
+    assert cache.key(arguments, [cache.key(edited)]) != cache.key(arguments, [key])
+    assert cache.report() == {"steps": 2, "cache_hits": 1, "hit_rate": 0.5, "cached_steps": ["Preprocess"]}
+
+
+def test_definitions_are_cached_until_the_pipeline_source_changes(tmp_path, monkeypatch):
+    package = tmp_path / "cached_pipelines"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "pipeline.py").write_text(
+        "import json\n"
+        "class Pipeline:\n"
+        "    def __init__(self, **kwargs):\n"
+        "        self.name = 'CachedPipeline'\n"
+        "        self.kwargs = kwargs\n"
+        "    def definition(self):\n"
+        "        return json.dumps({'Version': 1, **self.kwargs})\n"
+        "def get_pipeline(**kwargs):\n"
+        "    return Pipeline(**kwargs)\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    cache = utils.PipelineDefinitionCache(tmp_path / "cache", ttl_seconds=60, code_dirs=[])
+
+    name, definition, pipeline = utils.get_cached_definition("cached_pipelines.pipeline", "{'region': 'x'}", cache)
+    assert pipeline is not None
+    cached = utils.get_cached_definition("cached_pipelines.pipeline", "{'region': 'x'}", cache)
+    assert cached == (name, definition, None)
+    assert utils.get_cached_definition("cached_pipelines.pipeline", "{'region': 'y'}", cache)[2] is not None
+
+    key = cache.key("cached_pipelines.pipeline", "{'region': 'x'}")
+    (package / "pipeline.py").write_text((package / "pipeline.py").read_text().replace("'Version': 1", "'Version': 2"))
+    assert cache.key("cached_pipelines.pipeline", "{'region': 'x'}") != key
+    assert cache.get(cache.key("cached_pipelines.pipeline", "{'region': 'x'}")) is None
+
+
+def write_looked_up_pipeline(tmp_path, package_name):
+    """Writes a pipeline package whose definition embeds an image URI read from the returned file when built."""
+    # the file stands for a lookup in AWS: it changes without the pipeline source changing
+    image = tmp_path / "image.txt"
+    image.write_text("training:1")
+    package = tmp_path / package_name
+    package.mkdir()
+    (package / "__init__.py").write_text(
+        "import pathlib\n"
+        "def get_pipeline_lookups(**kwargs):\n"
+        f"    return {{'image_uris': {{'training': pathlib.Path({str(image)!r}).read_text()}}}}\n"
+    )
+    (package / "pipeline.py").write_text(
+        "import json\n"
+        "from . import get_pipeline_lookups\n"
+        "class Pipeline:\n"
+        "    name = 'LookedUpPipeline'\n"
+        "    def definition(self):\n"
+        "        parameters = [{'Name': 'InputDataUrl', 'Type': 'String', 'DefaultValue': 's3://bkt/data/'},\n"
+        "                      {'Name': 'InputDataFingerprint', 'Type': 'String', 'DefaultValue': ''}]\n"
+        "        return json.dumps({'Parameters': parameters, **get_pipeline_lookups()})\n"
+        "def get_pipeline(**kwargs):\n"
+        "    return Pipeline()\n"
+    )
+    return image
+
+
+def test_cached_definitions_follow_the_build_time_lookups(tmp_path, monkeypatch):
+    image = write_looked_up_pipeline(tmp_path, "looked_up_pipelines")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    cache = utils.PipelineDefinitionCache(tmp_path / "cache", ttl_seconds=60, code_dirs=[])
+
+    utils.get_cached_definition("looked_up_pipelines.pipeline", None, cache)
+    assert utils.get_cached_definition("looked_up_pipelines.pipeline", None, cache)[2] is None
+    image.write_text("training:2")
+    _, definition, pipeline = utils.get_cached_definition("looked_up_pipelines.pipeline", None, cache)
+
+    assert pipeline is not None
+    assert json.loads(definition)["image_uris"] == {"training": "training:2"}
+
+
+def test_execution_fingerprint_follows_the_lookups_and_the_input(tmp_path, monkeypatch):
+    image = write_looked_up_pipeline(tmp_path, "fingerprinted_pipelines")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    cache = utils.PipelineDefinitionCache(tmp_path / "cache", ttl_seconds=60, code_dirs=[])
+    client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="x")
+    objects = [{"Key": "data/a.csv", "ETag": '"1"', "Size": 10}]
+
+    executions = []
+    with Stubber(client) as stubber:
+        for listing, image_uri in [(objects, "training:1"), (objects, "training:1"), (objects, "training:2")]:
+            image.write_text(image_uri)
+            stubber.add_response("list_objects_v2", {"Contents": listing}, {"Bucket": "bkt", "Prefix": "data/"})
+            _, definition, _ = utils.get_cached_definition("fingerprinted_pipelines.pipeline", None, cache)
+            executions.append(utils.get_execution_parameters(definition, client))
+        stubber.add_response(
+            "list_objects_v2", {"Contents": [{**objects[0], "ETag": '"2"'}]}, {"Bucket": "bkt", "Prefix": "data/"}
+        )
+        executions.append(utils.get_execution_parameters(definition, client))
+
+    parameters, input_fingerprint, fingerprint = executions[0]
+    assert parameters == {"InputDataFingerprint": input_fingerprint}
+    assert executions[1][2] == fingerprint
+    # a newly published image is not masked by the cached definition
+    assert executions[2][2] != fingerprint
+    assert executions[3][1] != input_fingerprint and executions[3][2] != executions[2][2]
+
+
+def test_last_successful_execution_fingerprint_is_found():
+    client = boto3.client("sagemaker", region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="x")
+    definition = '{"Version": "2020-12-01", "Steps": []}'
+    fingerprint = utils.get_execution_fingerprint(definition, {"InputDataFingerprint": "a"}, "a")
+    assert utils.get_execution_fingerprint(definition, {"InputDataFingerprint": "b"}, "b") != fingerprint
+    reordered = '{"Steps": [], "Version": "2020-12-01"}'
+    assert utils.get_execution_fingerprint(reordered, {"InputDataFingerprint": "a"}, "a") == fingerprint
+    request = {"PipelineName": "AbalonePipeline", "SortBy": "CreationTime", "SortOrder": "Descending"}
+    executions = [
+        {"PipelineExecutionArn": "arn:3", "PipelineExecutionStatus": "Executing"},
+        {
+            "PipelineExecutionArn": "arn:2",
+            "PipelineExecutionStatus": "Succeeded",
+            "PipelineExecutionDescription": utils.FINGERPRINT_DESCRIPTION.format(fingerprint),
+        },
+        {"PipelineExecutionArn": "arn:1", "PipelineExecutionStatus": "Succeeded"},
+    ]
+
+    with Stubber(client) as stubber:
+        stubber.add_response("list_pipeline_executions", {"PipelineExecutionSummaries": executions}, request)
+        stubber.add_response("list_pipeline_executions", {"PipelineExecutionSummaries": executions[2:]}, request)
+        stubber.add_client_error("list_pipeline_executions", "ResourceNotFound", expected_params=request)
+
+        assert utils.get_last_execution_fingerprint(client, "AbalonePipeline") == (fingerprint, "arn:2")
+        assert utils.get_last_execution_fingerprint(client, "AbalonePipeline") == (None, "arn:1")
+        assert utils.get_last_execution_fingerprint(client, "AbalonePipeline") == (None, None)
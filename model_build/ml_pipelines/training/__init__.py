@@ -28,3 +28,6 @@
 # terms of the Addendum and the Agreement. Customer is solely responsible for
 # using, deploying, testing, and supporting any code and applications provided
 # by AWS under this SOW.
+
+# build-time lookups of the definition, imported by the CLI's definition cache without the SageMaker SDK
+from ._utils import get_pipeline_lookups  # noqa: F401
@@ -15,12 +15,140 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import hashlib
+import json
 import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 
 from botocore.exceptions import ClientError
 
+try:
+    from .._utils import hash_source
+except ImportError:
+    # imported as a top-level package, with ml_pipelines/ on sys.path as the CLIs run it
+    from _utils import hash_source
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_IMAGE_URI_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ml_pipelines", "image_uris")
+
+
+class ImageUriCache:
+    """On-disk cache of resolved image URIs whose entries expire after `ttl_seconds`.
+
+    Each key is stored as its own JSON file, named by the hash of the key, so
+    concurrent writers never share a file. A `ttl_seconds` of 0 disables the cache.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_IMAGE_URI_CACHE_DIR, ttl_seconds=3600):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+
+    def _path(self, key):
+        digest = hashlib.sha256(json.dumps(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def get(self, key):
+        """Returns (True, value) for a live entry of `key`, else (False, None)."""
+        if not self.ttl_seconds:
+            return False, None
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+        if entry["key"] != list(key) or time.time() - entry["created"] > self.ttl_seconds:
+            return False, None
+        return True, entry["value"]
+
+    def put(self, key, value):
+        if not self.ttl_seconds:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+            json.dump({"key": list(key), "value": value, "created": time.time()}, f)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+
+def describe_latest_image(sagemaker_client, image_name):
+    """Gets the container image of the latest version of a SageMaker image, or None if there is no such image."""
+    try:
+        return sagemaker_client.describe_image_version(ImageName=image_name)["ContainerImage"]
+    except sagemaker_client.exceptions.ResourceNotFound:
+        return None
+
+
+def resolve_image_uris(sagemaker_client, image_names, cache=None):
+    """Gets the container images of the latest versions of several SageMaker images
+
+    Cached images are read from `cache` without any request; the others are
+    described concurrently, one request per image, and added to it. An image
+    that does not exist is not cached, so it is picked up as soon as it is
+    published.
+
+    Args:
+        sagemaker_client: boto3 client for sagemaker
+        image_names: names of the images
+        cache: an ImageUriCache, or None to always describe the images
+
+    Returns:
+        dict of image name to ECR URI, None for images that do not exist
+    """
+    region = getattr(getattr(sagemaker_client, "meta", None), "region_name", None)
+    image_uris = {}
+    for image_name in image_names:
+        if cache is not None:
+            hit, image_uri = cache.get(["describe_image_version", region, image_name])
+            if hit:
+                image_uris[image_name] = image_uri
+    missing = [image_name for image_name in image_names if image_name not in image_uris]
+    if missing:
+        with ThreadPoolExecutor(len(missing)) as executor:
+            described = executor.map(lambda image_name: describe_latest_image(sagemaker_client, image_name), missing)
+            for image_name, image_uri in zip(missing, described):
+                image_uris[image_name] = image_uri
+                if cache is not None and image_uri is not None:
+                    cache.put(["describe_image_version", region, image_name], image_uri)
+    logger.info(f"Resolved {len(image_names)} image(s), {len(image_names) - len(missing)} from the cache")
+    return image_uris
+
+
+def get_project_image_names(project_id):
+    """Gets the names of the project's processing, training and inference images"""
+    return [f"sagemaker-{project_id}-{kind}imagebuild" for kind in ["processing", "training", "inference"]]
+
+
+def get_pipeline_lookups(
+    region=None, project_id="SageMakerProjectId", image_uri_cache_ttl=3600, sagemaker_client=None, **kwargs
+):
+    """Gets what the pipeline definition looks up in AWS when it is built
+
+    These are the ECR URIs of the project's images. The CLI adds them to the key of
+    a cached definition, so a newly published image is not masked by the cache.
+    Takes the keyword arguments of get_pipeline and ignores the others.
+
+    Args:
+        region: AWS region of the pipeline
+        project_id: SageMaker project id the images are named after
+        image_uri_cache_ttl: seconds the resolved image URIs are cached on disk for
+        sagemaker_client: boto3 client for sagemaker, created for `region` by default
+
+    Returns:
+        dict with the image URIs by image name under "image_uris" (None for missing images)
+    """
+    if sagemaker_client is None:
+        import boto3
+
+        sagemaker_client = boto3.Session(region_name=region).client("sagemaker")
+    image_uris = resolve_image_uris(
+        sagemaker_client, get_project_image_names(project_id), ImageUriCache(ttl_seconds=image_uri_cache_ttl)
+    )
+    return {"image_uris": image_uris}
+
 
 def resolve_ecr_uri_from_image_versions(sagemaker_session, image_versions, image_name):
     """Gets ECR URI from image versions
@@ -44,17 +172,23 @@ def resolve_ecr_uri_from_image_versions(sagemaker_session, image_versions, image
     return None
 
 
-def resolve_ecr_uri(sagemaker_session, image_arn):
+def resolve_ecr_uri(sagemaker_session, image_arn, cache=None):
     """Gets the ECR URI from the image name
 
     Args:
         sagemaker_session: boto3 session for sagemaker client
         image_name: name of the image
+        cache: an ImageUriCache to read and store the ECR URI in
 
     Returns:
         ECR URI of the latest image version
     """
 
+    if cache is not None:
+        hit, ecr_uri = cache.get(["resolve_ecr_uri", image_arn])
+        if hit:
+            return ecr_uri
+
     # Fetching image name from image_arn (^arn:aws(-[\w]+)*:sagemaker:.+:[0-9]{12}:image/[a-z0-9]([-.]?[a-z0-9])*$)
     image_name = image_arn.partition("image/")[2]
     try:
@@ -68,6 +202,8 @@ def resolve_ecr_uri(sagemaker_session, image_arn):
             ecr_uri = resolve_ecr_uri_from_image_versions(sagemaker_session, response["ImageVersions"], image_name)
 
             if ecr_uri is not None:
+                if cache is not None:
+                    cache.put(["resolve_ecr_uri", image_arn], ecr_uri)
                 return ecr_uri
 
             if "NextToken" in response:
@@ -83,4 +219,22 @@ def resolve_ecr_uri(sagemaker_session, image_arn):
     except (ClientError, sagemaker_session.sagemaker_client.exceptions.ResourceNotFound) as e:
         error_message = e.response["Error"]["Message"]
         logger.error(error_message)
-        raise Exception(error_message)
\ No newline at end of file
+        raise Exception(error_message)
+
+
+def content_addressed_job_name(base_job_prefix, step_name, *code_paths):
+    """Gets a job name for a step that changes with the step's code only
+
+    The job name prefixes the S3 keys the step's code is uploaded to, which are
+    part of the step's cache key, so an unchanged step keeps its key across
+    pipeline upserts.
+
+    Args:
+        base_job_prefix: prefix of the pipeline's job names
+        step_name: name of the step
+        code_paths: files or directories of the step's code
+
+    Returns:
+        job name of the step
+    """
+    return f"{base_job_prefix}/{step_name}-{hash_source(*code_paths)[:12]}"
@@ -17,11 +17,11 @@
 
 """Example workflow pipeline script for abalone pipeline.
 
-                                               . -RegisterModel
-                                              .
-    Process-> Train -> Evaluate -> Condition .
-                                              .
-                                               . -(stop)
+                                                                 . -RegisterModel
+                                                                .
+    Process-> CheckData -> Train -> Evaluate -> Condition .
+                 .                                              .
+                  . -(fail)                                      . -(stop)
 
 Implements a get_pipeline(**kwargs) method.
 """
@@ -32,7 +32,6 @@ import logging
 import sagemaker
 import sagemaker.session
 
-from sagemaker.estimator import Estimator
 from sagemaker.inputs import TrainingInput
 from sagemaker.model_metrics import (
     MetricsSource,
@@ -44,12 +43,15 @@ from sagemaker.processing import (
     ScriptProcessor,
 )
 from sagemaker.sklearn.processing import SKLearnProcessor
-from sagemaker.workflow.conditions import ConditionLessThanOrEqualTo
+from sagemaker.workflow.conditions import ConditionEquals, ConditionLessThanOrEqualTo
 from sagemaker.workflow.condition_step import (
     ConditionStep,
 )
+from sagemaker.workflow.fail_step import FailStep
+from sagemaker.workflow.execution_variables import ExecutionVariables
 from sagemaker.workflow.functions import (
     JsonGet,
+    Join,
 )
 from sagemaker.workflow.parameters import (
     ParameterInteger,
@@ -58,18 +60,41 @@ from sagemaker.workflow.parameters import (
 from sagemaker.workflow.pipeline import Pipeline
 from sagemaker.workflow.properties import PropertyFile
 from sagemaker.workflow.steps import (
+    CacheConfig,
     ProcessingStep,
     TrainingStep,
 )
 from sagemaker.workflow.step_collections import RegisterModel
+from sagemaker.xgboost import XGBoost
 
 from botocore.exceptions import ClientError
 from sagemaker.network import NetworkConfig
 
+from ._utils import content_addressed_job_name, get_pipeline_lookups, get_project_image_names
+
 # BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 
 logger = logging.getLogger(__name__)
 
+# content types of the train/validation/test split formats written by the preprocessing step
+SPLIT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "libsvm": "text/libsvm",
+    "parquet": "application/x-parquet",
+}
+
+# version of the SageMaker XGBoost framework images used when no project image is built
+XGBOOST_FRAMEWORK_VERSION = "3.0-5"
+
+# metrics the script-mode trainer logs, surfaced on the training job
+TRAINING_METRIC_DEFINITIONS = [
+    {"Name": "train:rmse", "Regex": r"train-rmse:([0-9\.]+)"},
+    {"Name": "validation:rmse", "Regex": r"validation-rmse:([0-9\.]+)"},
+    {"Name": "train:load_rows_per_sec", "Regex": r"load_rows_per_sec=([0-9\.]+);"},
+    {"Name": "train:rows_per_sec", "Regex": r"train_rows_per_sec=([0-9\.]+);"},
+    {"Name": "train:peak_memory_mb", "Regex": r"peak_memory_mb=([0-9\.]+);"},
+]
+
 
 def get_session(region, default_bucket):
     """Gets the sagemaker session based on the region.
@@ -105,6 +130,24 @@ def get_pipeline(
     pipeline_name="AbalonePipeline",
     base_job_prefix="Abalone",
     project_id="SageMakerProjectId",
+    split_format="csv",
+    incremental=False,
+    dmatrix_cache=False,
+    tuning=False,
+    warm_start=False,
+    max_warm_start_rounds=20,
+    spot_training=False,
+    max_run=3600,
+    max_wait=7200,
+    cross_validation=False,
+    cv_folds=5,
+    eval_batch_size=0,
+    gate_on_mse_upper_bound=False,
+    champion_challenger=False,
+    latency_budget_ms=None,
+    image_uri_cache_ttl=3600,
+    step_caching=False,
+    cache_expire_after="P30D",
 ):
     """Gets a SageMaker ML Pipeline instance working with on abalone data.
 
@@ -112,11 +155,58 @@ def get_pipeline(
         region: AWS region to create and run the pipeline.
         role: IAM role to create and run steps and pipeline.
         default_bucket: the bucket to use for storing the artifacts
+        split_format: file format of the train/validation/test splits, one of
+            SPLIT_CONTENT_TYPES
+        incremental: only preprocess input objects added since the last run, appending
+            their shards to fixed split prefixes (single processing instance)
+        dmatrix_cache: also save each split as a binary XGBoost DMatrix, which the
+            training and evaluation steps load instead of parsing the splits
+        tuning: search the hyperparameters with successive halving ahead of training
+            and train with the best configuration found
+        warm_start: continue boosting the latest approved model of the package group,
+            looked up by the training job when it runs, for at most max_warm_start_rounds
+            rounds, and evaluate it against a model trained from scratch (trains from
+            scratch if no package is approved yet); the training step is never cached
+        max_warm_start_rounds: cap on the rounds added to the approved model
+        spot_training: train on managed spot capacity, checkpointing every few rounds to
+            S3 so an interrupted job resumes where it stopped
+        max_run: maximum training job run time in seconds
+        max_wait: maximum seconds to wait for spot capacity plus max_run
+        cross_validation: cross-validate the training configuration in cv_folds
+            concurrent folds on the train and validation splits, and gate the model
+            on the cross-validated MSE instead of the test split MSE
+        cv_folds: number of cross-validation folds
+        eval_batch_size: stream the test split through the evaluation step in batches
+            of this many rows, in constant memory (0 reads it at once); the residual
+            quantiles then come from a sample of the residuals and the MSE interval from
+            an online Poisson bootstrap, and the test split is read from its text files
+            even with dmatrix_cache
+        gate_on_mse_upper_bound: register the model only if the upper bound of the 95%
+            bootstrap confidence interval of its test MSE is within the threshold
+        champion_challenger: score the latest approved model of the package group,
+            looked up by the evaluation job when it runs, on the same test rows and register
+            the new model only if the paired test shows a lower MSE (skipped if no package
+            is approved yet); the evaluation step is never cached
+        latency_budget_ms: register the model only if its p99 single-row prediction
+            latency, measured by the evaluation step on ProcessingInstanceType, is
+            within this many milliseconds
+        image_uri_cache_ttl: seconds the resolved processing, training and inference
+            image URIs are cached on disk for (0 describes the images every time)
+        step_caching: reuse the results of a previous successful run of a step whose
+            code, arguments and inputs are unchanged; the code is uploaded under a prefix
+            named by its hash, and the preprocessing step is keyed by InputDataFingerprint,
+            which every execution must then set to a fingerprint of the data under
+            InputDataUrl (run_pipeline and run_pipeline_locally do) or changed data would
+            not be read (with spot_training the checkpoint prefix is per execution, so
+            training and the steps after it are not reused)
+        cache_expire_after: ISO 8601 duration for which step results are reused
 
     Returns:
         an instance of a pipeline
     """
 
+    if split_format not in SPLIT_CONTENT_TYPES:
+        raise ValueError(f"split_format must be one of {sorted(SPLIT_CONTENT_TYPES)}")
     sagemaker_session = get_session(region, default_bucket)
     if role is None:
         role = sagemaker.session.get_execution_role(sagemaker_session)
@@ -125,15 +215,31 @@ def get_pipeline(
     processing_instance_count = ParameterInteger(name="ProcessingInstanceCount", default_value=1)
     processing_instance_type = ParameterString(name="ProcessingInstanceType", default_value="ml.m5.xlarge")
     training_instance_type = ParameterString(name="TrainingInstanceType", default_value="ml.m5.xlarge")
+    training_instance_count = ParameterInteger(name="TrainingInstanceCount", default_value=1)
     inference_instance_type = ParameterString(name="InferenceInstanceType", default_value="ml.m5.xlarge")
     model_approval_status = ParameterString(name="ModelApprovalStatus", default_value="PendingManualApproval")
     input_data = ParameterString(
         name="InputDataUrl",
         default_value=f"s3://{default_bucket}/ml_pipelines/data/abalone-dataset.csv",
     )
-    processing_image_name = "sagemaker-{0}-processingimagebuild".format(project_id)
-    training_image_name = "sagemaker-{0}-trainingimagebuild".format(project_id)
-    inference_image_name = "sagemaker-{0}-inferenceimagebuild".format(project_id)
+    max_dtype_violations = ParameterInteger(name="MaxDtypeViolations", default_value=0)
+    # fingerprint of the objects under InputDataUrl (run_pipeline sets it), which keys the preprocessing step's cache
+    input_data_fingerprint = ParameterString(name="InputDataFingerprint", default_value="")
+    cache_config = CacheConfig(enable_caching=True, expire_after=cache_expire_after) if step_caching else None
+    processing_image_name, training_image_name, inference_image_name = get_project_image_names(project_id)
+    # the project's custom images, described concurrently; the built-in XGBoost image stands in for missing ones
+    image_uris = get_pipeline_lookups(
+        region, project_id, image_uri_cache_ttl, sagemaker_client=sagemaker_session.sagemaker_client
+    )["image_uris"]
+    if None in image_uris.values():
+        default_image_uri = sagemaker.image_uris.retrieve(
+            framework="xgboost",
+            region=region,
+            version=XGBOOST_FRAMEWORK_VERSION,
+            py_version="py3",
+            instance_type="ml.m5.xlarge",
+        )
+        image_uris = {name: image_uri or default_image_uri for name, image_uri in image_uris.items()}
 
     # network_config = NetworkConfig(
     #     enable_network_isolation=True,
@@ -143,18 +249,7 @@ def get_pipeline(
     # )
 
     # processing step for feature engineering
-    try:
-        processing_image_uri = sagemaker_session.sagemaker_client.describe_image_version(
-            ImageName=processing_image_name
-        )["ContainerImage"]
-    except (sagemaker_session.sagemaker_client.exceptions.ResourceNotFound):
-        processing_image_uri = sagemaker.image_uris.retrieve(
-            framework="xgboost",
-            region=region,
-            version="1.0-1",
-            py_version="py3",
-            instance_type="ml.m5.xlarge",
-        )
+    processing_image_uri = image_uris[processing_image_name]
     script_processor = ScriptProcessor(
         image_uri=processing_image_uri,
         instance_type=processing_instance_type,
@@ -165,69 +260,256 @@ def get_pipeline(
         role=role,
         output_kms_key=bucket_kms_id,
     )
+    # the script streams the objects under InputDataUrl from S3, each processing instance its own subset
+    data_statistics = PropertyFile(
+        name="AbaloneDataStatistics",
+        output_name="statistics",
+        path="statistics.json",
+    )
+    # one part file per training instance, each instance reading its own parts through ShardedByS3Key
+    process_arguments = [
+        "--input-data",
+        input_data,
+        "--output-format",
+        split_format,
+        "--split-parts",
+        training_instance_count.to_string(),
+        "--input-fingerprint",
+        input_data_fingerprint,
+    ]
+    # output name -> directory under /opt/ml/processing
+    split_dirs = {name: name for name in ["train", "validation", "test"]}
+    if dmatrix_cache:
+        process_arguments += ["--dmatrix-cache"]
+        split_dirs.update({f"{name}-dmatrix": f"dmatrix/{name}" for name in list(split_dirs)})
+    split_destinations = dict.fromkeys(split_dirs)
+    if incremental:
+        # the script uploads its new shards next to the live ones itself, before saving its state;
+        # the outputs point the later steps at the whole prefix (and re-upload the same files)
+        incremental_uri = f"s3://{default_bucket}/{base_job_prefix}/IncrementalPreprocess"
+        process_arguments += ["--incremental-uri", incremental_uri]
+        split_destinations = {name: f"{incremental_uri}/{split_dir}" for name, split_dir in split_dirs.items()}
+    else:
+        process_arguments += ["--cache-uri", f"s3://{default_bucket}/{base_job_prefix}/PreprocessCache"]
     step_process = ProcessingStep(
         name="PreprocessAbaloneData",
         processor=script_processor,
         outputs=[
-            ProcessingOutput(output_name="train", source="/opt/ml/processing/train"),
-            ProcessingOutput(output_name="validation", source="/opt/ml/processing/validation"),
-            ProcessingOutput(output_name="test", source="/opt/ml/processing/test"),
+            ProcessingOutput(output_name=name, source=f"/opt/ml/processing/{split_dirs[name]}", destination=destination)
+            for name, destination in split_destinations.items()
+        ]
+        + [
+            ProcessingOutput(output_name="preprocessor", source="/opt/ml/processing/preprocessor"),
+            ProcessingOutput(output_name="statistics", source="/opt/ml/processing/statistics"),
         ],
         code="source_scripts/preprocessing/prepare_abalone_data/main.py",  # we must figure out this path to get it from step_source directory
-        job_arguments=["--input-data", f"s3://{default_bucket}/ml_pipelines/data/abalone-dataset.csv"],
+        job_arguments=process_arguments,
+        property_files=[data_statistics],
+        cache_config=cache_config,
+    )
+    # libsvm rows omit zero-valued features, so the steps reading the splits take their width from the preprocessor
+    preprocessor_uri = step_process.properties.ProcessingOutputConfig.Outputs["preprocessor"].S3Output.S3Uri
+    split_width_inputs = []
+    if split_format == "libsvm":
+        split_width_inputs = [ProcessingInput(source=preprocessor_uri, destination="/opt/ml/processing/preprocessor")]
+
+    # condition step failing the execution when the input profile shows schema violations
+    step_check_data = ConditionStep(
+        name="CheckAbaloneDataQuality",
+        conditions=[
+            ConditionLessThanOrEqualTo(
+                left=JsonGet(step_name=step_process.name, property_file=data_statistics, json_path="violations.dtype"),
+                right=max_dtype_violations,
+            )
+        ],
+        if_steps=[],
+        else_steps=[
+            FailStep(
+                name="AbaloneDataQualityFailed",
+                error_message="Input data has more dtype violations than MaxDtypeViolations.",
+            )
+        ],
     )
 
     # training step for generating model artifacts
     model_path = f"s3://{default_bucket}/{base_job_prefix}/AbaloneTrain"
 
-    try:
-        training_image_uri = sagemaker_session.sagemaker_client.describe_image_version(ImageName=training_image_name)[
-            "ContainerImage"
-        ]
-    except (sagemaker_session.sagemaker_client.exceptions.ResourceNotFound):
-        training_image_uri = sagemaker.image_uris.retrieve(
-            framework="xgboost",
-            region=region,
-            version="1.0-1",
-            py_version="py3",
-            instance_type="ml.m5.xlarge",
+    training_image_uri = image_uris[training_image_name]
+
+    hyperparameters = {
+        "num-round": 50,
+        "max-depth": 5,
+        "eta": 0.2,
+        "gamma": 4,
+        "min-child-weight": 6,
+        "subsample": 0.7,
+    }
+    tuning_steps = []
+    if tuning:
+        # processing step searching the hyperparameters, whose best configuration the training step uses
+        script_tune = ScriptProcessor(
+            image_uri=training_image_uri,
+            command=["python3"],
+            instance_type=processing_instance_type,
+            instance_count=1,
+            base_job_name=f"{base_job_prefix}/script-abalone-tune",
+            sagemaker_session=sagemaker_session,
+            role=role,
+            output_kms_key=bucket_kms_id,
         )
+        tuning_result = PropertyFile(
+            name="AbaloneTuningResult",
+            output_name="tuning",
+            path="tuning.json",
+        )
+        step_tune = ProcessingStep(
+            name="TuneAbaloneHyperparameters",
+            processor=script_tune,
+            depends_on=[step_check_data],
+            inputs=[
+                ProcessingInput(
+                    source=step_process.properties.ProcessingOutputConfig.Outputs[name].S3Output.S3Uri,
+                    destination=f"/opt/ml/processing/{name}",
+                )
+                for name in ["train", "validation"]
+            ]
+            + split_width_inputs,
+            outputs=[
+                ProcessingOutput(output_name="tuning", source="/opt/ml/processing/tuning"),
+            ],
+            code="source_scripts/tuning/tune_xgboost/main.py",
+            job_arguments=["--split-format", split_format],
+            property_files=[tuning_result],
+            cache_config=cache_config,
+        )
+        tuned_paths = {name: f"best.hyperparameters.{name.replace('-', '_')}" for name in hyperparameters}
+        tuned_paths["num-round"] = "best.num_round"
+        hyperparameters = {
+            name: JsonGet(step_name=step_tune.name, property_file=tuning_result, json_path=json_path)
+            for name, json_path in tuned_paths.items()
+        }
+        tuning_steps = [step_tune]
 
-    xgb_train = Estimator(
-        image_uri=training_image_uri,
-        instance_type=training_instance_type,
-        instance_count=1,
-        output_path=model_path,
-        base_job_name=f"{base_job_prefix}/abalone-train",
-        sagemaker_session=sagemaker_session,
-        role=role,
-        output_kms_key=bucket_kms_id,
-    )
-    xgb_train.set_hyperparameters(
-        objective="reg:linear",
-        num_round=50,
-        max_depth=5,
-        eta=0.2,
-        gamma=4,
-        min_child_weight=6,
-        subsample=0.7,
-        silent=0,
-    )
+    # script mode: source_scripts/training/xgboost trains with the hist tree method on all cores,
+    # as one collective over TrainingInstanceCount instances
+    train_format = "dmatrix" if dmatrix_cache else split_format
+
+    def get_estimator(step_name, **extra_hyperparameters):
+        spot_args = {}
+        if spot_training:
+            # SageMaker syncs /opt/ml/checkpoints with this prefix, so a job restarted after an
+            # interruption starts from the checkpoints of its previous attempt
+            spot_args = dict(
+                use_spot_instances=True,
+                max_wait=max_wait,
+                checkpoint_s3_uri=Join(
+                    on="/",
+                    values=[f"{model_path}/checkpoints", ExecutionVariables.PIPELINE_EXECUTION_ID, step_name],
+                ),
+            )
+            extra_hyperparameters["checkpoint-dir"] = "/opt/ml/checkpoints"
+        return XGBoost(
+            entry_point="__main__.py",
+            source_dir="source_scripts/training/xgboost",
+            framework_version=XGBOOST_FRAMEWORK_VERSION,
+            image_uri=training_image_uri,
+            instance_type=training_instance_type,
+            instance_count=training_instance_count,
+            output_path=model_path,
+            base_job_name=f"{base_job_prefix}/abalone-train",
+            sagemaker_session=sagemaker_session,
+            role=role,
+            output_kms_key=bucket_kms_id,
+            hyperparameters={
+                "data-format": train_format,
+                "objective": "reg:squarederror",
+                **hyperparameters,
+                **extra_hyperparameters,
+            },
+            metric_definitions=TRAINING_METRIC_DEFINITIONS,
+            max_run=max_run,
+            # the profiler's rule configurations would otherwise be part of the cache key
+            disable_profiler=step_caching,
+            **spot_args,
+        )
+
+    train_output_suffix = "-dmatrix" if dmatrix_cache else ""
+    train_inputs = {
+        channel: TrainingInput(
+            s3_data=step_process.properties.ProcessingOutputConfig.Outputs[
+                channel + train_output_suffix
+            ].S3Output.S3Uri,
+            content_type=SPLIT_CONTENT_TYPES.get(train_format),
+            distribution="ShardedByS3Key",
+        )
+        for channel in ["train", "validation"]
+    }
+    if train_format == "libsvm":
+        train_inputs["preprocessor"] = TrainingInput(s3_data=preprocessor_uri)
+    baseline_steps = []
+    if warm_start:
+        # the from-scratch model the warm-started one is compared with
+        step_train_baseline = TrainingStep(
+            name="TrainAbaloneBaselineModel",
+            estimator=get_estimator("TrainAbaloneBaselineModel"),
+            depends_on=[step_check_data],
+            inputs=train_inputs,
+            cache_config=cache_config,
+        )
+        baseline_steps = [step_train_baseline]
+        xgb_train = get_estimator(
+            "TrainAbaloneModel",
+            **{"base-model-package-group": model_package_group_name, "max-added-rounds": max_warm_start_rounds},
+        )
+    else:
+        xgb_train = get_estimator("TrainAbaloneModel")
     step_train = TrainingStep(
         name="TrainAbaloneModel",
         estimator=xgb_train,
-        inputs={
-            "train": TrainingInput(
-                s3_data=step_process.properties.ProcessingOutputConfig.Outputs["train"].S3Output.S3Uri,
-                content_type="text/csv",
-            ),
-            "validation": TrainingInput(
-                s3_data=step_process.properties.ProcessingOutputConfig.Outputs["validation"].S3Output.S3Uri,
-                content_type="text/csv",
-            ),
-        },
+        depends_on=[step_check_data],
+        inputs=train_inputs,
+        # the trainer looks the approved model up when it runs, so a result cached under the
+        # same arguments could continue a model that is no longer the approved one
+        cache_config=None if warm_start else cache_config,
     )
 
+    cv_steps = []
+    if cross_validation:
+        # processing step cross-validating the training configuration, all folds on one instance
+        script_cv = ScriptProcessor(
+            image_uri=training_image_uri,
+            command=["python3"],
+            instance_type=processing_instance_type,
+            instance_count=1,
+            base_job_name=f"{base_job_prefix}/script-abalone-cv",
+            sagemaker_session=sagemaker_session,
+            role=role,
+            output_kms_key=bucket_kms_id,
+        )
+        cv_arguments = ["--split-format", split_format, "--folds", str(cv_folds)]
+        for name, value in hyperparameters.items():
+            cv_arguments += [f"--{name}", value.to_string() if isinstance(value, JsonGet) else str(value)]
+        step_cv = ProcessingStep(
+            name="CrossValidateAbaloneModel",
+            processor=script_cv,
+            depends_on=[step_check_data],
+            inputs=[
+                ProcessingInput(
+                    source=step_process.properties.ProcessingOutputConfig.Outputs[name].S3Output.S3Uri,
+                    destination=f"/opt/ml/processing/{name}",
+                )
+                for name in ["train", "validation"]
+            ]
+            + split_width_inputs,
+            outputs=[
+                ProcessingOutput(output_name="cross-validation", source="/opt/ml/processing/cross-validation"),
+            ],
+            code="source_scripts/evaluate/cross_validate_xgboost/main.py",
+            job_arguments=cv_arguments,
+            cache_config=cache_config,
+        )
+        cv_steps = [step_cv]
+
     # processing step for evaluation
     script_eval = ScriptProcessor(
         image_uri=training_image_uri,
@@ -244,48 +526,82 @@ def get_pipeline(
         output_name="evaluation",
         path="evaluation.json",
     )
+    eval_inputs = [
+        ProcessingInput(
+            source=step_train.properties.ModelArtifacts.S3ModelArtifacts,
+            destination="/opt/ml/processing/model",
+        ),
+        ProcessingInput(
+            source=step_process.properties.ProcessingOutputConfig.Outputs["test"].S3Output.S3Uri,
+            destination="/opt/ml/processing/test",
+        ),
+        # locates the one-hot sex columns the metrics are sliced by
+        ProcessingInput(source=preprocessor_uri, destination="/opt/ml/processing/preprocessor"),
+    ]
+    eval_arguments = ["--test-format", split_format]
+    if eval_batch_size:
+        eval_arguments += ["--batch-size", str(eval_batch_size)]
+    if dmatrix_cache and not eval_batch_size:
+        # streaming reads the text split batch by batch; a binary shard is only loaded whole
+        eval_inputs.append(
+            ProcessingInput(
+                source=step_process.properties.ProcessingOutputConfig.Outputs["test-dmatrix"].S3Output.S3Uri,
+                destination="/opt/ml/processing/test-dmatrix",
+            )
+        )
+        eval_arguments += ["--dmatrix-cache"]
+    if baseline_steps:
+        eval_inputs.append(
+            ProcessingInput(
+                source=step_train_baseline.properties.ModelArtifacts.S3ModelArtifacts,
+                destination="/opt/ml/processing/baseline-model",
+            )
+        )
+        eval_arguments += ["--baseline-model"]
+    if champion_challenger:
+        # looked up by the evaluation job, so it compares with the model approved when it runs
+        eval_arguments += ["--champion-model-package-group", model_package_group_name]
+    if cv_steps:
+        eval_inputs.append(
+            ProcessingInput(
+                source=step_cv.properties.ProcessingOutputConfig.Outputs["cross-validation"].S3Output.S3Uri,
+                destination="/opt/ml/processing/cross-validation",
+            )
+        )
+        eval_arguments += ["--cross-validation"]
     step_eval = ProcessingStep(
         name="EvaluateAbaloneModel",
         processor=script_eval,
-        inputs=[
-            ProcessingInput(
-                source=step_train.properties.ModelArtifacts.S3ModelArtifacts,
-                destination="/opt/ml/processing/model",
-            ),
-            ProcessingInput(
-                source=step_process.properties.ProcessingOutputConfig.Outputs["test"].S3Output.S3Uri,
-                destination="/opt/ml/processing/test",
-            ),
-        ],
+        inputs=eval_inputs,
         outputs=[
             ProcessingOutput(output_name="evaluation", source="/opt/ml/processing/evaluation"),
         ],
         code="source_scripts/evaluate/evaluate_xgboost/main.py",
+        job_arguments=eval_arguments,
         property_files=[evaluation_report],
+        cache_config=None if champion_challenger else cache_config,
     )
+    for step in [step_process, *tuning_steps, *cv_steps, step_eval]:
+        step.job_name = content_addressed_job_name(base_job_prefix, step.name, step.code)
+    for step in [*baseline_steps, step_train]:
+        step.job_name = content_addressed_job_name(base_job_prefix, step.name, step.estimator.source_dir)
 
     # register model step that will be conditionally executed
     model_metrics = ModelMetrics(
         model_statistics=MetricsSource(
-            s3_uri="{}/evaluation.json".format(
-                step_eval.arguments["ProcessingOutputConfig"]["Outputs"][0]["S3Output"]["S3Uri"]
+            # resolved at run time, so a reused evaluation is found where its job wrote it
+            s3_uri=Join(
+                on="/",
+                values=[
+                    step_eval.properties.ProcessingOutputConfig.Outputs["evaluation"].S3Output.S3Uri,
+                    "evaluation.json",
+                ],
             ),
             content_type="application/json",
         )
     )
 
-    try:
-        inference_image_uri = sagemaker_session.sagemaker_client.describe_image_version(ImageName=inference_image_name)[
-            "ContainerImage"
-        ]
-    except (sagemaker_session.sagemaker_client.exceptions.ResourceNotFound):
-        inference_image_uri = sagemaker.image_uris.retrieve(
-            framework="xgboost",
-            region=region,
-            version="1.0-1",
-            py_version="py3",
-            instance_type="ml.m5.xlarge",
-        )
+    inference_image_uri = image_uris[inference_image_name]
     step_register = RegisterModel(
         name="RegisterAbaloneModel",
         estimator=xgb_train,
@@ -301,15 +617,44 @@ def get_pipeline(
     )
 
     # condition step for evaluating model quality and branching execution
+    mse_path = "regression_metrics.mse.value"
+    if cross_validation:
+        mse_path = "cross_validation.mse.value"
+    elif gate_on_mse_upper_bound:
+        mse_path = "regression_metrics.mse.confidence_interval.upper"
     cond_lte = ConditionLessThanOrEqualTo(
-        left=JsonGet(
-            step_name=step_eval.name, property_file=evaluation_report, json_path="regression_metrics.mse.value"
-        ),
+        left=JsonGet(step_name=step_eval.name, property_file=evaluation_report, json_path=mse_path),
         right=6.0,
     )
+    latency_conditions = []
+    if latency_budget_ms is not None:
+        latency_conditions.append(
+            ConditionLessThanOrEqualTo(
+                left=JsonGet(
+                    step_name=step_eval.name,
+                    property_file=evaluation_report,
+                    json_path="performance_metrics.single_row.p99_ms",
+                ),
+                right=latency_budget_ms,
+            )
+        )
+    champion_conditions = []
+    if champion_challenger:
+        # set by the evaluation when the lower bound of the paired improvement over the approved
+        # model is above zero, or when no model is approved yet
+        champion_conditions.append(
+            ConditionEquals(
+                left=JsonGet(
+                    step_name=step_eval.name,
+                    property_file=evaluation_report,
+                    json_path="champion_comparison.challenger_wins",
+                ),
+                right=1,
+            )
+        )
     step_cond = ConditionStep(
         name="CheckMSEAbaloneEvaluation",
-        conditions=[cond_lte],
+        conditions=[cond_lte, *latency_conditions, *champion_conditions],
         if_steps=[step_register],
         else_steps=[],
     )
@@ -321,10 +666,13 @@ def get_pipeline(
             processing_instance_type,
             processing_instance_count,
             training_instance_type,
+            training_instance_count,
             model_approval_status,
             input_data,
+            max_dtype_violations,
+            input_data_fingerprint,
         ],
-        steps=[step_process, step_train, step_eval, step_cond],
+        steps=[step_process, step_check_data, *tuning_steps, *cv_steps, *baseline_steps, step_train, step_eval, step_cond],
         sagemaker_session=sagemaker_session,
     )
     return pipeline
\ No newline at end of file
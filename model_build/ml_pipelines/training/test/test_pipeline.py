@@ -0,0 +1,77 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Tests for the pipeline definition, built against mocked AWS services."""
+import json
+import pathlib
+import sys
+
+import pytest
+
+MODEL_BUILD = pathlib.Path(__file__).resolve().parents[3]
+
+
+@pytest.fixture
+def build_definition(tmp_path, monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    for name, value in [("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing")]:
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    # the step code paths are relative to model_build
+    monkeypatch.chdir(MODEL_BUILD)
+    monkeypatch.syspath_prepend(str(MODEL_BUILD))
+    from ml_pipelines.training import pipeline
+
+    # the project images do not exist, so the built-in XGBoost image stands in for them
+    def get_pipeline_lookups(region, project_id, image_uri_cache_ttl, sagemaker_client):
+        return {"image_uris": dict.fromkeys(pipeline.get_project_image_names(project_id))}
+
+    monkeypatch.setattr(pipeline, "get_pipeline_lookups", get_pipeline_lookups)
+
+    def build(**kwargs):
+        with moto.mock_aws():
+            boto3.client("s3").create_bucket(Bucket="bkt")
+            return json.loads(
+                pipeline.get_pipeline(
+                    region="us-east-1",
+                    role="arn:aws:iam::123456789012:role/pipeline",
+                    default_bucket="bkt",
+                    **kwargs,
+                ).definition()
+            )
+
+    yield build
+    sys.modules.pop("ml_pipelines.training.pipeline", None)
+
+
+def get_step(definition, name):
+    return next(step for step in definition["Steps"] if step["Name"] == name)
+
+
+def test_steps_are_not_cached_unless_asked_to(build_definition):
+    # without a fingerprint, a cached preprocessing step would not see a change of the data
+    # under an unchanged InputDataUrl, so no step is cached by default
+    definition = build_definition()
+
+    assert [step["Name"] for step in definition["Steps"] if step.get("CacheConfig", {}).get("Enabled")] == []
+
+    definition = build_definition(step_caching=True)
+    preprocessing = get_step(definition, "PreprocessAbaloneData")
+    arguments = preprocessing["Arguments"]["AppSpecification"]["ContainerArguments"]
+    assert preprocessing["CacheConfig"] == {"Enabled": True, "ExpireAfter": "P30D"}
+    assert arguments[arguments.index("--input-fingerprint") + 1] == {"Get": "Parameters.InputDataFingerprint"}
@@ -0,0 +1,160 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Tests for the pipeline's SageMaker lookups, run against stubbed clients."""
+import importlib.util
+import pathlib
+import sys
+import threading
+import time
+import types
+
+import boto3
+
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+# hash_source is imported from the CLI utilities, as when the CLIs import the pipeline
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[2]))
+spec = importlib.util.spec_from_file_location("training_utils", pathlib.Path(__file__).resolve().parents[1] / "_utils.py")
+utils = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(utils)
+
+
+class SlowImageClient:
+    """describe_image_version of a few known images, taking `delay` seconds per call."""
+
+    class exceptions:
+        class ResourceNotFound(ClientError):
+            pass
+
+    def __init__(self, images, delay=0.2):
+        self.images = images
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def describe_image_version(self, ImageName):
+        with self._lock:
+            self.calls.append(ImageName)
+        time.sleep(self.delay)
+        if ImageName not in self.images:
+            error = {"Error": {"Code": "ResourceNotFound", "Message": f"{ImageName} not found"}}
+            raise self.exceptions.ResourceNotFound(error, "DescribeImageVersion")
+        return {"ContainerImage": self.images[ImageName]}
+
+
+def test_images_are_described_concurrently_and_cached(tmp_path):
+    client = SlowImageClient({"processing": "processing:1", "training": "training:3"})
+    cache = utils.ImageUriCache(tmp_path, ttl_seconds=60)
+
+    start = time.perf_counter()
+    image_uris = utils.resolve_image_uris(client, ["processing", "training", "inference"], cache)
+    assert time.perf_counter() - start < 2 * client.delay
+
+    assert image_uris == {"processing": "processing:1", "training": "training:3", "inference": None}
+    assert sorted(client.calls) == ["inference", "processing", "training"]
+    # only the missing image is described again, and found once it is published
+    assert utils.resolve_image_uris(client, ["processing", "training", "inference"], cache) == image_uris
+    assert client.calls[3:] == ["inference"]
+    client.images["inference"] = "inference:1"
+    image_uris = utils.resolve_image_uris(client, ["processing", "training", "inference"], cache)
+    assert image_uris["inference"] == "inference:1"
+    assert utils.resolve_image_uris(client, ["processing", "training", "inference"], cache) == image_uris
+    assert len(client.calls) == 5
+
+
+def test_cached_images_expire_after_the_ttl(tmp_path, monkeypatch):
+    client = SlowImageClient({"training": "training:3"}, delay=0)
+    cache = utils.ImageUriCache(tmp_path, ttl_seconds=60)
+    utils.resolve_image_uris(client, ["training"], cache)
+
+    now = time.time()
+    monkeypatch.setattr(utils.time, "time", lambda: now + 61)
+    client.images["training"] = "training:4"
+
+    assert utils.resolve_image_uris(client, ["training"], cache) == {"training": "training:4"}
+    assert utils.resolve_image_uris(client, ["training"], utils.ImageUriCache(tmp_path, ttl_seconds=0)) == {
+        "training": "training:4"
+    }
+    assert len(client.calls) == 3
+
+
+def test_resolve_ecr_uri_pages_through_versions_once(tmp_path):
+    client = boto3.client("sagemaker", region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="x")
+    session = types.SimpleNamespace(sagemaker_client=client)
+    image_arn = "arn:aws:sagemaker:us-east-1:123456789012:image/training"
+    version_arn = f"{image_arn}/"
+    common = {"ImageName": "training", "MaxResults": 100, "SortBy": "VERSION", "SortOrder": "DESCENDING"}
+    created = {"CreationTime": 0, "ImageArn": image_arn, "LastModifiedTime": 0}
+
+    with Stubber(client) as stubber:
+        stubber.add_response(
+            "list_image_versions",
+            {
+                "ImageVersions": [
+                    {**created, "ImageVersionArn": f"{version_arn}5", "ImageVersionStatus": "FAILED", "Version": 5}
+                ],
+                "NextToken": "page-2",
+            },
+            {**common, "NextToken": ""},
+        )
+        stubber.add_response(
+            "list_image_versions",
+            {
+                "ImageVersions": [
+                    {**created, "ImageVersionArn": f"{version_arn}4", "ImageVersionStatus": "CREATED", "Version": 4}
+                ]
+            },
+            {**common, "NextToken": "page-2"},
+        )
+        stubber.add_response(
+            "describe_image_version",
+            {"ContainerImage": "training:4"},
+            {"ImageName": "training", "Version": 4},
+        )
+        cache = utils.ImageUriCache(tmp_path)
+
+        assert utils.resolve_ecr_uri(session, image_arn, cache) == "training:4"
+        stubber.assert_no_pending_responses()
+
+    # served from the cache without any request
+    offline = types.SimpleNamespace(sagemaker_client=None)
+    assert utils.resolve_ecr_uri(offline, image_arn, cache) == "training:4"
+
+
+def test_source_hash_changes_with_the_code_only(tmp_path):
+    (tmp_path / "pkg" / "__pycache__").mkdir(parents=True)
+    (tmp_path / "pkg" / "main.py").write_text("print('a')\n")
+    source_hash = utils.hash_source(tmp_path / "pkg")
+
+    (tmp_path / "pkg" / "__pycache__" / "main.cpython-311.pyc").write_bytes(b"\0")
+    assert utils.hash_source(tmp_path / "pkg") == source_hash
+    (tmp_path / "pkg" / "main.py").write_text("print('b')\n")
+    assert utils.hash_source(tmp_path / "pkg") != source_hash
+    (tmp_path / "pkg" / "main.py").write_text("print('a')\n")
+    (tmp_path / "pkg" / "util.py").write_text("")
+    assert utils.hash_source(tmp_path / "pkg") != source_hash
+
+
+def test_job_name_is_addressed_by_the_step_code(tmp_path):
+    (tmp_path / "main.py").write_text("print('a')\n")
+    job_name = utils.content_addressed_job_name("abalone", "Train", tmp_path / "main.py")
+
+    assert job_name.startswith("abalone/Train-") and len(job_name) == len("abalone/Train-") + 12
+    assert utils.content_addressed_job_name("abalone", "Train", tmp_path / "main.py") == job_name
+    (tmp_path / "main.py").write_text("print('b')\n")
+    assert utils.content_addressed_job_name("abalone", "Train", tmp_path / "main.py") != job_name
@@ -0,0 +1,250 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""K-fold cross-validation of the abalone XGBoost model on one instance.
+
+The train and validation splits are pooled, shuffled once and written to a
+memory-mapped `.npy` file. Fold `i` validates on the `i`-th contiguous block
+of rows and trains on the blocks around it, so every fold reads its rows as
+views of the memory map: the worker processes share the page cache instead
+of each holding a copy of the feature matrix. The folds train concurrently,
+one process each, with the cores divided between them.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+fixed_params = {"objective": "reg:squarederror", "tree_method": "hist", "eval_metric": "rmse"}
+
+
+def read_num_features(preprocessor_path):
+    """Number of features the preprocessing step's preprocessor.json transforms the input into."""
+    with open(preprocessor_path) as f:
+        params = json.load(f)["params"]
+    return len(params["numeric_features"]) + sum(len(categories) for categories in params["categories"])
+
+
+def densify(X):
+    """Dense copy of a sparse matrix with NaN, XGBoost's missing value, where it has no entry."""
+    X = X.tocoo()
+    dense = np.full(X.shape, np.nan, dtype=np.float32)
+    dense[X.row, X.col] = X.data
+    return dense
+
+
+def load_split(split_dir, split_format="csv", num_features=None):
+    """Reads all split files of a directory into labels and a feature matrix.
+
+    libsvm rows omit zero-valued features, so the width of a libsvm split is only
+    known from `num_features`; otherwise it is inferred from the files read. The
+    omitted entries are NaN in the dense matrix, as XGBoost treats them as missing
+    when training and tuning read the libsvm files.
+    """
+    paths = sorted(str(p) for p in pathlib.Path(split_dir).glob(f"*.{split_format}"))
+    if not paths:
+        raise FileNotFoundError(f"No {split_format} files under {split_dir}")
+    if split_format == "libsvm":
+        from sklearn.datasets import load_svmlight_files
+
+        loaded = load_svmlight_files(paths, n_features=num_features, zero_based=True, dtype=np.float32)
+        return np.concatenate([densify(X) for X in loaded[0::2]]), np.concatenate(loaded[1::2])
+    if split_format == "parquet":
+        rows = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True).to_numpy(np.float32)
+    else:
+        rows = np.concatenate([pd.read_csv(path, header=None, dtype=np.float32).to_numpy() for path in paths])
+    return rows[:, 1:], rows[:, 0]
+
+
+def write_shared_dataset(splits, data_dir, seed=0, chunk_size=100_000):
+    """Writes the shuffled rows of all (X, y) `splits` to memory-mapped files in `data_dir`.
+
+    Returns:
+        the number of rows written
+    """
+    num_rows = sum(len(y) for _, y in splits)
+    num_features = splits[0][0].shape[1]
+    X_shared = np.lib.format.open_memmap(
+        os.path.join(data_dir, "features.npy"), mode="w+", dtype=np.float32, shape=(num_rows, num_features)
+    )
+    y_shared = np.lib.format.open_memmap(
+        os.path.join(data_dir, "labels.npy"), mode="w+", dtype=np.float32, shape=(num_rows,)
+    )
+    X = np.concatenate([X for X, _ in splits]) if len(splits) > 1 else splits[0][0]
+    y = np.concatenate([y for _, y in splits])
+    permutation = np.random.default_rng(seed).permutation(num_rows)
+    for start in range(0, num_rows, chunk_size):
+        rows = permutation[start : start + chunk_size]
+        X_shared[start : start + len(rows)] = X[rows]
+        y_shared[start : start + len(rows)] = y[rows]
+    X_shared.flush()
+    y_shared.flush()
+    return num_rows
+
+
+def fold_bounds(num_rows, folds):
+    """Row offsets delimiting the contiguous validation block of each fold."""
+    return np.linspace(0, num_rows, folds + 1).astype(int)
+
+
+class FoldIterator(xgboost.DataIter):
+    """Feeds the training blocks of a fold to a QuantileDMatrix without concatenating them."""
+
+    def __init__(self, blocks):
+        self._blocks = [(X, y) for X, y in blocks if len(y)]
+        self._it = 0
+        super().__init__()
+
+    def next(self, input_data):
+        if self._it == len(self._blocks):
+            return 0
+        X, y = self._blocks[self._it]
+        input_data(data=X, label=y)
+        self._it += 1
+        return 1
+
+    def reset(self):
+        self._it = 0
+
+
+def run_fold(data_dir, fold, folds, params, num_round, nthread=1):
+    """Trains on all folds but `fold` of the shared dataset and scores the model on `fold`.
+
+    Returns:
+        the fold's metrics
+    """
+    start_time = time.perf_counter()
+    X = np.load(os.path.join(data_dir, "features.npy"), mmap_mode="r")
+    y = np.load(os.path.join(data_dir, "labels.npy"), mmap_mode="r")
+    start, end = fold_bounds(len(y), folds)[fold : fold + 2]
+    params = {**fixed_params, **params, "nthread": nthread}
+    dtrain = xgboost.QuantileDMatrix(
+        FoldIterator([(X[:start], y[:start]), (X[end:], y[end:])]), max_bin=256, nthread=nthread
+    )
+    booster = xgboost.train(params, dtrain, num_round)
+    residuals = y[start:end] - booster.predict(xgboost.DMatrix(X[start:end], nthread=nthread))
+    mse = float(np.mean(residuals**2))
+    return {
+        "fold": fold,
+        "rows": int(end - start),
+        "mse": {"value": mse, "standard_deviation": float(np.std(residuals))},
+        "rmse": float(np.sqrt(mse)),
+        "mae": float(np.mean(np.abs(residuals))),
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def cross_validate(splits, params, num_round, folds=5, workers=None, seed=0, data_dir=None):
+    """Cross-validates the model on the pooled (X, y) `splits`.
+
+    Args:
+        splits: (X, y) pairs pooled into the cross-validated dataset
+        params: XGBoost parameters, on top of `fixed_params`
+        num_round: boosting rounds of each fold
+        folds: number of folds
+        workers: concurrent folds; defaults to one per core, at most `folds`
+        seed: seed of the row shuffle
+        data_dir: directory of the memory-mapped dataset; a temporary one by default
+
+    Returns:
+        the report, with the metrics of every fold under "fold_metrics" and their
+        mean and standard deviation across folds under "mse", "rmse" and "mae"
+    """
+    start_time = time.perf_counter()
+    workers = min(folds, workers or os.cpu_count())
+    nthread = max(1, os.cpu_count() // workers)
+    with tempfile.TemporaryDirectory(dir=data_dir) as shared_dir:
+        num_rows = write_shared_dataset(splits, shared_dir, seed)
+        logger.info("Cross-validating %d rows in %d folds on %d worker(s).", num_rows, folds, workers)
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as executor:
+            futures = [
+                executor.submit(run_fold, shared_dir, fold, folds, params, num_round, nthread) for fold in range(folds)
+            ]
+            fold_metrics = [future.result() for future in futures]
+
+    def aggregate(values):
+        return {"value": float(np.mean(values)), "standard_deviation": float(np.std(values))}
+
+    wall_seconds = time.perf_counter() - start_time
+    return {
+        "folds": folds,
+        "rows": num_rows,
+        "mse": aggregate([m["mse"]["value"] for m in fold_metrics]),
+        "rmse": aggregate([m["rmse"] for m in fold_metrics]),
+        "mae": aggregate([m["mae"] for m in fold_metrics]),
+        "fold_metrics": fold_metrics,
+        "wall_seconds": wall_seconds,
+        "max_fold_seconds": max(m["seconds"] for m in fold_metrics),
+    }
+
+
+if __name__ == "__main__":
+    logger.debug("Starting cross-validation.")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--split-format", type=str, default="csv", choices=["csv", "libsvm", "parquet"])
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num-round", type=int, default=50)
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--eta", type=float, default=0.2)
+    parser.add_argument("--gamma", type=float, default=4)
+    parser.add_argument("--min-child-weight", type=float, default=6)
+    parser.add_argument("--subsample", type=float, default=0.7)
+    args = parser.parse_args()
+
+    # the local pipeline runner points this at a per-job directory
+    base_dir = os.environ.get("PROCESSING_DIR", "/opt/ml/processing")
+    num_features = None
+    if pathlib.Path(f"{base_dir}/preprocessor/preprocessor.json").exists():
+        num_features = read_num_features(f"{base_dir}/preprocessor/preprocessor.json")
+    logger.info("Loading train and validation splits.")
+    splits = [load_split(f"{base_dir}/{name}", args.split_format, num_features) for name in ["train", "validation"]]
+    params = {
+        "max_depth": args.max_depth,
+        "eta": args.eta,
+        "gamma": args.gamma,
+        "min_child_weight": args.min_child_weight,
+        "subsample": args.subsample,
+    }
+    report = cross_validate(splits, params, args.num_round, args.folds, args.workers, args.seed)
+    logger.info(
+        "%d-fold MSE %.4f (+/- %.4f) in %.1fs; slowest fold %.1fs.",
+        report["folds"],
+        report["mse"]["value"],
+        report["mse"]["standard_deviation"],
+        report["wall_seconds"],
+        report["max_fold_seconds"],
+    )
+
+    output_dir = f"{base_dir}/cross-validation"
+    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with open(f"{output_dir}/cross_validation.json", "w") as f:
+        json.dump(report, f)
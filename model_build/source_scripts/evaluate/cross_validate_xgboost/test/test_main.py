@@ -0,0 +1,86 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Tests for the parallel k-fold cross-validation."""
+import importlib.util
+import json
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parents[1]
+
+spec = importlib.util.spec_from_file_location("cross_validate_xgboost", SCRIPT_DIR / "main.py")
+main = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = main  # folds are pickled by reference to the pool workers
+spec.loader.exec_module(main)
+
+params = {"max_depth": 4, "eta": 0.3, "subsample": 0.8}
+
+
+@pytest.fixture
+def splits():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 5)).astype(np.float32)
+    y = (3 * X[:, 0] + X[:, 1] ** 2 + rng.normal(scale=0.1, size=len(X))).astype(np.float32)
+    return [(X[:1500], y[:1500]), (X[1500:], y[1500:])]
+
+
+def test_folds_cover_every_row_once(splits, tmp_path):
+    rows = main.write_shared_dataset(splits, tmp_path, seed=0)
+    y = np.load(tmp_path / "labels.npy")
+
+    assert rows == 2000
+    np.testing.assert_array_equal(np.sort(y), np.sort(np.concatenate([y for _, y in splits])))
+    bounds = main.fold_bounds(rows, 3)
+    assert bounds[0] == 0 and bounds[-1] == rows
+    assert max(np.diff(bounds)) - min(np.diff(bounds)) <= 1
+
+
+def test_concurrent_folds_match_serial_folds(splits):
+    concurrent = main.cross_validate(splits, params, num_round=20, folds=3, workers=3)
+    serial = main.cross_validate(splits, params, num_round=20, folds=3, workers=1)
+
+    assert [m["fold"] for m in concurrent["fold_metrics"]] == [0, 1, 2]
+    assert sum(m["rows"] for m in concurrent["fold_metrics"]) == 2000
+    assert [m["mse"] for m in concurrent["fold_metrics"]] == [m["mse"] for m in serial["fold_metrics"]]
+    assert concurrent["mse"]["value"] == pytest.approx(np.mean([m["mse"]["value"] for m in serial["fold_metrics"]]))
+    assert concurrent["mse"]["value"] < np.var(splits[0][1])
+
+
+def test_libsvm_splits_load_at_the_preprocessor_width(tmp_path):
+    from sklearn.datasets import dump_svmlight_file
+
+    rng = np.random.default_rng(1)
+    (tmp_path / "preprocessor").mkdir()
+    params = {"numeric_features": ["a", "b", "c"], "categorical_features": ["sex"], "categories": [["F", "M"]]}
+    (tmp_path / "preprocessor" / "preprocessor.json").write_text(json.dumps({"params": params}))
+    for name in ["train", "validation"]:
+        X = rng.normal(size=(100, 5))
+        if name == "validation":
+            X[:, -1] = 0.0  # omitted from every libsvm row of the split
+        (tmp_path / name).mkdir()
+        dump_svmlight_file(X, rng.normal(size=100), str(tmp_path / name / f"{name}.libsvm"), zero_based=True)
+
+    num_features = main.read_num_features(tmp_path / "preprocessor" / "preprocessor.json")
+    assert num_features == 5
+    splits = [main.load_split(tmp_path / name, "libsvm", num_features) for name in ["train", "validation"]]
+    assert [X.shape[1] for X, _ in splits] == [5, 5]
+    assert main.load_split(tmp_path / "validation", "libsvm")[0].shape[1] == 4
+    # the omitted zeros are missing, as in the sparse matrices training and tuning read
+    assert np.isnan(splits[1][0][:, -1]).all() and not np.isnan(splits[0][0]).any()
@@ -15,58 +15,758 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-"""Evaluation script for measuring mean squared error."""
+"""Evaluation script for measuring mean squared error and related regression metrics."""
+import argparse
+import io
+import itertools
 import json
 import logging
+import multiprocessing
+import os
 import pathlib
 import pickle
 import tarfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
+import scipy.sparse
+import scipy.stats
 import xgboost
 
-from sklearn.metrics import mean_squared_error
+from sklearn.datasets import load_svmlight_file, load_svmlight_files
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
 
-if __name__ == "__main__":
-    logger.debug("Starting evaluation.")
-    model_path = "/opt/ml/processing/model/model.tar.gz"
-    with tarfile.open(model_path) as tar:
-        tar.extractall(path=".")
+def load_test_data(test_dir, test_format="csv", num_features=None):
+    """Reads every test split file written by the preprocessing step.
 
-    logger.debug("Loading xgboost model.")
-    model = pickle.load(open("xgboost-model", "rb"))
+    Args:
+        test_dir: directory holding the test split file(s)
+        test_format: one of "csv", "libsvm" or "parquet"
+        num_features: number of features, needed by "libsvm" whose rows omit zeros
 
-    logger.debug("Reading test data.")
-    test_path = "/opt/ml/processing/test/test.csv"
-    df = pd.read_csv(test_path, header=None)
+    Returns:
+        the labels and the xgboost.DMatrix of features
+    """
+    paths = sorted(str(p) for p in pathlib.Path(test_dir).glob(f"*.{test_format}"))
+    if test_format == "libsvm":
+        loaded = load_svmlight_files(paths, n_features=num_features, zero_based=True)
+        y_test = np.concatenate(loaded[1::2])
+        return y_test, xgboost.DMatrix(scipy.sparse.vstack(loaded[0::2]).tocsr())
 
-    logger.debug("Reading test data.")
+    if test_format == "parquet":
+        df = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+    else:
+        df = pd.concat([pd.read_csv(path, header=None) for path in paths], ignore_index=True)
     y_test = df.iloc[:, 0].to_numpy()
     df.drop(df.columns[0], axis=1, inplace=True)
-    X_test = xgboost.DMatrix(df.values)
+    return y_test, xgboost.DMatrix(df.values)
+
+
+def iter_test_batches(test_dir, test_format="csv", batch_size=10_000, num_features=None):
+    """Reads the test split files batch by batch, so memory does not grow with the test split.
+
+    Args:
+        test_dir: directory holding the test split file(s)
+        test_format: one of "csv", "libsvm" or "parquet"
+        batch_size: rows per batch
+        num_features: number of features, needed by "libsvm" whose rows omit zeros
+
+    Yields:
+        the labels and the float32 features of each batch
+    """
+    for path in sorted(pathlib.Path(test_dir).glob(f"*.{test_format}")):
+        if test_format == "libsvm":
+            with open(path, "rb") as f:
+                while lines := list(itertools.islice(f, batch_size)):
+                    X, y = load_svmlight_file(
+                        io.BytesIO(b"".join(lines)), n_features=num_features, zero_based=True, dtype=np.float32
+                    )
+                    yield y, X
+            continue
+        if test_format == "parquet":
+            import pyarrow.parquet
+
+            batches = (
+                batch.to_pandas() for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=batch_size)
+            )
+        else:
+            batches = pd.read_csv(path, header=None, dtype=np.float32, chunksize=batch_size)
+        for batch in batches:
+            rows = batch.to_numpy(np.float32)
+            yield rows[:, 0], rows[:, 1:]
+
+
+# residual quantiles reported, e.g. "p05"
+residual_quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# squared errors of the test rows, set by the parent before the bootstrap pool forks
+_bootstrap_errors = {}
+
+
+def merge_moments(count, mean, m2, values):
+    """Merges a batch into a running (count, mean, sum of squared deviations).
+
+    This is the parallel form of Welford's algorithm, which avoids the
+    cancellation of the naive sum-of-squares formula.
+    """
+    batch_count = len(values)
+    if not batch_count:
+        return count, mean, m2
+    batch_mean = values.mean()
+    total = count + batch_count
+    delta = batch_mean - mean
+    m2 += ((values - batch_mean) ** 2).sum() + delta**2 * count * batch_count / total
+    return total, mean + delta * batch_count / total, m2
+
+
+def bootstrap_means(seed, replicates, batch_rows=1 << 20):
+    """Means of `replicates` bootstrap resamples of the squared errors in `_bootstrap_errors`.
+
+    Each batch of replicates is drawn as one (replicates, rows) index matrix
+    of at most `batch_rows` entries. The gather is bound by memory bandwidth,
+    so batches are kept small enough for the index matrix to stay in cache;
+    batching pays off on smaller test splits, where one replicate per
+    Python iteration would be dominated by call overhead.
+    """
+    errors = _bootstrap_errors["squared"]
+    n = len(errors)
+    rng = np.random.default_rng(seed)
+    means = np.empty(replicates)
+    step = max(1, batch_rows // n)
+    for start in range(0, replicates, step):
+        indices = rng.integers(0, n, size=(min(step, replicates - start), n), dtype=np.uint32)
+        means[start : start + len(indices)] = np.take(errors, indices).sum(axis=1, dtype=np.float64) / n
+    return means
+
+
+def bootstrap_confidence_interval(squared_errors, replicates=1000, confidence=0.95, seed=0, workers=None):
+    """Percentile bootstrap confidence interval of the mean squared error.
+
+    Replicates are drawn in chunks of 25 on a process pool, each chunk from
+    its own spawned seed, so the interval does not depend on `workers`.
+
+    Returns:
+        the "lower" and "upper" bounds, with the "confidence" and "replicates"
+    """
+    _bootstrap_errors["squared"] = np.asarray(squared_errors, dtype=np.float32)
+    chunks = [len(chunk) for chunk in np.array_split(np.arange(replicates), -(-replicates // 25))]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    workers = min(workers or os.cpu_count(), len(chunks))
+    if workers == 1:
+        means = np.concatenate([bootstrap_means(s, n) for s, n in zip(seeds, chunks)])
+    else:
+        # fork, so the workers share the parent's copy of the squared errors
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as executor:
+            means = np.concatenate(list(executor.map(bootstrap_means, seeds, chunks)))
+    lower, upper = np.quantile(means, [(1 - confidence) / 2, (1 + confidence) / 2])
+    return {"lower": float(lower), "upper": float(upper), "confidence": confidence, "replicates": replicates}
+
+
+class PoissonBootstrap:
+    """Bootstrap of a mean accumulated batch by batch (Poisson bootstrap).
+
+    Every value enters each replicate with an independent Poisson(1) weight
+    instead of being resampled, so each replicate is a weighted sum that can be
+    updated per batch: the state is two floats per replicate however many
+    values are seen, and the interval agrees with the resampling bootstrap for
+    all but tiny samples. The weights are drawn by comparing float32 uniforms
+    with the Poisson(1) CDF, capped at 8 (a 1e-6 tail), in blocks of at most
+    `block_entries` that stay in cache; that is several times faster than
+    `Generator.poisson` and about as fast as resampling in memory.
+    """
+
+    # P(X <= k) of X ~ Poisson(1), for k = 0..7
+    cdf = np.cumsum([np.exp(-1.0) / np.prod(np.arange(1, k + 1)) for k in range(8)]).astype(np.float32)
+
+    def __init__(self, replicates=1000, seed=0, block_entries=1 << 18):
+        self.replicates = replicates
+        self.block_entries = block_entries
+        self._rng = np.random.default_rng(seed)
+        self._sums = np.zeros(replicates)
+        self._weights = np.zeros(replicates)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float32)
+        step = max(1, self.block_entries // self.replicates)
+        for start in range(0, len(values), step):
+            block = values[start : start + step]
+            uniforms = self._rng.random((self.replicates, len(block)), dtype=np.float32)
+            weights = (uniforms > self.cdf[0]).astype(np.float32)
+            for threshold in self.cdf[1:]:
+                weights += uniforms > threshold
+            self._sums += weights @ block
+            self._weights += weights.sum(axis=1)
+
+    def confidence_interval(self, confidence=0.95):
+        """Percentile interval of the replicate means, as `bootstrap_confidence_interval` reports it."""
+        means = self._sums / np.maximum(self._weights, 1.0)
+        lower, upper = np.quantile(means, [(1 - confidence) / 2, (1 + confidence) / 2])
+        return {"lower": float(lower), "upper": float(upper), "confidence": confidence, "replicates": self.replicates}
+
+
+class ReservoirSample:
+    """Uniform random sample of at most `size` of the values seen (reservoir sampling)."""
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.seen = 0
+        self.values = np.empty(0, dtype=np.float32)
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float32)
+        free = max(0, self.size - len(self.values))
+        if free:
+            self.values = np.concatenate((self.values, values[:free]))
+            self.seen += min(free, len(values))
+            values = values[free:]
+        if len(values):
+            # the i-th value seen takes a random slot with probability size / i
+            slots = self._rng.integers(0, self.seen + np.arange(1, len(values) + 1))
+            kept = slots < self.size
+            self.values[slots[kept]] = values[kept]
+            self.seen += len(values)
+
+
+def slice_columns(preprocessor_path, feature):
+    """Finds the one-hot columns of a categorical feature in the preprocessed features.
+
+    Args:
+        preprocessor_path: the preprocessor.json artifact of the preprocessing step
+        feature: name of the categorical feature, e.g. "sex"
+
+    Returns:
+        the column indices and the category of each
+    """
+    with open(preprocessor_path) as f:
+        params = json.load(f)["params"]
+    offset = len(params["numeric_features"])
+    for name, categories in zip(params["categorical_features"], params["categories"]):
+        if name == feature:
+            return list(range(offset, offset + len(categories))), categories
+        offset += len(categories)
+    raise ValueError(f"{feature} is not a categorical feature of {preprocessor_path}")
+
+
+def slice_codes(X, columns):
+    """Index of the category of every row from its one-hot `columns`, -1 if none is set."""
+    if isinstance(X, xgboost.DMatrix):
+        X = X.get_data()
+    block = X[:, columns]
+    block = block.toarray() if scipy.sparse.issparse(block) else np.asarray(block)
+    return np.where(block.any(axis=1), block.argmax(axis=1), -1)
+
+
+class RunningMetrics:
+    """Accumulates regression metrics batch by batch.
+
+    The squared and absolute errors, the residual and label moments (for the
+    residual standard deviation and R²) and the per-slice errors are updated
+    with vectorised operations per batch, so the state does not grow with the
+    test split. The residual quantiles and the bootstrap confidence interval
+    come either from every residual, which `keep_residuals` keeps as float32,
+    or, in bounded memory, from a `residual_sample` and a `PoissonBootstrap`
+    of the squared errors accumulated as the batches arrive.
+
+    Args:
+        slice_names: categories of the slice codes passed to `update`
+        keep_residuals: keep every residual for `report`
+        residual_sample: keep a uniform sample of at most this many residuals instead
+        bootstrap_replicates: replicates of the online bootstrap (0 for none)
+        seed: seed of the sample and the online bootstrap
+    """
+
+    def __init__(self, slice_names=None, keep_residuals=False, residual_sample=0, bootstrap_replicates=0, seed=0):
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._label_moments = (0, 0.0, 0.0)
+        self._squared_error = 0.0
+        self._absolute_error = 0.0
+        self.slice_names = list(slice_names or [])
+        self._slice_stats = np.zeros((3, len(self.slice_names)))
+        self._residuals = [] if keep_residuals else None
+        self._sample = ReservoirSample(residual_sample, seed) if residual_sample else None
+        self._bootstrap = PoissonBootstrap(bootstrap_replicates, seed) if bootstrap_replicates else None
+
+    def update(self, y, predictions, codes=None):
+        y = np.asarray(y, dtype=np.float64)
+        residuals = y - predictions
+        self.count, self._mean, self._m2 = merge_moments(self.count, self._mean, self._m2, residuals)
+        self._label_moments = merge_moments(*self._label_moments, y)
+        squared = residuals**2
+        absolute = np.abs(residuals)
+        self._squared_error += squared.sum()
+        self._absolute_error += absolute.sum()
+        if codes is not None and self.slice_names:
+            sliced = codes >= 0
+            for i, weights in enumerate([None, squared, absolute]):
+                self._slice_stats[i] += np.bincount(
+                    codes[sliced],
+                    weights=None if weights is None else weights[sliced],
+                    minlength=len(self.slice_names),
+                )
+        if self._residuals is not None:
+            self._residuals.append(residuals.astype(np.float32))
+        if self._sample is not None:
+            self._sample.update(residuals)
+        if self._bootstrap is not None:
+            self._bootstrap.update(squared)
+
+    @property
+    def mse(self):
+        return self._squared_error / self.count
+
+    @property
+    def standard_deviation(self):
+        return np.sqrt(self._m2 / self.count)
+
+    @property
+    def mae(self):
+        return self._absolute_error / self.count
+
+    @property
+    def r2(self):
+        return 1 - self._squared_error / self._label_moments[2]
 
-    logger.info("Performing predictions against test data.")
-    predictions = model.predict(X_test)
+    def slice_metrics(self):
+        """Metrics of every slice with rows, by slice name."""
+        metrics = {}
+        for name, (count, squared, absolute) in zip(self.slice_names, self._slice_stats.T):
+            if count:
+                metrics[name] = {
+                    "rows": int(count),
+                    "mse": squared / count,
+                    "rmse": np.sqrt(squared / count),
+                    "mae": absolute / count,
+                }
+        return metrics
 
-    logger.debug("Calculating mean squared error.")
-    mse = mean_squared_error(y_test, predictions)
-    std = np.std(y_test - predictions)
+    def report(self, bootstrap_replicates=1000, confidence=0.95, seed=0, workers=None):
+        """Returns the "regression_metrics" section of the evaluation report.
+
+        The residual quantiles are included when residuals were kept or
+        sampled, and the confidence interval of the MSE when they were kept
+        (drawing `bootstrap_replicates` resamples) or bootstrapped online.
+        """
+        metrics = {
+            "mse": {"value": self.mse, "standard_deviation": self.standard_deviation},
+            "rmse": {"value": np.sqrt(self.mse)},
+            "mae": {"value": self.mae},
+            "r2": {"value": self.r2},
+        }
+        residuals = None
+        if self._residuals:
+            residuals = np.concatenate(self._residuals)
+        elif self._sample is not None and len(self._sample.values):
+            residuals = self._sample.values
+        if residuals is not None:
+            values = np.quantile(residuals, residual_quantiles)
+            metrics["residual_quantiles"] = {f"p{q * 100:02.0f}": float(v) for q, v in zip(residual_quantiles, values)}
+        if self._bootstrap is not None:
+            metrics["mse"]["confidence_interval"] = self._bootstrap.confidence_interval(confidence)
+        elif self._residuals and bootstrap_replicates:
+            metrics["mse"]["confidence_interval"] = bootstrap_confidence_interval(
+                residuals.astype(np.float64) ** 2, bootstrap_replicates, confidence, seed, workers
+            )
+        return metrics
+
+
+class PairedComparison:
+    """Accumulates the per-row squared error differences of two models scored on the same rows.
+
+    Pairing the rows removes the variance the two models share, so a much
+    smaller MSE difference is significant than when comparing two MSEs with
+    their own standard deviations.
+    """
+
+    def __init__(self):
+        self._moments = (0, 0.0, 0.0)
+
+    def update(self, y, reference_predictions, predictions):
+        y = np.asarray(y, dtype=np.float64)
+        differences = (y - reference_predictions) ** 2 - (y - predictions) ** 2
+        self._moments = merge_moments(*self._moments, differences)
+
+    def report(self, confidence=0.95):
+        """Mean MSE improvement over the reference model with its paired t-test.
+
+        Squared error differences that are the same on every row, e.g. of a model
+        compared with itself, have no variance. The t-statistic is then 0 with a
+        p-value of 1 if they are 0, and otherwise infinite, reported as None so the
+        report stays valid JSON, with a p-value of 0 or 1.
+
+        Returns:
+            the "value", "standard_error" and "confidence_interval" of the
+            improvement, and the one-sided "p_value" of no improvement
+        """
+        count, mean, m2 = self._moments
+        if count < 2:
+            raise ValueError(f"The paired comparison needs at least 2 rows, got {count}")
+        standard_error = np.sqrt(m2 / (count - 1) / count)
+        margin = scipy.stats.t.ppf((1 + confidence) / 2, count - 1) * standard_error
+        if standard_error:
+            t_statistic = mean / standard_error
+            p_value = float(scipy.stats.t.sf(t_statistic, count - 1))
+        elif mean:
+            t_statistic, p_value = None, float(mean < 0)
+        else:
+            t_statistic, p_value = 0.0, 1.0
+        return {
+            "value": mean,
+            "standard_error": standard_error,
+            "confidence_interval": {"lower": mean - margin, "upper": mean + margin, "confidence": confidence},
+            "t_statistic": None if t_statistic is None else float(t_statistic),
+            "p_value": p_value,
+        }
+
+
+def predict(model, X):
+    return model.predict(X) if isinstance(X, xgboost.DMatrix) else model.inplace_predict(X)
+
+
+def evaluate_streaming(models, batches, metrics, columns=None, comparisons=None):
+    """Scores every model on each (labels, features) batch, one batch in memory at a time.
+
+    The models predict each batch concurrently, so every batch is read and
+    held once however many models are compared on it.
+
+    Args:
+        models: the boosters to score
+        batches: iterable of (labels, features) batches
+        metrics: one RunningMetrics per model, updated in place
+        columns: one-hot columns of the feature the metrics are sliced by
+        comparisons: PairedComparison by (reference model index, model index),
+            updated in place
+
+    Returns:
+        `metrics`
+    """
+    with ThreadPoolExecutor(len(models)) as executor:
+        for y, X in batches:
+            codes = None if columns is None else slice_codes(X, columns)
+            predictions = list(executor.map(predict, models, itertools.repeat(X)))
+            for model_predictions, model_metrics in zip(predictions, metrics):
+                model_metrics.update(y, model_predictions, codes)
+            for (reference, model), comparison in (comparisons or {}).items():
+                comparison.update(y, predictions[reference], predictions[model])
+    return metrics
+
+
+def dense_rows(X, rows):
+    """The first `rows` rows of a DMatrix, sparse or dense matrix as a float32 array, repeated if there are fewer."""
+    if isinstance(X, xgboost.DMatrix):
+        X = X.get_data()
+    X = X[:rows]
+    X = X.toarray() if scipy.sparse.issparse(X) else np.asarray(X)
+    return np.resize(X.astype(np.float32), (rows, X.shape[1]))
+
+
+def measure_latency(model, X, batch_sizes=(1, 100, 10_000), thread_counts=(1,), min_calls=20, max_rows=20_000):
+    """Times predictions of the model on batches of test rows, the way the serving container makes them.
+
+    Every call builds a DMatrix from the request rows and predicts it. Each
+    (threads, batch size) setting is warmed up once and timed over at least
+    `min_calls` calls and about `max_rows` rows.
+
+    Args:
+        model: the booster to time
+        X: test rows the batches are taken from
+        batch_sizes: rows per prediction call
+        thread_counts: prediction threads
+
+    Returns:
+        the "performance_metrics" section of the evaluation report: latency
+        percentiles in milliseconds and rows per second of every setting, and
+        the single-row latency with the fewest threads under "single_row"
+    """
+    settings = []
+    for nthread in thread_counts:
+        model.set_param({"nthread": nthread})
+        for batch_size in batch_sizes:
+            batch = dense_rows(X, batch_size)
+            model.predict(xgboost.DMatrix(batch, nthread=nthread))
+            seconds = []
+            for _ in range(max(min_calls, max_rows // batch_size)):
+                start = time.perf_counter()
+                model.predict(xgboost.DMatrix(batch, nthread=nthread))
+                seconds.append(time.perf_counter() - start)
+            p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1000
+            settings.append(
+                {
+                    "batch_size": batch_size,
+                    "nthread": nthread,
+                    "p50_ms": p50,
+                    "p95_ms": p95,
+                    "p99_ms": p99,
+                    "rows_per_second": batch_size * len(seconds) / sum(seconds),
+                }
+            )
+    model.set_param({"nthread": -1})
+    report = {"num_boosted_rounds": model.num_boosted_rounds(), "latency": settings}
+    single_row = [setting for setting in settings if setting["batch_size"] == 1]
+    if single_row:
+        report["single_row"] = min(single_row, key=lambda setting: setting["nthread"])
+    return report
+
+
+def load_model(archive_path):
+    """Loads the booster from a model.tar.gz without extracting it.
+
+    The archive is read as a stream and only its `xgboost-model*` members are
+    kept in memory. The native UBJ/JSON model written by the script-mode
+    trainer is loaded straight from those bytes (UBJ first, it parses several
+    times faster); the pickled booster of the built-in algorithm container is
+    only unpickled if no native model exists.
+    """
+    models = {}
+    with tarfile.open(archive_path, "r|gz") as tar:
+        for member in tar:
+            name = pathlib.Path(member.name).name
+            if member.isfile() and name in ["xgboost-model.json", "xgboost-model.ubj", "xgboost-model"]:
+                models[name] = tar.extractfile(member).read()
+    for name in ["xgboost-model.ubj", "xgboost-model.json"]:
+        if name in models:
+            return xgboost.Booster(model_file=bytearray(models[name]))
+    if "xgboost-model" in models:
+        logger.warning("No native model in %s; unpickling xgboost-model.", archive_path)
+        return pickle.loads(models["xgboost-model"])
+    raise FileNotFoundError(f"No XGBoost model in {archive_path}")
+
+
+def download_approved_model(model_package_group_name, model_dir):
+    """Downloads the model.tar.gz of the latest approved package of a model package group
+
+    Looked up when the job runs, so the comparison is always with the model
+    approved at that time.
+
+    Args:
+        model_package_group_name: name of the model package group
+        model_dir: directory to download the model.tar.gz into
+
+    Returns:
+        the ARN of the approved package, or None if the group has none
+    """
+    import boto3
+
+    sagemaker_client = boto3.client("sagemaker")
+    pages = sagemaker_client.get_paginator("list_model_packages").paginate(
+        ModelPackageGroupName=model_package_group_name,
+        ModelApprovalStatus="Approved",
+        SortBy="CreationTime",
+        SortOrder="Descending",
+    )
+    for page in pages:
+        for package in page["ModelPackageSummaryList"]:
+            model_package_arn = package["ModelPackageArn"]
+            response = sagemaker_client.describe_model_package(ModelPackageName=model_package_arn)
+            model_data = response["InferenceSpecification"]["Containers"][0]["ModelDataUrl"]
+            logger.info("Downloading %s of the approved model package %s.", model_data, model_package_arn)
+            bucket, _, key = model_data[len("s3://") :].partition("/")
+            pathlib.Path(model_dir).mkdir(parents=True, exist_ok=True)
+            boto3.client("s3").download_file(bucket, key, f"{model_dir}/model.tar.gz")
+            return model_package_arn
+    return None
+
+
+def load_dmatrix_cache(dmatrix_dir):
+    """Loads the binary DMatrix shards saved by the preprocessing step.
+
+    Args:
+        dmatrix_dir: directory holding the test split's `*.buffer` file(s)
+
+    Returns:
+        a list with one xgboost.DMatrix per shard, labels included
+    """
+    paths = sorted(str(p) for p in pathlib.Path(dmatrix_dir).glob("*.buffer"))
+    if not paths:
+        raise FileNotFoundError(f"No DMatrix cache under {dmatrix_dir}")
+    return [xgboost.DMatrix(path) for path in paths]
+
+
+if __name__ == "__main__":
+    logger.debug("Starting evaluation.")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--test-format", type=str, default="csv", choices=["csv", "libsvm", "parquet"])
+    parser.add_argument(
+        "--dmatrix-cache",
+        action="store_true",
+        help="Read the test split from the binary DMatrix cache in /opt/ml/processing/test-dmatrix.",
+    )
+    parser.add_argument(
+        "--baseline-model",
+        action="store_true",
+        help="Also score the from-scratch model in /opt/ml/processing/baseline-model on the same test split.",
+    )
+    parser.add_argument(
+        "--champion-model-package-group",
+        type=str,
+        default=None,
+        help="Compare the model with the latest approved model of this group, looked up at run time, "
+        "on the same test rows.",
+    )
+    parser.add_argument(
+        "--cross-validation",
+        action="store_true",
+        help="Add the report in /opt/ml/processing/cross-validation to the evaluation report.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=0,
+        help="Stream the test split in batches of this many rows with online metrics (0 reads it at once). "
+        "The residual quantiles then come from a sample and the MSE interval from an online Poisson bootstrap.",
+    )
+    parser.add_argument(
+        "--residual-sample",
+        type=int,
+        default=100_000,
+        help="Residuals sampled for the residual quantiles when streaming.",
+    )
+    parser.add_argument(
+        "--bootstrap-replicates",
+        type=int,
+        default=1000,
+        help="Bootstrap replicates of the MSE confidence interval (0 skips the interval).",
+    )
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument(
+        "--latency-batch-sizes",
+        type=int,
+        nargs="*",
+        default=[1, 100, 10_000],
+        help="Batch sizes of the prediction latency measurement (none skips it).",
+    )
+    parser.add_argument(
+        "--latency-threads",
+        type=int,
+        nargs="+",
+        default=[1, os.cpu_count()],
+        help="Prediction thread counts of the latency measurement.",
+    )
+    parser.add_argument(
+        "--slice-feature",
+        type=str,
+        default="sex",
+        help="Categorical feature to slice the metrics by, located with /opt/ml/processing/preprocessor.",
+    )
+    args = parser.parse_args()
+    if args.batch_size and args.dmatrix_cache:
+        # a binary DMatrix shard can only be loaded whole, which would not bound memory by the batch size
+        parser.error("--batch-size streams the text splits; it cannot be combined with --dmatrix-cache")
+    # the local pipeline runner points this at a per-job directory
+    base_dir = os.environ.get("PROCESSING_DIR", "/opt/ml/processing")
+    preprocessor_path = f"{base_dir}/preprocessor/preprocessor.json"
+
+    logger.debug("Loading xgboost model.")
+    models = [load_model(f"{base_dir}/model/model.tar.gz")]
+    if args.baseline_model:
+        models.append(load_model(f"{base_dir}/baseline-model/model.tar.gz"))
+    comparisons = {}
+    champion_package = None
+    if args.champion_model_package_group:
+        champion_package = download_approved_model(args.champion_model_package_group, f"{base_dir}/champion-model")
+        if champion_package is None:
+            logger.warning("No approved model in %s; no champion to compare with.", args.champion_model_package_group)
+    if champion_package is not None:
+        models.append(load_model(f"{base_dir}/champion-model/model.tar.gz"))
+        comparisons[len(models) - 1, 0] = PairedComparison()
+
+    columns, slice_names = None, None
+    if pathlib.Path(preprocessor_path).exists():
+        columns, slice_names = slice_columns(preprocessor_path, args.slice_feature)
+    if args.batch_size:
+        metrics = [
+            RunningMetrics(
+                slice_names, residual_sample=args.residual_sample, bootstrap_replicates=args.bootstrap_replicates
+            )
+        ]
+    else:
+        metrics = [RunningMetrics(slice_names, keep_residuals=True)]
+    metrics += [RunningMetrics() for _ in models[1:]]
+
+    if args.batch_size:
+        logger.info("Streaming predictions against test data in batches of %d rows.", args.batch_size)
+        batches = iter_test_batches(f"{base_dir}/test", args.test_format, args.batch_size, models[0].num_features())
+    else:
+        if args.dmatrix_cache:
+            logger.debug("Loading test DMatrix cache.")
+            batches = [(shard.get_label(), shard) for shard in load_dmatrix_cache(f"{base_dir}/test-dmatrix")]
+        else:
+            logger.debug("Reading test data.")
+            batches = [load_test_data(f"{base_dir}/test", args.test_format, models[0].num_features())]
+        logger.info("Performing predictions against test data.")
+    evaluate_streaming(models, batches, metrics, columns, comparisons)
+
+    logger.debug("Calculating metrics.")
+    mse = metrics[0].mse
     report_dict = {
-        "regression_metrics": {
-            "mse": {"value": mse, "standard_deviation": std},
-        },
+        "regression_metrics": metrics[0].report(args.bootstrap_replicates, args.confidence),
     }
+    if slice_names:
+        report_dict["slice_metrics"] = {args.slice_feature: metrics[0].slice_metrics()}
+    logger.info("Scored %d rows; mae: %f, r2: %f", metrics[0].count, metrics[0].mae, metrics[0].r2)
+
+    if args.baseline_model:
+        baseline_mse = metrics[1].mse
+        logger.info("Warm-started model mse: %f, from-scratch baseline mse: %f", mse, baseline_mse)
+        report_dict["baseline_comparison"] = {
+            "baseline_mse": {"value": baseline_mse, "standard_deviation": metrics[1].standard_deviation},
+            "mse_improvement": baseline_mse - mse,
+        }
+
+    if args.champion_model_package_group:
+        # read by the pipeline's condition: a challenger without a champion wins by default
+        report_dict["champion_comparison"] = {"champion_model_package": champion_package, "challenger_wins": 1}
+    if champion_package is not None:
+        champion_mse = metrics[-1].mse
+        improvement = comparisons[len(models) - 1, 0].report(args.confidence)
+        logger.info(
+            "Challenger mse: %f, champion mse: %f, paired improvement p-value: %f",
+            mse,
+            champion_mse,
+            improvement["p_value"],
+        )
+        report_dict["champion_comparison"].update(
+            {
+                "champion_mse": {"value": champion_mse, "standard_deviation": metrics[-1].standard_deviation},
+                "mse_improvement": improvement,
+                "challenger_wins": int(improvement["confidence_interval"]["lower"] > 0),
+            }
+        )
+
+    if args.latency_batch_sizes:
+        logger.info("Measuring prediction latency.")
+        if args.batch_size:
+            test_batches = iter_test_batches(
+                f"{base_dir}/test", args.test_format, args.batch_size, models[0].num_features()
+            )
+            _, X_sample = next(test_batches)
+        else:
+            X_sample = batches[0][1]
+        report_dict["performance_metrics"] = measure_latency(
+            models[0], X_sample, args.latency_batch_sizes, sorted(set(args.latency_threads))
+        )
+        if "single_row" in report_dict["performance_metrics"]:
+            logger.info("Single-row p99 latency: %f ms", report_dict["performance_metrics"]["single_row"]["p99_ms"])
+
+    if args.cross_validation:
+        with open(f"{base_dir}/cross-validation/cross_validation.json") as f:
+            report_dict["cross_validation"] = json.load(f)
+        logger.info("Cross-validated mse: %f", report_dict["cross_validation"]["mse"]["value"])
 
-    output_dir = "/opt/ml/processing/evaluation"
+    output_dir = f"{base_dir}/evaluation"
     pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
 
     logger.info("Writing out evaluation report with mse: %f", mse)
     evaluation_path = f"{output_dir}/evaluation.json"
     with open(evaluation_path, "w") as f:
-        f.write(json.dumps(report_dict))
+        # NaN or infinity is not JSON, and the condition step could not read the report
+        f.write(json.dumps(report_dict, allow_nan=False))
@@ -0,0 +1,256 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Tests for the evaluation script."""
+import importlib.util
+import json
+import pathlib
+import pickle
+import sys
+import tarfile
+
+import numpy as np
+import pytest
+import xgboost
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parents[1]
+SOURCE_SCRIPTS = SCRIPT_DIR.parents[1]
+DATASET = SOURCE_SCRIPTS.parent / "ml_pipelines" / "data" / "abalone-dataset.csv"
+
+
+def load_script(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+main = load_script(SCRIPT_DIR / "main.py", "evaluate_xgboost")
+sys.modules["evaluate_xgboost"] = main  # bootstrap batches are pickled by reference to the pool workers
+preprocess = load_script(SOURCE_SCRIPTS / "preprocessing" / "prepare_abalone_data" / "main.py", "prepare_abalone_data")
+
+
+@pytest.fixture(scope="module")
+def splits(tmp_path_factory):
+    """The abalone dataset preprocessed into splits in every format, with two test parts each."""
+    base_dir = tmp_path_factory.mktemp("splits")
+    numeric_features = [c for c in preprocess.feature_columns_names if c != "sex"]
+    for output_format in preprocess.split_writers:
+        for name in preprocess.split_names:
+            (base_dir / output_format / name).mkdir(parents=True)
+        preprocess.preprocess_in_memory(
+            [str(DATASET)], base_dir / output_format, numeric_features, ["sex"], output_format, seed=0, split_parts=2
+        )
+    return base_dir
+
+
+@pytest.fixture(scope="module")
+def model(splits):
+    y, dtrain = main.load_test_data(splits / "csv" / "train")
+    dtrain.set_label(y)
+    return xgboost.train({"max_depth": 4, "eta": 0.3}, dtrain, 10)
+
+
+@pytest.mark.parametrize("test_format", ["csv", "libsvm", "parquet"])
+def test_streaming_metrics_match_in_memory_metrics(splits, model, test_format):
+    test_dir = splits / test_format / "test"
+    y, dtest = main.load_test_data(test_dir, test_format)
+    residuals = y - model.predict(dtest)
+
+    batches = list(main.iter_test_batches(test_dir, test_format, batch_size=97, num_features=model.num_features()))
+    (metrics,) = main.evaluate_streaming([model], iter(batches), [main.RunningMetrics()])
+
+    assert max(len(batch_y) for batch_y, _ in batches) == 97
+    assert metrics.count == len(y)
+    assert metrics.mse == pytest.approx(np.mean(residuals**2), rel=1e-6)
+    assert metrics.standard_deviation == pytest.approx(np.std(residuals), rel=1e-6)
+    assert metrics.mae == pytest.approx(np.mean(np.abs(residuals)), rel=1e-6)
+
+
+def test_running_metrics_are_stable_for_large_offsets():
+    rng = np.random.default_rng(0)
+    residuals = 1e8 + rng.normal(size=10_000)
+    metrics = main.RunningMetrics()
+    for batch in np.array_split(residuals, 37):
+        metrics.update(batch, np.zeros(len(batch)))
+
+    assert metrics.standard_deviation == pytest.approx(np.std(residuals), rel=1e-6)
+
+
+def test_report_has_rich_and_sliced_metrics(splits, model, tmp_path):
+    numeric_features = [c for c in preprocess.feature_columns_names if c != "sex"]
+    preprocessor = preprocess.build_preprocessor(numeric_features, ["sex"])
+    preprocessor.fit(preprocess.pd.read_csv(DATASET, header=None, names=preprocess.feature_columns_names + ["rings"]))
+    preprocess.save_preprocessor(
+        preprocess.StreamingPreprocessor.from_column_transformer(preprocessor, numeric_features, ["sex"]),
+        tmp_path / "preprocessor.json",
+        cache_key="",
+    )
+    columns, names = main.slice_columns(tmp_path / "preprocessor.json", "sex")
+    y, dtest = main.load_test_data(splits / "csv" / "test")
+    predictions = model.predict(dtest)
+    residuals = y - predictions
+
+    metrics = main.RunningMetrics(names, keep_residuals=True)
+    main.evaluate_streaming([model], [(y, dtest)], [metrics], columns)
+    report = metrics.report(bootstrap_replicates=200, workers=1)
+    json.dumps(report)
+
+    assert names == ["F", "I", "M"]
+    assert report["r2"]["value"] == pytest.approx(1 - np.sum(residuals**2) / np.sum((y - y.mean()) ** 2))
+    assert report["residual_quantiles"]["p50"] == pytest.approx(np.median(residuals), abs=1e-5)
+    interval = report["mse"]["confidence_interval"]
+    assert interval["lower"] < report["mse"]["value"] < interval["upper"]
+    sliced = metrics.slice_metrics()
+    assert sum(s["rows"] for s in sliced.values()) == len(y)
+    infants = dtest.get_data().toarray()[:, columns[1]] == 1
+    assert sliced["I"]["mse"] == pytest.approx(np.mean(residuals[infants] ** 2))
+
+
+def test_streaming_report_keeps_bounded_state():
+    rng = np.random.default_rng(1)
+    residuals = rng.standard_t(5, size=200_000)
+    streamed = main.RunningMetrics(residual_sample=5_000, bootstrap_replicates=500)
+    for batch in np.array_split(residuals, 113):
+        streamed.update(batch, np.zeros(len(batch)))
+    in_memory = main.RunningMetrics(keep_residuals=True)
+    in_memory.update(residuals, np.zeros(len(residuals)))
+
+    assert streamed._residuals is None
+    assert len(streamed._sample.values) == 5_000 and streamed._sample.seen == len(residuals)
+    report = streamed.report()
+    expected = in_memory.report(bootstrap_replicates=500, workers=1)
+    assert report["residual_quantiles"]["p50"] == pytest.approx(np.median(residuals), abs=0.05)
+    assert report["residual_quantiles"]["p95"] == pytest.approx(np.quantile(residuals, 0.95), abs=0.1)
+    width = expected["mse"]["confidence_interval"]["upper"] - expected["mse"]["confidence_interval"]["lower"]
+    for bound in ["lower", "upper"]:
+        assert report["mse"]["confidence_interval"][bound] == pytest.approx(
+            expected["mse"]["confidence_interval"][bound], abs=0.2 * width
+        )
+
+
+def test_bootstrap_interval_does_not_depend_on_workers():
+    squared_errors = np.random.default_rng(0).exponential(size=50_000)
+    serial = main.bootstrap_confidence_interval(squared_errors, replicates=100, workers=1)
+    parallel = main.bootstrap_confidence_interval(squared_errors, replicates=100, workers=2)
+
+    assert serial == parallel
+    assert serial["lower"] < squared_errors.mean() < serial["upper"]
+
+
+@pytest.mark.parametrize("model_name", ["xgboost-model.json", "xgboost-model.ubj", "xgboost-model"])
+def test_loads_the_model_from_the_archive(splits, model, tmp_path, model_name):
+    if model_name == "xgboost-model":
+        # the built-in algorithm container pickles the booster
+        (tmp_path / model_name).write_bytes(pickle.dumps(model))
+    else:
+        model.save_model(tmp_path / model_name)
+    (tmp_path / "code.py").write_text("")
+    with tarfile.open(tmp_path / "model.tar.gz", "w:gz") as tar:
+        tar.add(tmp_path / "code.py", arcname="code/code.py")
+        tar.add(tmp_path / model_name, arcname=model_name)
+
+    loaded = main.load_model(tmp_path / "model.tar.gz")
+
+    _, dtest = main.load_test_data(splits / "csv" / "test")
+    np.testing.assert_array_equal(loaded.predict(dtest), model.predict(dtest))
+
+
+def test_paired_comparison_detects_a_small_improvement(splits, model):
+    y, dtest = main.load_test_data(splits / "csv" / "test")
+    challenger = model.predict(dtest)
+    champion = challenger + np.random.default_rng(0).normal(scale=0.5, size=len(y))
+
+    class Champion:
+        def predict(self, X):
+            return champion
+
+    metrics = [main.RunningMetrics(), main.RunningMetrics()]
+    comparison = main.PairedComparison()
+    main.evaluate_streaming([model, Champion()], [(y, dtest)], metrics, comparisons={(1, 0): comparison})
+    report = comparison.report()
+
+    assert report["value"] == pytest.approx(metrics[1].mse - metrics[0].mse)
+    assert 0 < report["confidence_interval"]["lower"] < report["value"]
+    assert report["p_value"] < 0.025
+
+
+def test_comparing_a_model_with_itself_reports_valid_json(splits, model):
+    y, dtest = main.load_test_data(splits / "csv" / "test")
+    comparison = main.PairedComparison()
+    main.evaluate_streaming([model, model], [(y, dtest)], [main.RunningMetrics()] * 2, comparisons={(1, 0): comparison})
+    report = comparison.report()
+    json.dumps(report, allow_nan=False)
+
+    assert report["value"] == 0 and report["standard_error"] == 0
+    assert report["t_statistic"] == 0 and report["p_value"] == 1
+    assert report["confidence_interval"]["lower"] == 0
+
+    shifted = main.PairedComparison()
+    shifted.update(y, y + 1, y)
+    assert shifted.report()["t_statistic"] is None and shifted.report()["p_value"] == 0
+    single_row = main.PairedComparison()
+    single_row.update(y[:1], y[:1], y[:1])
+    with pytest.raises(ValueError, match="at least 2 rows"):
+        single_row.report()
+
+
+def test_latency_is_reported_for_every_setting(splits, model):
+    _, dtest = main.load_test_data(splits / "libsvm" / "test", "libsvm")
+
+    report = main.measure_latency(model, dtest, batch_sizes=[1, 1000], thread_counts=[1, 2], max_rows=2000)
+
+    assert [(s["nthread"], s["batch_size"]) for s in report["latency"]] == [(1, 1), (1, 1000), (2, 1), (2, 1000)]
+    assert report["single_row"] == report["latency"][0]
+    for setting in report["latency"]:
+        assert 0 < setting["p50_ms"] <= setting["p95_ms"] <= setting["p99_ms"]
+    assert report["latency"][1]["rows_per_second"] > report["latency"][0]["rows_per_second"]
+    assert main.dense_rows(dtest, 1000).shape == (1000, model.num_features())
+
+
+def test_champion_is_the_model_approved_at_run_time(model, tmp_path, monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    model.save_model(tmp_path / "xgboost-model.json")
+    with tarfile.open(tmp_path / "model.tar.gz", "w:gz") as tar:
+        tar.add(tmp_path / "xgboost-model.json", arcname="xgboost-model.json")
+
+    with moto.mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="models")
+        sagemaker_client = boto3.client("sagemaker")
+        sagemaker_client.create_model_package_group(ModelPackageGroupName="abalone")
+        assert main.download_approved_model("abalone", tmp_path / "champion") is None
+
+        for version, status in [(1, "Approved"), (2, "Approved"), (3, "PendingManualApproval")]:
+            s3.upload_file(str(tmp_path / "model.tar.gz"), "models", f"v{version}/model.tar.gz")
+            sagemaker_client.create_model_package(
+                ModelPackageGroupName="abalone",
+                ModelApprovalStatus=status,
+                InferenceSpecification={
+                    "Containers": [{"Image": "xgboost", "ModelDataUrl": f"s3://models/v{version}/model.tar.gz"}],
+                    "SupportedContentTypes": ["text/csv"],
+                    "SupportedResponseMIMETypes": ["text/csv"],
+                },
+            )
+        arn = main.download_approved_model("abalone", tmp_path / "champion")
+
+    assert arn.endswith("model-package/abalone/2")
+    assert main.load_model(tmp_path / "champion" / "model.tar.gz").num_boosted_rounds() == model.num_boosted_rounds()
@@ -16,17 +16,30 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """Feature engineers the abalone dataset."""
 import argparse
+import collections
+import contextlib
+import functools
+import gzip
+import hashlib
+import io
+import json
 import logging
 import os
 import pathlib
+import re
 import requests
 import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
 
 import boto3
 import numpy as np
 import pandas as pd
 
 from sklearn.compose import ColumnTransformer
+from sklearn.datasets import dump_svmlight_file
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
@@ -69,39 +82,450 @@ def merge_two_dicts(x, y):
     return z
 
 
-if __name__ == "__main__":
-    logger.debug("Starting preprocessing.")
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--input-data", type=str, required=True)
-    args = parser.parse_args()
+split_names = ["train", "validation", "test"]
+split_fractions = [0.7, 0.15, 0.15]
 
-    base_dir = "/opt/ml/processing"
-    pathlib.Path(f"{base_dir}/data").mkdir(parents=True, exist_ok=True)
-    input_data = args.input_data
-    logger.info("input_data: %s", input_data)
-    bucket = input_data.split("/")[2]
-    key = "/".join(input_data.split("/")[3:])
-
-    logger.info("Downloading data from bucket: %s, key: %s", bucket, key)
-    fn = f"{base_dir}/data/abalone-dataset.csv"
-    s3 = boto3.resource("s3")
-    s3.Bucket(bucket).download_file(key, fn)
-
-    logger.debug("Reading downloaded data.")
-    df = pd.read_csv(
-        fn,
-        header=None,
-        names=feature_columns_names + [label_column],
-        dtype=merge_two_dicts(feature_columns_dtype, label_column_dtype),
-    )
-    os.unlink(fn)
 
-    logger.debug("Defining transformers.")
-    numeric_features = list(feature_columns_names)
-    numeric_features.remove("sex")
+class RunningStats:
+    """Mergeable count, mean and sum of squared deviations (Welford/Chan)."""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, values):
+        """Folds a batch of values into the statistics, ignoring NaNs."""
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.merge(RunningStats(len(values), values.mean(), ((values - values.mean()) ** 2).sum()))
+
+    def merge(self, other):
+        """Combines the statistics of another partition into this one."""
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self):
+        """Population variance, as computed by StandardScaler."""
+        return self.m2 / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state["count"], state["mean"], state["m2"])
+
+
+class QuantileSketch:
+    """Mergeable approximate quantile sketch (KLL-style compactors).
+
+    Values are exact until more than `k` of them have been seen; after that each
+    level holds at most `k` samples, each standing in for 2**level inputs.
+    """
+
+    def __init__(self, k=8192, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        """Adds a batch of values to the sketch, ignoring NaNs."""
+        self.levels[0] = np.concatenate((self.levels[0], values[~np.isnan(values)]))
+        self._compress()
+
+    def merge(self, other):
+        """Merges another sketch into this one."""
+        for level, samples in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate((self.levels[level], samples))
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            samples = self.levels[level]
+            if len(samples) > self.k:
+                samples = np.sort(samples)
+                even = len(samples) - len(samples) % 2
+                promoted = samples[self._rng.integers(2) : even : 2]
+                self.levels[level] = samples[even:]
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+            level += 1
+
+    def to_dict(self):
+        return {"k": self.k, "levels": [samples.tolist() for samples in self.levels]}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state["k"])
+        sketch.levels = [np.array(samples, dtype=np.float64) for samples in state["levels"]]
+        return sketch
+
+    def quantile(self, q):
+        """Returns the (approximate) q-quantile of the values seen so far."""
+        if len(self.levels) == 1:
+            return np.quantile(self.levels[0], q) if len(self.levels[0]) else np.nan
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(s), 2.0**level) for level, s in enumerate(self.levels)])
+        order = np.argsort(values)
+        cumulative = np.cumsum(weights[order])
+        return values[order][np.searchsorted(cumulative, q * cumulative[-1])]
+
+
+class StreamingPreprocessor:
+    """Chunk-wise equivalent of the ColumnTransformer built by `build_preprocessor`.
+
+    `partial_fit` accumulates mergeable statistics (median sketch, running mean and
+    variance, category set), so the fit needs one pass over the data and memory
+    that does not grow with the number of rows.
+    """
+
+    def __init__(self, numeric_features, categorical_features, sketch_size=8192):
+        self.numeric_features = list(numeric_features)
+        self.categorical_features = list(categorical_features)
+        self.stats = {c: RunningStats() for c in self.numeric_features}
+        self.missing = {c: 0 for c in self.numeric_features}
+        self.sketches = {c: QuantileSketch(sketch_size) for c in self.numeric_features}
+        self.categories = {c: set() for c in self.categorical_features}
+
+    @property
+    def rows(self):
+        """Number of rows fitted so far."""
+        column = self.numeric_features[0]
+        return self.stats[column].count + self.missing[column]
+
+    def partial_fit(self, df):
+        """Updates the statistics with a chunk of rows."""
+        for c in self.numeric_features:
+            values = df[c].to_numpy(dtype=np.float64)
+            self.stats[c].update(values)
+            self.sketches[c].update(values)
+            self.missing[c] += int(np.isnan(values).sum())
+        for c in self.categorical_features:
+            self.categories[c].update(df[c].fillna("missing").unique())
+        return self
+
+    def merge(self, other):
+        """Merges the statistics fitted on another partition of the data."""
+        for c in self.numeric_features:
+            self.stats[c].merge(other.stats[c])
+            self.sketches[c].merge(other.sketches[c])
+            self.missing[c] += other.missing[c]
+        for c in self.categorical_features:
+            self.categories[c].update(other.categories[c])
+        return self
+
+    def to_dict(self):
+        """Returns the (unfinalized) statistics as a JSON-serialisable dict."""
+        return {
+            "numeric_features": self.numeric_features,
+            "categorical_features": self.categorical_features,
+            "stats": {c: s.to_dict() for c, s in self.stats.items()},
+            "missing": self.missing,
+            "sketches": {c: s.to_dict() for c, s in self.sketches.items()},
+            "categories": {c: sorted(v) for c, v in self.categories.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        preprocess = cls(state["numeric_features"], state["categorical_features"])
+        preprocess.stats = {c: RunningStats.from_dict(s) for c, s in state["stats"].items()}
+        preprocess.missing = dict(state["missing"])
+        preprocess.sketches = {c: QuantileSketch.from_dict(s) for c, s in state["sketches"].items()}
+        preprocess.categories = {c: set(v) for c, v in state["categories"].items()}
+        return preprocess
+
+    def finalize(self):
+        """Derives the imputation, scaling and encoding parameters."""
+        self.median_ = np.array([self.sketches[c].quantile(0.5) for c in self.numeric_features])
+        self.mean_ = np.empty(len(self.numeric_features))
+        self.scale_ = np.empty(len(self.numeric_features))
+        for i, c in enumerate(self.numeric_features):
+            # The scaler sees the imputed column, so missing values count as medians.
+            stats = RunningStats(self.stats[c].count, self.stats[c].mean, self.stats[c].m2)
+            stats.merge(RunningStats(self.missing[c], self.median_[i], 0.0))
+            self.mean_[i] = stats.mean
+            self.scale_[i] = np.sqrt(stats.variance)
+        self.scale_[self.scale_ < 10 * np.finfo(np.float64).eps] = 1.0
+        self.categories_ = [np.array(sorted(self.categories[c]), dtype=object) for c in self.categorical_features]
+        return self
+
+    def transform(self, df):
+        """Transforms a chunk of rows into the model feature matrix."""
+        numeric = df[self.numeric_features].to_numpy(dtype=np.float64)
+        numeric = np.where(np.isnan(numeric), self.median_, numeric)
+        blocks = [(numeric - self.mean_) / self.scale_]
+        for c, categories in zip(self.categorical_features, self.categories_):
+            values = df[c].fillna("missing").to_numpy(dtype=object)
+            blocks.append((values[:, None] == categories[None, :]).astype(np.float64))
+        return np.concatenate(blocks, axis=1)
+
+    def fitted_params(self):
+        """Returns the finalized transform parameters as a JSON-serialisable dict."""
+        return {
+            "numeric_features": self.numeric_features,
+            "categorical_features": self.categorical_features,
+            "median": self.median_.tolist(),
+            "mean": self.mean_.tolist(),
+            "scale": self.scale_.tolist(),
+            "categories": [categories.tolist() for categories in self.categories_],
+        }
+
+    @classmethod
+    def from_fitted_params(cls, params):
+        """Rebuilds a ready-to-transform preprocessor from `fitted_params` output."""
+        preprocess = cls(params["numeric_features"], params["categorical_features"])
+        preprocess.median_ = np.array(params["median"], dtype=np.float64)
+        preprocess.mean_ = np.array(params["mean"], dtype=np.float64)
+        preprocess.scale_ = np.array(params["scale"], dtype=np.float64)
+        preprocess.categories_ = [np.array(categories, dtype=object) for categories in params["categories"]]
+        return preprocess
+
+    @classmethod
+    def from_column_transformer(cls, column_transformer, numeric_features, categorical_features):
+        """Wraps the parameters of a ColumnTransformer fitted by `build_preprocessor`."""
+        numeric = column_transformer.named_transformers_["num"].named_steps
+        onehot = column_transformer.named_transformers_["cat"].named_steps["onehot"]
+        return cls.from_fitted_params(
+            {
+                "numeric_features": list(numeric_features),
+                "categorical_features": list(categorical_features),
+                "median": numeric["imputer"].statistics_.tolist(),
+                "mean": numeric["scaler"].mean_.tolist(),
+                "scale": numeric["scaler"].scale_.tolist(),
+                "categories": [categories.tolist() for categories in onehot.categories_],
+            }
+        )
+
+
+def save_statistics(profile, path):
+    """Writes the data profile report, read by the pipeline's data quality condition."""
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(profile.report(), f)
+
+
+def save_preprocessor(preprocess, path, cache_key):
+    """Writes the fitted transform parameters as a versioned JSON artifact."""
+    artifact = {
+        "format_version": 1,
+        "cache_key": cache_key,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "params": preprocess.fitted_params(),
+    }
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(artifact, f)
+
+
+def load_preprocessor(path):
+    """Loads an artifact written by `save_preprocessor`."""
+    with open(path) as f:
+        return StreamingPreprocessor.from_fitted_params(json.load(f)["params"])
+
+
+class SplitWriter:
+    """Appends split rows (label first) to a single output file."""
+
+    extension = None
+    mode = "w"
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._f = open(path, self.mode)
+
+    def write(self, rows):
+        self._write(rows)
+        self.rows += len(rows)
+
+    def close(self):
+        self._f.close()
+
+
+class CSVSplitWriter(SplitWriter):
+    """Headerless CSV, as consumed by the built-in XGBoost container."""
+
+    extension = "csv"
+
+    def _write(self, rows):
+        pd.DataFrame(rows, copy=False).to_csv(self._f, header=False, index=False)
+
+
+class LibSVMSplitWriter(SplitWriter):
+    """Zero-based libsvm; zero-valued features are omitted and read back as missing."""
+
+    extension = "libsvm"
+    mode = "wb"
+
+    def _write(self, rows):
+        dump_svmlight_file(rows[:, 1:], rows[:, 0], self._f, zero_based=True)
+
+
+class ParquetSplitWriter(SplitWriter):
+    """Parquet with one row group per write and string column names."""
+
+    extension = "parquet"
+    mode = "wb"
+
+    def __init__(self, path):
+        import pyarrow
+        import pyarrow.parquet
+
+        super().__init__(path)
+        self._pa = pyarrow
+        self._writer = None
+
+    def _write(self, rows):
+        table = self._pa.table({str(i): rows[:, i] for i in range(rows.shape[1])})
+        if self._writer is None:
+            self._writer = self._pa.parquet.ParquetWriter(self._f, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        super().close()
+
+
+class DMatrixCacheWriter(SplitWriter):
+    """XGBoost binary DMatrix, saved once all rows of the split are written.
+
+    The rows are held in memory as float32, the precision the DMatrix keeps
+    anyway, until `close` builds the matrix. A QuantileDMatrix has no binary
+    form, so consumers re-sketch the histogram cuts, but skip all parsing.
+    """
+
+    extension = "buffer"
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._blocks = []
+
+    def _write(self, rows):
+        self._blocks.append(rows.astype(np.float32))
+
+    def close(self):
+        if not self._blocks:
+            return
+        import xgboost
+
+        rows = np.concatenate(self._blocks)
+        self._blocks = []
+        pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        xgboost.DMatrix(rows[:, 1:], label=rows[:, 0]).save_binary(self.path)
+
+
+class TeeSplitWriter:
+    """Writes the same rows to a split file and its DMatrix cache."""
+
+    def __init__(self, writer, cache_writer):
+        self.writer = writer
+        self.cache_writer = cache_writer
+
+    @property
+    def path(self):
+        return self.writer.path
+
+    @property
+    def rows(self):
+        return self.writer.rows
+
+    def write(self, rows):
+        self.writer.write(rows)
+        self.cache_writer.write(rows)
+
+    def close(self):
+        self.writer.close()
+        self.cache_writer.close()
+
+
+class PartitionedSplitWriter:
+    """Spreads the rows of a split evenly over several part files.
+
+    Every write is divided between the parts, so each part of a split gets
+    a share of every chunk. Used when training instances each read their own
+    part of the split through ShardedByS3Key.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    @property
+    def path(self):
+        return self.parts[0].path
+
+    @property
+    def rows(self):
+        return sum(part.rows for part in self.parts)
+
+    def write(self, rows):
+        for part, part_rows in zip(self.parts, np.array_split(rows, len(self.parts))):
+            if len(part_rows):
+                part.write(part_rows)
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+            if part.rows == 0 and os.path.exists(part.path):
+                os.unlink(part.path)
+
+
+split_writers = {
+    "csv": CSVSplitWriter,
+    "libsvm": LibSVMSplitWriter,
+    "parquet": ParquetSplitWriter,
+}
+
+
+def open_split_writers(base_dir, output_format, suffix="", dmatrix_cache=False, parts=1):
+    """Opens one writer per split under `base_dir`.
+
+    With `dmatrix_cache`, each split is also saved as a binary DMatrix under
+    `{base_dir}/dmatrix/{split}/`. With several `parts`, each split is
+    written as that many `-part<i>` files of about equal size.
+    """
+    writer_cls = split_writers[output_format]
+
+    def open_writer(name, part_suffix):
+        writer = writer_cls(f"{base_dir}/{name}/{name}{part_suffix}.{writer_cls.extension}")
+        if dmatrix_cache:
+            cache_path = f"{base_dir}/dmatrix/{name}/{name}{part_suffix}.{DMatrixCacheWriter.extension}"
+            writer = TeeSplitWriter(writer, DMatrixCacheWriter(cache_path))
+        return writer
+
+    if parts == 1:
+        return {name: open_writer(name, suffix) for name in split_names}
+    return {
+        name: PartitionedSplitWriter([open_writer(name, f"{suffix}-part{i:03d}") for i in range(parts)])
+        for name in split_names
+    }
+
+
+def close_split_writers(writers):
+    """Closes the split writers, removing any split that received no rows."""
+    for writer in writers.values():
+        writer.close()
+        if writer.rows == 0 and os.path.exists(writer.path):
+            os.unlink(writer.path)
+    return {name: writer.rows for name, writer in writers.items()}
+
+
+def build_preprocessor(numeric_features, categorical_features):
+    """Builds the in-memory ColumnTransformer for the abalone features."""
     numeric_transformer = Pipeline(steps=[("imputer", SimpleImputer(strategy="median")), ("scaler", StandardScaler())])
 
-    categorical_features = ["sex"]
     categorical_transformer = Pipeline(
         steps=[
             ("imputer", SimpleImputer(strategy="constant", fill_value="missing")),
@@ -109,25 +533,1038 @@ if __name__ == "__main__":
         ]
     )
 
-    preprocess = ColumnTransformer(
+    return ColumnTransformer(
         transformers=[
             ("num", numeric_transformer, numeric_features),
             ("cat", categorical_transformer, categorical_features),
         ]
     )
 
+
+def read_input(path, chunk_size=None):
+    """Reads the headerless input CSV, optionally as an iterator of chunks.
+
+    Only the string columns are typed at parse time; the numeric ones are left
+    to inference so that a stray non-numeric value can be counted by
+    `conform_dtypes` instead of failing the whole read.
+    """
+    all_dtypes = merge_two_dicts(feature_columns_dtype, label_column_dtype)
+    return pd.read_csv(
+        path,
+        header=None,
+        names=feature_columns_names + [label_column],
+        dtype={c: dtype for c, dtype in all_dtypes.items() if dtype is str},
+        chunksize=chunk_size,
+    )
+
+
+def conform_dtypes(chunk, profile=None):
+    """Casts the numeric columns to float64, turning unparseable values into NaN.
+
+    The number of values lost that way is recorded in `profile` as dtype
+    violations of the column.
+    """
+    for c, dtype in merge_two_dicts(feature_columns_dtype, label_column_dtype).items():
+        if dtype is str or chunk[c].dtype == dtype:
+            continue
+        values = pd.to_numeric(chunk[c], errors="coerce")
+        if profile is not None:
+            profile.violations[c] += int((values.isna() & chunk[c].notna()).sum())
+        chunk[c] = values.astype(dtype)
+    return chunk
+
+
+class DataProfile:
+    """Mergeable profile of the raw input, updated chunk by chunk in the read loop.
+
+    Holds per-column null counts and dtype violations, min/max and quantile
+    sketches of the numeric columns and value counts of the string columns.
+    """
+
+    quantiles = [0.01, 0.25, 0.5, 0.75, 0.99]
+
+    def __init__(self, sketch_size=2048):
+        self.sketch_size = sketch_size
+        self.reset()
+
+    def reset(self):
+        all_dtypes = merge_two_dicts(feature_columns_dtype, label_column_dtype)
+        self.numeric_columns = [c for c, dtype in all_dtypes.items() if dtype is not str]
+        self.string_columns = [c for c, dtype in all_dtypes.items() if dtype is str]
+        self.rows = 0
+        self.nulls = dict.fromkeys(all_dtypes, 0)
+        self.violations = dict.fromkeys(all_dtypes, 0)
+        self.minimum = dict.fromkeys(self.numeric_columns, np.inf)
+        self.maximum = dict.fromkeys(self.numeric_columns, -np.inf)
+        self.sketches = {c: QuantileSketch(self.sketch_size) for c in self.numeric_columns}
+        self.value_counts = {c: collections.Counter() for c in self.string_columns}
+        return self
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        for c, count in chunk.isna().sum().items():
+            self.nulls[c] += int(count)
+        for c in self.numeric_columns:
+            values = chunk[c].to_numpy(dtype=np.float64)
+            if len(values) > self.nulls[c]:
+                self.minimum[c] = min(self.minimum[c], np.nanmin(values, initial=np.inf))
+                self.maximum[c] = max(self.maximum[c], np.nanmax(values, initial=-np.inf))
+            self.sketches[c].update(values)
+        for c in self.string_columns:
+            self.value_counts[c].update(chunk[c].value_counts().to_dict())
+
+    def merge(self, other):
+        self.rows += other.rows
+        for c in self.nulls:
+            self.nulls[c] += other.nulls[c]
+            self.violations[c] += other.violations[c]
+        for c in self.numeric_columns:
+            self.minimum[c] = min(self.minimum[c], other.minimum[c])
+            self.maximum[c] = max(self.maximum[c], other.maximum[c])
+            self.sketches[c].merge(other.sketches[c])
+        for c in self.string_columns:
+            self.value_counts[c].update(other.value_counts[c])
+        return self
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "nulls": self.nulls,
+            "violations": self.violations,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "sketches": {c: s.to_dict() for c, s in self.sketches.items()},
+            "value_counts": {c: dict(counts) for c, counts in self.value_counts.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        profile = cls()
+        profile.rows = state["rows"]
+        profile.nulls = dict(state["nulls"])
+        profile.violations = dict(state["violations"])
+        profile.minimum = dict(state["minimum"])
+        profile.maximum = dict(state["maximum"])
+        profile.sketches = {c: QuantileSketch.from_dict(s) for c, s in state["sketches"].items()}
+        profile.value_counts = {c: collections.Counter(counts) for c, counts in state["value_counts"].items()}
+        return profile
+
+    def report(self):
+        """Returns the profile as the statistics.json document."""
+        columns = {}
+        for c in self.nulls:
+            column = {
+                "null_count": self.nulls[c],
+                "null_fraction": self.nulls[c] / self.rows if self.rows else 0.0,
+                "dtype_violations": self.violations[c],
+            }
+            if c in self.sketches:
+                observed = self.rows > self.nulls[c]
+                column["min"] = float(self.minimum[c]) if observed else None
+                column["max"] = float(self.maximum[c]) if observed else None
+                column["quantiles"] = {
+                    f"p{round(q * 100):02d}": float(self.sketches[c].quantile(q)) if observed else None
+                    for q in self.quantiles
+                }
+            else:
+                column["cardinality"] = len(self.value_counts[c])
+                column["value_counts"] = dict(self.value_counts[c])
+            columns[c] = column
+        return {
+            "rows": self.rows,
+            "columns": columns,
+            "violations": {
+                "dtype": sum(self.violations.values()),
+                "null": sum(self.nulls.values()),
+            },
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def get_s3_client():
+    return boto3.client("s3")
+
+
+class S3RangeReader(io.RawIOBase):
+    """Reads an S3 object as a stream of concurrently fetched byte ranges.
+
+    Parts are fetched ahead of the reader on a thread pool, but only
+    `max_concurrency` of them are ever in flight or buffered: the next range is
+    requested when the reader consumes one, so memory stays bounded by
+    max_concurrency * part_size however slowly the parser goes.
+    """
+
+    def __init__(self, bucket, key, size, part_size=8 * 2**20, max_concurrency=8):
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.bytes_read = 0
+        self._part_size = part_size
+        self._offsets = iter(range(0, size, part_size))
+        self._executor = ThreadPoolExecutor(max_concurrency)
+        self._pending = collections.deque()
+        self._buffer = memoryview(b"")
+        self._start = time.perf_counter()
+        for _ in range(max_concurrency):
+            self._schedule()
+
+    def _schedule(self):
+        offset = next(self._offsets, None)
+        if offset is not None:
+            end = min(offset + self._part_size, self.size) - 1
+            self._pending.append(self._executor.submit(self._fetch, offset, end))
+
+    def _fetch(self, start, end):
+        response = get_s3_client().get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end}")
+        return response["Body"].read()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not len(self._buffer):
+            if not self._pending:
+                return 0
+            self._buffer = memoryview(self._pending.popleft().result())
+            self._schedule()
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        self.bytes_read += n
+        return n
+
+    @property
+    def throughput(self):
+        """Bytes read so far in MB/s."""
+        return self.bytes_read / 2**20 / max(time.perf_counter() - self._start, 1e-9)
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=False)
+            logger.info(
+                "Read %.1f MB from s3://%s/%s at %.1f MB/s.",
+                self.bytes_read / 2**20,
+                self.bucket,
+                self.key,
+                self.throughput,
+            )
+        super().close()
+
+
+class S3Source:
+    """An input object streamed from S3, decompressed by its .gz/.zst suffix."""
+
+    def __init__(self, bucket, key, size, part_size=8 * 2**20, max_concurrency=8, etag=None):
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+
+    def __repr__(self):
+        return f"S3Source(s3://{self.bucket}/{self.key})"
+
+    @contextlib.contextmanager
+    def open(self):
+        reader = S3RangeReader(self.bucket, self.key, self.size, self.part_size, self.max_concurrency)
+        with io.BufferedReader(reader, buffer_size=self.part_size) as raw:
+            if self.key.endswith(".gz"):
+                with gzip.GzipFile(fileobj=raw) as f:
+                    yield f
+            elif self.key.endswith(".zst"):
+                import zstandard
+
+                with zstandard.ZstdDecompressor().stream_reader(raw) as f:
+                    yield f
+            else:
+                yield raw
+
+
+def list_s3_sources(uri, part_size=8 * 2**20, max_concurrency=8):
+    """Lists the objects of an S3 URI, in key order.
+
+    A URI naming an object is that object alone, not its siblings sharing the
+    key as a prefix (e.g. a `.bak` copy); any other URI is a prefix, ending in
+    "/", of the objects under it.
+    """
+    bucket, _, key = uri[len("s3://") :].partition("/")
+    prefix = key if not key or key.endswith("/") else f"{key}/"
+    sources = []
+    for page in get_s3_client().get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=key):
+        for obj in page.get("Contents", []):
+            if obj["Key"] == key and not key.endswith("/"):
+                # listed first, as no other key under the prefix sorts before it
+                if not obj["Size"]:
+                    return []
+                return [S3Source(bucket, key, obj["Size"], part_size, max_concurrency, obj["ETag"])]
+            if obj["Key"].startswith(prefix) and not obj["Key"].endswith("/") and obj["Size"] > 0:
+                sources.append(S3Source(bucket, obj["Key"], obj["Size"], part_size, max_concurrency, obj["ETag"]))
+    return sorted(sources, key=lambda source: source.key)
+
+
+@contextlib.contextmanager
+def open_input(source):
+    """Opens an input for pandas: S3 objects are streamed, local paths passed through."""
+    if isinstance(source, S3Source):
+        with source.open() as f:
+            yield f
+    else:
+        yield source
+
+
+def read_input_chunks(sources, chunk_size=None, profile=None):
+    """Yields chunks of at most `chunk_size` rows (or whole inputs) from each input in turn.
+
+    When a DataProfile is passed, every chunk is profiled as it is read, so
+    profiling costs no extra pass over the data.
+    """
+    for source in sources:
+        with open_input(source) as f:
+            chunks = read_input(f, chunk_size) if chunk_size else [read_input(f)]
+            for chunk in chunks:
+                chunk = conform_dtypes(chunk, profile)
+                if profile is not None:
+                    profile.update(chunk)
+                yield chunk
+
+
+def fingerprint_sources(sources):
+    """Hashes the input contents: S3 ETags and sizes, or the bytes of local files."""
+    digest = hashlib.sha256()
+    for source in sources:
+        if isinstance(source, S3Source):
+            digest.update(f"{source.key}:{source.etag}:{source.size}\n".encode())
+        else:
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(2**20), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def compute_cache_key(sources, definition):
+    """Keys the outputs by input contents, transform definition and this script's code."""
+    digest = hashlib.sha256()
+    digest.update(fingerprint_sources(sources).encode())
+    digest.update(json.dumps(definition, sort_keys=True).encode())
+    digest.update(pathlib.Path(__file__).read_bytes())
+    return digest.hexdigest()[:32]
+
+
+class PreprocessCache:
+    """Outputs of previous runs stored under `{uri}/{cache_key}/`.
+
+    Every host uploads the files it wrote followed by a `_SUCCESS/<host>`
+    marker, and the first host records the host list in `manifest.json`; an
+    entry is only reused once all hosts of the run that wrote it have finished.
+    """
+
+    output_dirs = split_names + ["dmatrix", "preprocessor", "statistics"]
+
+    def __init__(self, uri, cache_key):
+        bucket, _, prefix = uri[len("s3://") :].rstrip("/").partition("/")
+        self.bucket = bucket
+        self.prefix = f"{prefix}/{cache_key}".lstrip("/")
+
+    def is_complete(self):
+        s3 = get_s3_client()
+        try:
+            manifest = json.loads(s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}/manifest.json")["Body"].read())
+        except s3.exceptions.NoSuchKey:
+            return False
+        response = s3.list_objects_v2(Bucket=self.bucket, Prefix=f"{self.prefix}/_SUCCESS/")
+        finished = {obj["Key"].rsplit("/", 1)[1] for obj in response.get("Contents", [])}
+        return set(manifest["hosts"]) <= finished
+
+    def restore(self, base_dir):
+        """Downloads the cached outputs into the local output directories."""
+        s3 = get_s3_client()
+        for output_dir in self.output_dirs:
+            prefix = f"{self.prefix}/{output_dir}/"
+            for page in s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    path = pathlib.Path(base_dir, output_dir, obj["Key"][len(prefix) :])
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    s3.download_file(self.bucket, obj["Key"], str(path))
+
+    def store(self, base_dir, current_host, hosts):
+        """Uploads the outputs this host wrote and marks it finished."""
+        s3 = get_s3_client()
+        if current_host == hosts[0]:
+            s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}/manifest.json", Body=json.dumps({"hosts": hosts}))
+        for output_dir in self.output_dirs:
+            for path in pathlib.Path(base_dir, output_dir).rglob("*"):
+                if path.is_file():
+                    key = f"{self.prefix}/{path.relative_to(base_dir).as_posix()}"
+                    s3.upload_file(str(path), self.bucket, key)
+        s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}/_SUCCESS/{current_host}", Body=b"")
+
+
+def list_input_files(input_dir):
+    """Lists the input objects copied to `input_dir` (or the single file it names), in key order."""
+    if pathlib.Path(input_dir).is_file():
+        return [str(input_dir)]
+    return sorted(str(p) for p in pathlib.Path(input_dir).rglob("*") if p.is_file())
+
+
+def get_cluster_config(resource_config="/opt/ml/config/resourceconfig.json"):
+    """Returns the current host and all hosts of the processing job."""
+    try:
+        with open(resource_config) as f:
+            config = json.load(f)
+        return config["current_host"], sorted(config["hosts"])
+    except FileNotFoundError:
+        return "algo-1", ["algo-1"]
+
+
+def split_indices(n, seed=None, stratify=None):
+    """Draws the train/validation/test row indices from a seeded permutation.
+
+    Args:
+        n: number of rows
+        seed: seed of the permutation; None draws a fresh one
+        stratify: optional per-row class labels; each class is then split with
+            the same 70/15/15 proportions
+
+    Returns:
+        a list with the row indices of each split, in shuffled order
+    """
+    rng = np.random.default_rng(seed)
+    if stratify is None:
+        permutation = rng.permutation(n)
+        return np.split(permutation, (np.cumsum(split_fractions)[:-1] * n).astype(int))
+
+    parts = [[] for _ in split_names]
+    _, classes = np.unique(stratify, return_inverse=True)
+    order = np.argsort(classes, kind="stable")
+    boundaries = np.flatnonzero(np.diff(classes[order])) + 1
+    for members in np.split(order, boundaries):
+        members = rng.permutation(members)
+        cuts = np.round(np.cumsum(split_fractions)[:-1] * len(members)).astype(int)
+        for part, indices in zip(parts, np.split(members, cuts)):
+            part.append(indices)
+    return [rng.permutation(np.concatenate(part)) for part in parts]
+
+
+def write_split_rows(writer, y, X, indices, chunk_size=100_000):
+    """Writes the label and feature rows at `indices`, gathering one chunk at a time."""
+    for offset in range(0, len(indices), chunk_size):
+        rows_index = indices[offset : offset + chunk_size]
+        rows = np.empty((len(rows_index), X.shape[1] + 1))
+        rows[:, 0] = y[rows_index]
+        np.take(X, rows_index, axis=0, out=rows[:, 1:])
+        writer.write(rows)
+
+
+def preprocess_in_memory(
+    sources,
+    base_dir,
+    numeric_features,
+    categorical_features,
+    output_format="csv",
+    seed=None,
+    stratify=False,
+    profile=None,
+    dmatrix_cache=False,
+    split_parts=1,
+):
+    """Fits and applies the transforms on the whole dataset at once.
+
+    The splits are written straight from the transformed matrix through a
+    permutation index, without materialising a shuffled copy of it.
+
+    Returns:
+        the fitted transforms as a StreamingPreprocessor
+    """
+    df = pd.concat(read_input_chunks(sources, profile=profile), ignore_index=True)
+    preprocess = build_preprocessor(numeric_features, categorical_features)
+
     logger.info("Applying transforms.")
-    y = df.pop("rings")
+    y = df.pop("rings").to_numpy()
     X_pre = preprocess.fit_transform(df)
-    y_pre = y.to_numpy().reshape(len(y), 1)
+    del df
+    fitted = StreamingPreprocessor.from_column_transformer(preprocess, numeric_features, categorical_features)
+
+    logger.info("Splitting %d rows of data into train, validation, test datasets.", len(y))
+    splits = split_indices(len(y), seed, y if stratify else None)
+
+    logger.info("Writing out %s datasets to %s.", output_format, base_dir)
+    writers = open_split_writers(base_dir, output_format, dmatrix_cache=dmatrix_cache, parts=split_parts)
+    try:
+        for name, indices in zip(split_names, splits):
+            write_split_rows(writers[name], y, X_pre, indices)
+    finally:
+        close_split_writers(writers)
+    return fitted
+
+
+def fit_streaming(sources, numeric_features, categorical_features, chunk_size, profile=None):
+    """First pass: accumulates the transform statistics (and the profile) over chunks of the input."""
+    logger.info("Fitting transforms over %d file(s) in chunks of %d rows.", len(sources), chunk_size)
+    preprocess = StreamingPreprocessor(numeric_features, categorical_features)
+    for chunk in read_input_chunks(sources, chunk_size, profile):
+        preprocess.partial_fit(chunk)
+    return preprocess
+
+
+def write_splits(
+    sources,
+    base_dir,
+    preprocess,
+    chunk_size,
+    seed=None,
+    suffix="",
+    output_format="csv",
+    stable=False,
+    dmatrix_cache=False,
+    split_parts=1,
+    rows=None,
+):
+    """Second pass: transforms the input chunk by chunk and appends it to the splits.
+
+    Given the `rows` counted by the first pass, the splits get exactly the sizes
+    the in-memory path cuts: each chunk draws how many of its rows go to each split
+    from the rows still unassigned (a multivariate hypergeometric draw), so peak
+    memory stays bounded by `chunk_size`. Otherwise each row is drawn on its own
+    and the sizes only approximate 70/15/15. With `stable`, that draw is a hash of
+    the row's contents, so a row lands in the same split whichever run processes it.
+    """
+    logger.info("Applying transforms and writing out datasets to %s.", base_dir)
+    rng = np.random.default_rng(seed)
+    thresholds = np.cumsum(split_fractions)[:-1]
+    remaining = None
+    if rows is not None and not stable:
+        remaining = np.diff([0, *(thresholds * rows).astype(int), rows])
+    writers = open_split_writers(base_dir, output_format, suffix, dmatrix_cache, split_parts)
+    try:
+        for chunk in read_input_chunks(sources, chunk_size):
+            if remaining is not None:
+                counts = rng.multivariate_hypergeometric(remaining, len(chunk))
+                remaining -= counts
+                assignment = rng.permutation(np.repeat(np.arange(len(split_names)), counts))
+            else:
+                if stable:
+                    draws = pd.util.hash_pandas_object(chunk, index=False).to_numpy() / 2.0**64
+                else:
+                    draws = rng.random(len(chunk))
+                assignment = np.searchsorted(thresholds, draws, side="right")
+            y = chunk.pop("rings").to_numpy().reshape(len(chunk), 1)
+            X = np.concatenate((y, preprocess.transform(chunk)), axis=1)
+            for i, name in enumerate(split_names):
+                rows = X[assignment == i]
+                if len(rows):
+                    writers[name].write(rows)
+    finally:
+        counts = close_split_writers(writers)
+    logger.info("Split rows: %s", counts)
+
+
+def preprocess_streaming(
+    sources,
+    base_dir,
+    numeric_features,
+    categorical_features,
+    chunk_size,
+    seed=None,
+    output_format="csv",
+    profile=None,
+    dmatrix_cache=False,
+    split_parts=1,
+):
+    """Fits and applies the transforms in two passes over fixed-size chunks."""
+    preprocess = fit_streaming(sources, numeric_features, categorical_features, chunk_size, profile).finalize()
+    write_splits(
+        sources,
+        base_dir,
+        preprocess,
+        chunk_size,
+        seed,
+        output_format=output_format,
+        dmatrix_cache=dmatrix_cache,
+        split_parts=split_parts,
+        rows=preprocess.rows,
+    )
+    return preprocess
+
+
+class IncrementalState:
+    """State of the incremental mode, kept under an S3 prefix.
+
+    `{uri}/state.json` holds the cumulative statistics, the parameters the
+    existing shards were transformed with, the fingerprints of the inputs
+    already processed and the range of batches whose shards are live;
+    `{uri}/<split>/` and `{uri}/dmatrix/<split>/` hold the shards themselves,
+    named with their batch number.
+    """
+
+    def __init__(self, uri):
+        bucket, _, prefix = uri[len("s3://") :].rstrip("/").partition("/")
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def load(self):
+        s3 = get_s3_client()
+        try:
+            return json.loads(s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}/state.json")["Body"].read())
+        except s3.exceptions.NoSuchKey:
+            return None
+
+    def save(self, state):
+        get_s3_client().put_object(Bucket=self.bucket, Key=f"{self.prefix}/state.json", Body=json.dumps(state))
+
+    def upload_splits(self, base_dir):
+        """Uploads the shards written under `base_dir`, ahead of saving the state that lists them."""
+        s3 = get_s3_client()
+        for name in split_names + [f"dmatrix/{name}" for name in split_names]:
+            for path in sorted(pathlib.Path(base_dir, name).glob("*")):
+                if path.is_file():
+                    s3.upload_file(str(path), self.bucket, f"{self.prefix}/{name}/{path.name}")
+
+    def delete_splits(self, live_batches):
+        """Deletes the shards of every batch outside `live_batches`.
+
+        Removes the shards a refit superseded as well as those a failed run
+        uploaded without getting to save its state.
+        """
+        s3 = get_s3_client()
+        for name in split_names + [f"dmatrix/{name}" for name in split_names]:
+            pages = s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/{name}/")
+            for page in pages:
+                objects = [
+                    {"Key": obj["Key"]}
+                    for obj in page.get("Contents", [])
+                    if shard_batch(obj["Key"]) not in live_batches
+                ]
+                if objects:
+                    s3.delete_objects(Bucket=self.bucket, Delete={"Objects": objects})
+
+
+def shard_batch(key):
+    """Batch number of an incremental shard, from its `-<batch>` or `-<batch>-part<i>` suffix."""
+    stem = key.rsplit("/", 1)[-1].split(".", 1)[0]
+    match = re.search(r"-(\d{5})(?:-part\d{3})?$", stem)
+    return int(match.group(1)) if match else None
+
+
+def source_name(source):
+    return source.key if isinstance(source, S3Source) else str(source)
+
+
+def transform_drift(fitted, candidate):
+    """Largest shift between two fitted transforms, in units of the fitted scale.
+
+    New categories cannot be absorbed without changing the feature layout, so
+    they count as infinite drift.
+    """
+    for old, new in zip(fitted.categories_, candidate.categories_):
+        if set(new) - set(old):
+            return np.inf
+    return max(
+        np.max(np.abs(candidate.mean_ - fitted.mean_) / fitted.scale_),
+        np.max(np.abs(candidate.median_ - fitted.median_) / fitted.scale_),
+        np.max(np.abs(np.log(candidate.scale_ / fitted.scale_))),
+    )
+
+
+def preprocess_incremental(
+    sources,
+    base_dir,
+    numeric_features,
+    categorical_features,
+    chunk_size,
+    state_store,
+    refit_threshold=0.1,
+    output_format="csv",
+    refit=False,
+    profile=None,
+    dmatrix_cache=False,
+    split_parts=1,
+):
+    """Transforms only the inputs that arrived since the last run.
+
+    New inputs are folded into the cumulative statistics, but transformed with
+    the parameters of the existing shards so all shards stay consistent, and
+    split by row hash. The whole history is refit and rewritten when asked to,
+    when a previously processed input changed, or when the statistics drift
+    further than `refit_threshold` from the parameters in use.
+
+    Every run writes a new batch of shards and uploads it before saving the
+    state that lists it; the shards a refit supersedes are only deleted after
+    that. A run failing at any point thus leaves the previous state and its
+    shards in place, and the next run deletes whatever it left behind.
+
+    Returns:
+        the fitted transforms the written shards were produced with
+    """
+    state = state_store.load()
+    live_batches = range(state.get("first_batch", 0), state["batch"] + 1) if state else range(0)
+    state_store.delete_splits(live_batches)
+    fingerprints = {source_name(source): fingerprint_sources([source]) for source in sources}
+    definition = {
+        "numeric_features": list(numeric_features),
+        "categorical_features": list(categorical_features),
+        "output_format": output_format,
+        "dmatrix_cache": dmatrix_cache,
+        "split_parts": split_parts,
+    }
+
+    if refit or state is None or state["definition"] != definition:
+        reason = "requested" if refit else "no compatible state"
+        refit = True
+    elif any(fingerprints.get(name, fp) != fp for name, fp in state["processed"].items()):
+        reason = "processed inputs changed"
+        refit = True
+
+    if not refit:
+        new_sources = [source for source in sources if source_name(source) not in state["processed"]]
+        fitted = StreamingPreprocessor.from_fitted_params(state["fitted"])
+        if not new_sources:
+            logger.info("No new inputs since the last run.")
+            return fitted
+        statistics = StreamingPreprocessor.from_dict(state["statistics"])
+        statistics.merge(fit_streaming(new_sources, numeric_features, categorical_features, chunk_size, profile))
+        drift = transform_drift(fitted, StreamingPreprocessor.from_dict(statistics.to_dict()).finalize())
+        logger.info("Statistics drift after %d new input(s): %.4f", len(new_sources), drift)
+        if drift > refit_threshold:
+            reason = f"drift {drift:.4f} above {refit_threshold}"
+            refit = True
+
+    # a refit writes a fresh batch too: the shards it supersedes stay live until its state is saved
+    batch = 0 if state is None else state["batch"] + 1
+    if refit:
+        logger.info("Refitting over all %d input(s): %s.", len(sources), reason)
+        if profile is not None:
+            profile.reset()
+        statistics = fit_streaming(sources, numeric_features, categorical_features, chunk_size, profile)
+        fitted = StreamingPreprocessor.from_dict(statistics.to_dict()).finalize()
+        new_sources = sources
+        first_batch = batch
+    else:
+        first_batch = state.get("first_batch", 0)
+
+    suffix = f"-{batch:05d}"
+    write_splits(
+        new_sources,
+        base_dir,
+        fitted,
+        chunk_size,
+        suffix=suffix,
+        output_format=output_format,
+        stable=True,
+        dmatrix_cache=dmatrix_cache,
+        split_parts=split_parts,
+    )
+    state_store.upload_splits(base_dir)
+    processed = {} if refit else dict(state["processed"])
+    processed.update({source_name(source): fingerprints[source_name(source)] for source in new_sources})
+    state_store.save(
+        {
+            "definition": definition,
+            "first_batch": first_batch,
+            "batch": batch,
+            "processed": processed,
+            "statistics": statistics.to_dict(),
+            "fitted": fitted.fitted_params(),
+        }
+    )
+    if refit:
+        state_store.delete_splits(range(first_batch, batch + 1))
+    return fitted
+
+
+def exchange_statistics(preprocess, current_host, hosts, address, authkey, timeout=3600, profile=None):
+    """Merges the partial statistics of every instance into the global fit.
+
+    The first host gathers the partial statistics of all the others over
+    `address`, merges them in host order and sends the merged statistics back,
+    so every instance finalizes and applies identical transforms. The data
+    profiles of the other hosts are merged into the first host's `profile`.
+    Every host gives up after `timeout` seconds without the others.
+
+    Returns:
+        The finalized StreamingPreprocessor fitted on the data of all hosts.
+
+    Raises:
+        TimeoutError: on the first host, naming the hosts that did not report in time
+    """
+    if len(hosts) == 1:
+        return preprocess.finalize()
+
+    deadline = time.monotonic() + timeout
+    if current_host == hosts[0]:
+        connections, partials = {}, {}
+        with Listener(("", address[1]), authkey=authkey) as listener, contextlib.ExitStack() as stack:
+            while len(connections) < len(hosts) - 1:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise TimeoutError
+                    # Listener.accept has no timeout of its own
+                    listener._listener._socket.settimeout(remaining)
+                    conn = stack.enter_context(listener.accept())
+                except TimeoutError:
+                    missing = [host for host in hosts[1:] if host not in connections]
+                    raise TimeoutError(
+                        f"{', '.join(missing)} did not report partial statistics within {timeout} seconds"
+                    ) from None
+                host, state, profile_state = conn.recv()
+                connections[host] = conn
+                partials[host] = (StreamingPreprocessor.from_dict(state), profile_state)
+            for host in hosts[1:]:
+                partial, profile_state = partials[host]
+                preprocess.merge(partial)
+                if profile is not None and profile_state is not None:
+                    profile.merge(DataProfile.from_dict(profile_state))
+            state = preprocess.to_dict()
+            for conn in connections.values():
+                conn.send(state)
+        logger.info("Merged partial statistics from %d hosts.", len(hosts))
+        return preprocess.finalize()
+
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+    with conn:
+        conn.send((current_host, preprocess.to_dict(), None if profile is None else profile.to_dict()))
+        state = conn.recv()
+    logger.info("Received merged statistics from %s.", hosts[0])
+    return StreamingPreprocessor.from_dict(state).finalize()
+
+
+def preprocess_sharded(
+    sources,
+    base_dir,
+    numeric_features,
+    categorical_features,
+    chunk_size,
+    current_host,
+    hosts,
+    address,
+    authkey,
+    seed=None,
+    output_format="csv",
+    profile=None,
+    dmatrix_cache=False,
+    split_parts=1,
+):
+    """Runs one instance of the multi-instance preprocessing.
+
+    Each instance fits partial statistics over its own shard of the input, the
+    statistics are merged across instances and every instance then transforms
+    its shard with the global fit, writing host-suffixed split files.
+    """
+    preprocess = fit_streaming(sources, numeric_features, categorical_features, chunk_size, profile)
+    rows = preprocess.rows
+    preprocess = exchange_statistics(preprocess, current_host, hosts, address, authkey, profile=profile)
+    shard_seed = None if seed is None else [seed, hosts.index(current_host)]
+    suffix = f"-{current_host}" if len(hosts) > 1 else ""
+    write_splits(
+        sources,
+        base_dir,
+        preprocess,
+        chunk_size,
+        shard_seed,
+        suffix,
+        output_format,
+        dmatrix_cache=dmatrix_cache,
+        split_parts=split_parts,
+        rows=rows,
+    )
+    return preprocess
+
+
+if __name__ == "__main__":
+    logger.debug("Starting preprocessing.")
+    parser = argparse.ArgumentParser()
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument(
+        "--input-data",
+        type=str,
+        help="S3 URI of the input object or prefix, streamed without a local copy (or a local file or directory).",
+    )
+    input_group.add_argument(
+        "--input-dir", type=str, help="Local directory holding this instance's shard of the input objects."
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=0,
+        help="Rows per chunk for the out-of-core two-pass mode; 0 processes the data in memory.",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--stratify", action="store_true", help="Stratify the splits on rings (in-memory mode only)."
+    )
+    parser.add_argument("--output-format", type=str, default="csv", choices=sorted(split_writers))
+    parser.add_argument(
+        "--dmatrix-cache",
+        action="store_true",
+        help="Also save each split as a binary XGBoost DMatrix under /opt/ml/processing/dmatrix.",
+    )
+    parser.add_argument(
+        "--split-parts",
+        type=int,
+        default=1,
+        help="Files each split is spread over, e.g. one per training instance reading it ShardedByS3Key.",
+    )
+    parser.add_argument("--coordinator-port", type=int, default=7701)
+    parser.add_argument("--s3-part-size-mb", type=int, default=8)
+    parser.add_argument("--s3-max-concurrency", type=int, default=8)
+    parser.add_argument(
+        "--incremental-uri",
+        type=str,
+        default=None,
+        help="S3 URI of the incremental state and split prefixes; only inputs not yet processed are transformed.",
+    )
+    parser.add_argument("--refit-threshold", type=float, default=0.1)
+    parser.add_argument("--refit", action="store_true", help="Refit and rewrite the incremental history.")
+    parser.add_argument(
+        "--cache-uri",
+        type=str,
+        default=None,
+        help="S3 URI under which outputs are cached by input and transform hash; reused when the hash matches.",
+    )
+    parser.add_argument(
+        "--input-fingerprint",
+        type=str,
+        default="",
+        help="Fingerprint of the --input-data objects the pipeline keyed this step's cache with.",
+    )
+    args = parser.parse_args()
+
+    # the local pipeline runner points this at a per-job directory
+    base_dir = os.environ.get("PROCESSING_DIR", "/opt/ml/processing")
+    for name in split_names:
+        pathlib.Path(f"{base_dir}/{name}").mkdir(parents=True, exist_ok=True)
+
+    current_host, hosts = get_cluster_config()
+    if args.input_dir:
+        sources = list_input_files(args.input_dir)
+        logger.info("Reading %d input file(s) from %s.", len(sources), args.input_dir)
+    elif not args.input_data.startswith("s3://"):
+        # S3 paths mapped to a local directory by the local pipeline runner
+        sources = list_input_files(args.input_data)
+        logger.info("Reading %d local input file(s) from %s.", len(sources), args.input_data)
+    else:
+        logger.info("input_data: %s", args.input_data)
+        sources = list_s3_sources(args.input_data, args.s3_part_size_mb * 2**20, args.s3_max_concurrency)
+        if args.input_fingerprint and args.input_fingerprint != fingerprint_sources(sources):
+            logger.warning("The input changed after the pipeline fingerprinted it; a rerun will not reuse this step.")
+
+    logger.debug("Defining transformers.")
+    numeric_features = list(feature_columns_names)
+    numeric_features.remove("sex")
+    categorical_features = ["sex"]
+
+    definition = {
+        "numeric_features": numeric_features,
+        "categorical_features": categorical_features,
+        "split_fractions": split_fractions,
+        "output_format": args.output_format,
+        "dmatrix_cache": args.dmatrix_cache,
+        "split_parts": args.split_parts,
+        "chunk_size": args.chunk_size,
+        "seed": args.seed,
+        "stratify": args.stratify,
+        "hosts": len(hosts),
+    }
+    cache_key = compute_cache_key(sources, definition)
+    logger.info("Cache key: %s", cache_key)
+    cache = None
+    if args.cache_uri and args.input_dir and len(hosts) > 1:
+        logger.warning("Caching needs the whole input listing; disabled for sharded --input-dir runs.")
+    elif args.cache_uri and not args.cache_uri.startswith("s3://"):
+        logger.info("Caching needs an S3 --cache-uri; disabled for %s.", args.cache_uri)
+    elif args.cache_uri:
+        cache = PreprocessCache(args.cache_uri, cache_key)
 
-    X = np.concatenate((y_pre, X_pre), axis=1)
+    if args.input_data:
+        # Same assignment as ShardedByS3Key: each host streams its own subset of the objects.
+        sources = sources[hosts.index(current_host) :: len(hosts)]
+        logger.info("Streaming %d object(s): %s", len(sources), sources)
 
-    logger.info("Splitting %d rows of data into train, validation, test datasets.", len(X))
-    np.random.shuffle(X)
-    train, validation, test = np.split(X, [int(0.7 * len(X)), int(0.85 * len(X))])
+    profile = DataProfile()
+    if args.incremental_uri:
+        if not args.incremental_uri.startswith("s3://"):
+            raise ValueError("Incremental preprocessing keeps its state under an S3 --incremental-uri.")
+        if len(hosts) > 1:
+            raise ValueError("Incremental preprocessing runs on a single instance.")
+        preprocess = preprocess_incremental(
+            sources,
+            base_dir,
+            numeric_features,
+            categorical_features,
+            args.chunk_size or 100_000,
+            IncrementalState(args.incremental_uri),
+            args.refit_threshold,
+            args.output_format,
+            args.refit,
+            profile,
+            args.dmatrix_cache,
+            args.split_parts,
+        )
+        save_preprocessor(preprocess, f"{base_dir}/preprocessor/preprocessor.json", cache_key)
+        save_statistics(profile, f"{base_dir}/statistics/statistics.json")
+    elif cache is not None and cache.is_complete():
+        logger.info("Inputs and transforms unchanged; reusing cached outputs from %s.", args.cache_uri)
+        if current_host == hosts[0]:
+            cache.restore(base_dir)
+    else:
+        if len(hosts) > 1:
+            chunk_size = args.chunk_size or 100_000
+            logger.info("Running as %s of %d hosts.", current_host, len(hosts))
+            preprocess = preprocess_sharded(
+                sources,
+                base_dir,
+                numeric_features,
+                categorical_features,
+                chunk_size,
+                current_host,
+                hosts,
+                (hosts[0], args.coordinator_port),
+                authkey=b"abalone-preprocessing",
+                seed=args.seed,
+                output_format=args.output_format,
+                profile=profile,
+                dmatrix_cache=args.dmatrix_cache,
+                split_parts=args.split_parts,
+            )
+        elif args.chunk_size > 0:
+            preprocess = preprocess_streaming(
+                sources,
+                base_dir,
+                numeric_features,
+                categorical_features,
+                args.chunk_size,
+                args.seed,
+                args.output_format,
+                profile,
+                args.dmatrix_cache,
+                args.split_parts,
+            )
+        else:
+            preprocess = preprocess_in_memory(
+                sources,
+                base_dir,
+                numeric_features,
+                categorical_features,
+                args.output_format,
+                args.seed,
+                args.stratify,
+                profile,
+                args.dmatrix_cache,
+                args.split_parts,
+            )
 
-    logger.info("Writing out datasets to %s.", base_dir)
-    pd.DataFrame(train).to_csv(f"{base_dir}/train/train.csv", header=False, index=False)
-    pd.DataFrame(validation).to_csv(f"{base_dir}/validation/validation.csv", header=False, index=False)
-    pd.DataFrame(test).to_csv(f"{base_dir}/test/test.csv", header=False, index=False)
+        if current_host == hosts[0]:
+            save_preprocessor(preprocess, f"{base_dir}/preprocessor/preprocessor.json", cache_key)
+            save_statistics(profile, f"{base_dir}/statistics/statistics.json")
+        if cache is not None:
+            cache.store(base_dir, current_host, hosts)
@@ -0,0 +1,452 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Tests for the abalone preprocessing script."""
+import gzip
+import importlib.util
+import multiprocessing
+import pathlib
+import socket
+
+import boto3
+import numpy as np
+import pandas as pd
+import pytest
+import zstandard
+
+from moto import mock_aws
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parents[1]
+DATASET = SCRIPT_DIR.parents[2] / "ml_pipelines" / "data" / "abalone-dataset.csv"
+
+spec = importlib.util.spec_from_file_location("prepare_abalone_data", SCRIPT_DIR / "main.py")
+main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(main)
+
+NUMERIC_FEATURES = [c for c in main.feature_columns_names if c != "sex"]
+CATEGORICAL_FEATURES = ["sex"]
+
+
+@pytest.fixture
+def input_csv(tmp_path):
+    """The abalone dataset with some missing values punched in."""
+    df = pd.read_csv(DATASET, header=None)
+    rng = np.random.default_rng(0)
+    for col in range(df.shape[1] - 1):
+        df.loc[rng.random(len(df)) < 0.02, col] = np.nan
+    path = tmp_path / "abalone-dataset.csv"
+    df.to_csv(path, header=False, index=False)
+    return path
+
+
+@pytest.fixture
+def base_dir(tmp_path):
+    for name in main.split_names:
+        (tmp_path / "out" / name).mkdir(parents=True)
+    return tmp_path / "out"
+
+
+def read_splits(base_dir):
+    return np.concatenate(
+        [pd.read_csv(base_dir / name / f"{name}.csv", header=None).to_numpy() for name in main.split_names]
+    )
+
+
+def sort_rows(X):
+    return X[np.lexsort(X.T[::-1])]
+
+
+def test_running_stats_merge_matches_numpy():
+    values = np.random.default_rng(1).normal(3.0, 2.0, 10_001)
+    stats = main.RunningStats()
+    for part in np.array_split(values, 7):
+        stats.update(part)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(values.mean())
+    assert stats.variance == pytest.approx(values.var())
+
+
+def test_quantile_sketch_approximates_median():
+    values = np.random.default_rng(2).lognormal(size=200_000)
+    left, right = main.QuantileSketch(k=1024, seed=0), main.QuantileSketch(k=1024, seed=1)
+    left.update(values[:120_000])
+    right.update(values[120_000:])
+    left.merge(right)
+    rank = np.searchsorted(np.sort(values), left.quantile(0.5)) / len(values)
+    assert abs(rank - 0.5) < 0.01
+
+
+def test_streaming_matches_in_memory(input_csv, base_dir):
+    main.preprocess_streaming([input_csv], base_dir, NUMERIC_FEATURES, CATEGORICAL_FEATURES, chunk_size=500, seed=0)
+    streamed = read_splits(base_dir)
+
+    df = main.read_input(input_csv)
+    y = df.pop("rings").to_numpy().reshape(-1, 1)
+    expected = np.concatenate(
+        (y, main.build_preprocessor(NUMERIC_FEATURES, CATEGORICAL_FEATURES).fit_transform(df)), axis=1
+    )
+
+    assert streamed.shape == expected.shape
+    np.testing.assert_allclose(sort_rows(streamed), sort_rows(expected), rtol=1e-9, atol=1e-12)
+
+
+def test_streaming_split_sizes_match_in_memory(input_csv, base_dir, tmp_path):
+    rows = len(pd.read_csv(input_csv, header=None))
+    main.preprocess_streaming([input_csv], base_dir, NUMERIC_FEATURES, CATEGORICAL_FEATURES, chunk_size=300, seed=3)
+    sizes = [len(pd.read_csv(base_dir / name / f"{name}.csv", header=None)) for name in main.split_names]
+    assert sizes == [len(indices) for indices in main.split_indices(rows, seed=3)]
+
+    # the row-hash assignment of the incremental mode only approximates the proportions, within 2 points here
+    preprocess = main.fit_streaming([input_csv], NUMERIC_FEATURES, CATEGORICAL_FEATURES, 300).finalize()
+    for name in main.split_names:
+        (tmp_path / "stable" / name).mkdir(parents=True)
+    main.write_splits([input_csv], tmp_path / "stable", preprocess, 300, stable=True)
+    sizes = [len(pd.read_csv(tmp_path / "stable" / name / f"{name}.csv", header=None)) for name in main.split_names]
+    assert [size / rows for size in sizes] == pytest.approx(main.split_fractions, abs=0.02)
+
+
+def test_sharded_instances_match_in_memory(input_csv, base_dir, tmp_path):
+    """Runs the multi-instance protocol with one local process per instance."""
+    df = pd.read_csv(input_csv, header=None)
+    shard_files = []
+    for i, rows in enumerate(np.array_split(np.arange(len(df)), 6)):
+        part = df.iloc[rows]
+        path = tmp_path / f"part-{i}.csv"
+        part.to_csv(path, header=False, index=False)
+        shard_files.append(str(path))
+
+    hosts = ["algo-1", "algo-2", "algo-3"]
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        port = s.getsockname()[1]
+    ctx = multiprocessing.get_context("fork")
+    instances = [
+        ctx.Process(
+            target=main.preprocess_sharded,
+            args=(shard_files[i :: len(hosts)], base_dir, NUMERIC_FEATURES, CATEGORICAL_FEATURES, 300, host, hosts),
+            kwargs={"address": ("localhost", port), "authkey": b"test", "seed": 0},
+        )
+        for i, host in enumerate(hosts)
+    ]
+    for p in instances:
+        p.start()
+    for p in instances:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+
+    sharded = np.concatenate([pd.read_csv(f, header=None).to_numpy() for f in sorted(base_dir.rglob("*.csv"))])
+    assert {f.name for f in (base_dir / "train").iterdir()} == {f"train-{host}.csv" for host in hosts}
+
+    df = main.read_input(input_csv)
+    y = df.pop("rings").to_numpy().reshape(-1, 1)
+    expected = np.concatenate(
+        (y, main.build_preprocessor(NUMERIC_FEATURES, CATEGORICAL_FEATURES).fit_transform(df)), axis=1
+    )
+    np.testing.assert_allclose(sort_rows(sharded), sort_rows(expected), rtol=1e-9, atol=1e-12)
+
+
+def test_first_host_names_the_hosts_that_never_reported(input_csv):
+    preprocess = main.fit_streaming([str(input_csv)], NUMERIC_FEATURES, CATEGORICAL_FEATURES, 300)
+    hosts = ["algo-1", "algo-2", "algo-10"]
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        port = s.getsockname()[1]
+    address = ("localhost", port)
+    ctx = multiprocessing.get_context("fork")
+    # only algo-10 reports; algo-2 died before connecting
+    reporter = ctx.Process(
+        target=main.exchange_statistics, args=(preprocess, "algo-10", hosts, address, b"test"), kwargs={"timeout": 5}
+    )
+    reporter.start()
+
+    with pytest.raises(TimeoutError, match=r"^algo-2 did not report"):
+        main.exchange_statistics(preprocess, "algo-1", hosts, address, b"test", timeout=2)
+    reporter.join(timeout=10)
+    assert reporter.exitcode != 0
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        main.get_s3_client.cache_clear()
+        boto3.client("s3").create_bucket(Bucket="abalone")
+        yield "abalone"
+    main.get_s3_client.cache_clear()
+
+
+def test_streams_plain_and_compressed_objects_under_prefix(input_csv, s3_bucket):
+    raw = input_csv.read_bytes()
+    s3 = boto3.client("s3")
+    s3.put_object(Bucket=s3_bucket, Key="feed/day-1.csv", Body=raw)
+    s3.put_object(Bucket=s3_bucket, Key="feed/day-2.csv.gz", Body=gzip.compress(raw))
+    s3.put_object(Bucket=s3_bucket, Key="feed/day-3.csv.zst", Body=zstandard.ZstdCompressor().compress(raw))
+
+    sources = main.list_s3_sources(f"s3://{s3_bucket}/feed/", part_size=4096, max_concurrency=3)
+    assert [source.key for source in sources] == ["feed/day-1.csv", "feed/day-2.csv.gz", "feed/day-3.csv.zst"]
+
+    streamed = pd.concat(main.read_input_chunks(sources, chunk_size=1000), ignore_index=True)
+    expected = pd.concat([main.conform_dtypes(main.read_input(input_csv))] * 3, ignore_index=True)
+    pd.testing.assert_frame_equal(streamed, expected)
+
+
+def test_object_uri_does_not_pick_up_sibling_keys(s3_bucket):
+    s3 = boto3.client("s3")
+    for key in ["dataset/abalone-dataset.csv", "dataset/abalone-dataset.csv.bak", "dataset/abalone-dataset.csv.gz"]:
+        s3.put_object(Bucket=s3_bucket, Key=key, Body=b"M,0.455,0.365,0.095,0.514,0.2245,0.101,0.15,15\n")
+    s3.put_object(Bucket=s3_bucket, Key="feed-old/day-1.csv", Body=b"1\n")
+    s3.put_object(Bucket=s3_bucket, Key="feed/day-1.csv", Body=b"1\n")
+
+    sources = main.list_s3_sources(f"s3://{s3_bucket}/dataset/abalone-dataset.csv")
+    assert [source.key for source in sources] == ["dataset/abalone-dataset.csv"]
+    # a URI naming no object is a prefix of the objects under it
+    assert [source.key for source in main.list_s3_sources(f"s3://{s3_bucket}/feed")] == ["feed/day-1.csv"]
+    assert len(main.list_s3_sources(f"s3://{s3_bucket}/dataset/")) == 3
+
+
+def test_range_reader_returns_exact_bytes(s3_bucket):
+    body = np.random.default_rng(3).bytes(100_003)
+    boto3.client("s3").put_object(Bucket=s3_bucket, Key="blob", Body=body)
+    reader = main.S3RangeReader(s3_bucket, "blob", len(body), part_size=1000, max_concurrency=4)
+    with reader:
+        assert reader.read() == body
+    assert reader.bytes_read == len(body)
+
+
+def test_saved_preprocessor_reproduces_column_transformer(input_csv, tmp_path):
+    df = main.read_input(input_csv)
+    df.pop("rings")
+    column_transformer = main.build_preprocessor(NUMERIC_FEATURES, CATEGORICAL_FEATURES)
+    expected = column_transformer.fit_transform(df)
+
+    fitted = main.StreamingPreprocessor.from_column_transformer(
+        column_transformer, NUMERIC_FEATURES, CATEGORICAL_FEATURES
+    )
+    main.save_preprocessor(fitted, tmp_path / "preprocessor" / "preprocessor.json", cache_key="abc")
+    loaded = main.load_preprocessor(tmp_path / "preprocessor" / "preprocessor.json")
+    np.testing.assert_allclose(loaded.transform(df), expected)
+
+
+def test_cache_round_trip_and_invalidation(input_csv, base_dir, tmp_path, s3_bucket):
+    definition = {"output_format": "csv"}
+    cache_key = main.compute_cache_key([input_csv], definition)
+    assert cache_key != main.compute_cache_key([input_csv], {"output_format": "parquet"})
+
+    cache = main.PreprocessCache(f"s3://{s3_bucket}/cache", cache_key)
+    assert not cache.is_complete()
+    main.preprocess_streaming([input_csv], base_dir, NUMERIC_FEATURES, CATEGORICAL_FEATURES, 1000, seed=0)
+    (base_dir / "preprocessor").mkdir()
+    (base_dir / "preprocessor" / "preprocessor.json").write_text("{}")
+    cache.store(base_dir, "algo-1", ["algo-1", "algo-2"])
+    assert not cache.is_complete()
+    cache.store(tmp_path / "empty", "algo-2", ["algo-1", "algo-2"])
+    assert cache.is_complete()
+
+    restored = tmp_path / "restored"
+    cache.restore(restored)
+    for path in base_dir.rglob("*.*"):
+        assert (restored / path.relative_to(base_dir)).read_bytes() == path.read_bytes()
+
+    input_csv.write_text(input_csv.read_text().replace("M,", "F,", 1))
+    assert main.compute_cache_key([input_csv], definition) != cache_key
+
+
+@pytest.mark.parametrize("stratify", [False, True])
+def test_split_indices_partition_rows(stratify):
+    labels = np.random.default_rng(4).integers(1, 20, 10_000)
+    splits = main.split_indices(len(labels), seed=5, stratify=labels if stratify else None)
+
+    np.testing.assert_array_equal(np.sort(np.concatenate(splits)), np.arange(len(labels)))
+    assert [len(s) / len(labels) for s in splits] == pytest.approx(main.split_fractions, abs=0.01)
+    for a, b in zip(splits, main.split_indices(len(labels), seed=5, stratify=labels if stratify else None)):
+        np.testing.assert_array_equal(a, b)
+    if stratify:
+        for label in np.unique(labels):
+            share = np.mean(labels[splits[0]] == label) / np.mean(labels == label)
+            assert share == pytest.approx(1.0, abs=0.05)
+
+
+def test_in_memory_writes_every_row_once(input_csv, base_dir):
+    main.preprocess_in_memory([input_csv], base_dir, NUMERIC_FEATURES, CATEGORICAL_FEATURES, seed=0, stratify=True)
+    written = read_splits(base_dir)
+
+    df = main.read_input(input_csv)
+    y = df.pop("rings").to_numpy().reshape(-1, 1)
+    expected = np.concatenate(
+        (y, main.build_preprocessor(NUMERIC_FEATURES, CATEGORICAL_FEATURES).fit_transform(df)), axis=1
+    )
+    np.testing.assert_allclose(sort_rows(written), sort_rows(expected))
+
+
+def write_incremental_days(tmp_path):
+    df = pd.read_csv(DATASET, header=None)
+    days = [tmp_path / f"day-{i}.csv" for i in range(3)]
+    df.iloc[:2000].to_csv(days[0], header=False, index=False)
+    df.iloc[2000:].to_csv(days[1], header=False, index=False)
+    shifted = df.iloc[:2000].copy()
+    shifted[1] *= 3.0
+    shifted.to_csv(days[2], header=False, index=False)
+    return df, days
+
+
+def run_incremental(tmp_path, state, sources, **kwargs):
+    out = tmp_path / f"out-{len(list(tmp_path.glob('out-*')))}"
+    for name in main.split_names:
+        (out / name).mkdir(parents=True)
+    main.preprocess_incremental(sources, out, NUMERIC_FEATURES, CATEGORICAL_FEATURES, 500, state, **kwargs)
+    return out
+
+
+def list_shards(s3_bucket, split):
+    response = boto3.client("s3").list_objects_v2(Bucket=s3_bucket, Prefix=f"incremental/{split}/")
+    return sorted(obj["Key"].rsplit("/", 1)[1] for obj in response.get("Contents", []))
+
+
+def test_incremental_appends_new_inputs_and_refits_on_drift(tmp_path, s3_bucket):
+    df, days = write_incremental_days(tmp_path)
+    state = main.IncrementalState(f"s3://{s3_bucket}/incremental")
+
+    def run(sources, **kwargs):
+        return run_incremental(tmp_path, state, sources, **kwargs)
+
+    first = run(days[:1])
+    assert {p.name for p in first.rglob("*.csv")} == {f"{name}-00000.csv" for name in main.split_names}
+    assert list_shards(s3_bucket, "train") == ["train-00000.csv"]
+
+    second = run(days[:2], refit_threshold=1.0)
+    assert {p.name for p in second.rglob("*.csv")} == {f"{name}-00001.csv" for name in main.split_names}
+    assert sum(len(pd.read_csv(p, header=None)) for p in second.rglob("*.csv")) == len(df) - 2000
+    assert state.load()["statistics"]["stats"]["length"]["count"] == len(df)
+    assert list_shards(s3_bucket, "train") == ["train-00000.csv", "train-00001.csv"]
+
+    # Stable assignment: a refit puts every row back into the split it was in.
+    refit = run(days[:2], refit=True)
+    assert (state.load()["first_batch"], state.load()["batch"]) == (2, 2)
+    assert list_shards(s3_bucket, "train") == ["train-00002.csv"]
+    for name in main.split_names:
+        before = pd.concat([pd.read_csv(p, header=None) for out in (first, second) for p in (out / name).iterdir()])
+        before = before.to_numpy()[:, 0]
+        after = pd.read_csv(refit / name / f"{name}-00002.csv", header=None).to_numpy()[:, 0]
+        np.testing.assert_array_equal(np.sort(before), np.sort(after))
+
+    drifted = run(days, refit_threshold=0.1)
+    assert state.load()["first_batch"] == state.load()["batch"] == 3
+    assert sum(len(pd.read_csv(p, header=None)) for p in drifted.rglob("*.csv")) == len(df) + 2000
+    assert list_shards(s3_bucket, "validation") == ["validation-00003.csv"]
+
+
+def test_failed_refit_keeps_the_previous_shards(tmp_path, s3_bucket, monkeypatch):
+    df, days = write_incremental_days(tmp_path)
+    state = main.IncrementalState(f"s3://{s3_bucket}/incremental")
+    run_incremental(tmp_path, state, days[:2])
+    before = state.load()
+    shards = {name: list_shards(s3_bucket, name) for name in main.split_names}
+
+    # the job dies after writing and uploading the refit's shards, before its state is saved
+    def fail(state):
+        raise RuntimeError("job stopped")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(state, "save", fail)
+        with pytest.raises(RuntimeError):
+            run_incremental(tmp_path, state, days[:2], refit=True)
+    assert state.load() == before
+    assert list_shards(s3_bucket, "train") == ["train-00000.csv", "train-00001.csv"]
+
+    # the next run finds no new input and drops the orphaned shards, leaving every row in place
+    run_incremental(tmp_path, state, days[:2])
+    assert state.load() == before
+    assert {name: list_shards(s3_bucket, name) for name in main.split_names} == shards
+    s3 = boto3.client("s3")
+    rows = sum(
+        len(pd.read_csv(s3.get_object(Bucket=s3_bucket, Key=f"incremental/{name}/{key}")["Body"], header=None))
+        for name, keys in shards.items()
+        for key in keys
+    )
+    assert rows == len(df)
+
+
+def test_profile_is_collected_in_the_fit_pass(input_csv, base_dir):
+    with open(input_csv, "a") as f:
+        f.write("M,0.5,oops,0.1,0.5,0.2,0.1,0.15,9\n")
+    profile = main.DataProfile()
+    main.preprocess_streaming([input_csv], base_dir, NUMERIC_FEATURES, CATEGORICAL_FEATURES, 700, profile=profile)
+    report = profile.report()
+
+    df = pd.read_csv(input_csv, header=None, names=main.feature_columns_names + [main.label_column])
+    diameter = pd.to_numeric(df["diameter"], errors="coerce")
+    assert report["rows"] == len(df)
+    assert report["violations"]["dtype"] == 1
+    assert report["columns"]["diameter"]["dtype_violations"] == 1
+    assert report["columns"]["diameter"]["null_count"] == diameter.isna().sum()
+    assert report["columns"]["length"]["max"] == df["length"].max()
+    assert report["columns"]["length"]["quantiles"]["p50"] == pytest.approx(df["length"].median())
+    assert report["columns"]["sex"]["cardinality"] == df["sex"].nunique()
+
+
+def test_dmatrix_cache_matches_text_splits(input_csv, base_dir):
+    xgboost = pytest.importorskip("xgboost")
+    main.preprocess_streaming(
+        [input_csv], base_dir, NUMERIC_FEATURES, CATEGORICAL_FEATURES, 1000, seed=0, dmatrix_cache=True
+    )
+
+    for name in main.split_names:
+        split = pd.read_csv(base_dir / name / f"{name}.csv", header=None).to_numpy()
+        dmatrix = xgboost.DMatrix(str(base_dir / "dmatrix" / name / f"{name}.buffer"))
+        np.testing.assert_allclose(dmatrix.get_label(), split[:, 0], rtol=1e-6)
+        np.testing.assert_allclose(dmatrix.get_data().toarray(), split[:, 1:], rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.parametrize("output_format", ["libsvm", "parquet"])
+def test_split_writers_round_trip(tmp_path, output_format):
+    """Every writer reads back to the rows written, even when a feature is all zeros in a split."""
+    rng = np.random.default_rng(6)
+    splits = {name: rng.normal(size=(50, 6)) for name in main.split_names}
+    splits["validation"][:, -1] = 0.0
+    for name in main.split_names:
+        (tmp_path / name).mkdir()
+    writers = main.open_split_writers(tmp_path, output_format)
+    for name, rows in splits.items():
+        writers[name].write(rows[:20])
+        writers[name].write(rows[20:])
+    assert main.close_split_writers(writers) == dict.fromkeys(main.split_names, 50)
+
+    for name, rows in splits.items():
+        path = tmp_path / name / f"{name}.{output_format}"
+        if output_format == "libsvm":
+            from sklearn.datasets import load_svmlight_file
+
+            X, y = load_svmlight_file(str(path), n_features=rows.shape[1] - 1, zero_based=True)
+            read = np.column_stack((y, X.toarray()))
+        else:
+            read = pd.read_parquet(path).to_numpy()
+        np.testing.assert_allclose(read, rows)
+
+
+def test_split_parts_spread_rows_evenly(input_csv, base_dir):
+    main.preprocess_in_memory([input_csv], base_dir, NUMERIC_FEATURES, CATEGORICAL_FEATURES, seed=0, split_parts=3)
+
+    for name in main.split_names:
+        parts = sorted((base_dir / name).glob("*.csv"))
+        assert [p.name for p in parts] == [f"{name}-part{i:03d}.csv" for i in range(3)]
+        sizes = [len(pd.read_csv(p, header=None)) for p in parts]
+        assert max(sizes) - min(sizes) <= 1
+    written = np.concatenate(
+        [pd.read_csv(p, header=None).to_numpy() for name in main.split_names for p in (base_dir / name).glob("*.csv")]
+    )
+    assert len(written) == len(pd.read_csv(input_csv, header=None))
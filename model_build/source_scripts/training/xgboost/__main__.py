@@ -14,3 +14,490 @@
 # HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Script-mode XGBoost training entry point for the abalone splits.
+
+Runs in the SageMaker XGBoost framework container (hyperparameters arrive as
+command line arguments, channels and the model directory as SM_* environment
+variables) and locally, e.g.:
+
+    python source_scripts/training/xgboost --train <dir> --validation <dir> --model-dir <dir>
+
+On a multi-instance job every host trains on its ShardedByS3Key share of the
+channels as one worker of an XGBoost collective, with the tracker on the
+first host. `--workers N` runs the same code path as N local processes.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import pickle
+import resource
+import socket
+import tarfile
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+from xgboost import collective
+from xgboost.tracker import RabitTracker
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+data_formats = ["csv", "libsvm", "parquet", "dmatrix"]
+data_extensions = {"csv": "csv", "libsvm": "libsvm", "parquet": "parquet", "dmatrix": "buffer"}
+
+
+def list_split_files(channel_dir, data_format):
+    """Lists the split files (one per preprocessing shard) of a channel, in name order."""
+    paths = sorted(str(p) for p in pathlib.Path(channel_dir).rglob(f"*.{data_extensions[data_format]}"))
+    if not paths:
+        raise FileNotFoundError(f"No {data_format} files under {channel_dir}")
+    return paths
+
+
+def read_num_features(preprocessor_path):
+    """Number of features the preprocessing step's preprocessor.json transforms the input into."""
+    with open(preprocessor_path) as f:
+        params = json.load(f)["params"]
+    return len(params["numeric_features"]) + sum(len(categories) for categories in params["categories"])
+
+
+def read_split_chunks(paths, data_format, chunk_size=100_000, num_features=None):
+    """Yields (features, labels) batches of a split, the label being the first column.
+
+    libsvm rows omit zero-valued features, so every libsvm file is read `num_features`
+    wide when it is given instead of as wide as its own highest feature index.
+    """
+    for path in paths:
+        if data_format == "csv":
+            for chunk in pd.read_csv(path, header=None, chunksize=chunk_size, dtype=np.float32):
+                rows = chunk.to_numpy()
+                yield rows[:, 1:], rows[:, 0]
+        elif data_format == "parquet":
+            import pyarrow.parquet
+
+            for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+                rows = batch.to_pandas().to_numpy(dtype=np.float32)
+                yield rows[:, 1:], rows[:, 0]
+        elif data_format == "libsvm":
+            from sklearn.datasets import load_svmlight_file
+
+            X, y = load_svmlight_file(path, n_features=num_features, zero_based=True, dtype=np.float32)
+            yield X, y
+        else:
+            shard = xgboost.DMatrix(path)
+            yield shard.get_data(), shard.get_label()
+
+
+class SplitIterator(xgboost.DataIter):
+    """Feeds a split to XGBoost batch by batch, so it is never parsed as a whole.
+
+    With a `cache_prefix`, the DMatrix built from it pages its data to disk
+    (external memory); without, a QuantileDMatrix quantises each batch as it
+    arrives and never holds the raw float matrix.
+    """
+
+    def __init__(self, paths, data_format, chunk_size=100_000, cache_prefix=None, num_features=None):
+        self.paths = paths
+        self.data_format = data_format
+        self.chunk_size = chunk_size
+        self.num_features = num_features
+        self.rows = 0
+        self._chunks = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self._chunks = read_split_chunks(self.paths, self.data_format, self.chunk_size, self.num_features)
+            self.rows = 0
+        try:
+            X, y = next(self._chunks)
+        except StopIteration:
+            return 0
+        self.rows += X.shape[0]
+        input_data(data=X, label=y)
+        return 1
+
+    def reset(self):
+        self._chunks = None
+
+
+def load_split(
+    channel_dir,
+    data_format,
+    max_bin=256,
+    ref=None,
+    external_memory_dir=None,
+    chunk_size=100_000,
+    shard=None,
+    num_features=None,
+):
+    """Builds the training matrix of one channel.
+
+    Args:
+        channel_dir: directory holding the split file(s)
+        data_format: one of `data_formats`
+        max_bin: number of histogram bins
+        ref: the training matrix, whose histogram cuts a validation matrix reuses
+        external_memory_dir: page the data to this directory instead of holding it in memory
+        chunk_size: rows per batch read from text and Parquet files
+        shard: (rank, workers) to read only every workers-th file from rank on, as
+            ShardedByS3Key does for a channel of a multi-instance job
+        num_features: width of the features, needed by "libsvm" whose rows omit zeros
+
+    Returns:
+        the xgboost.DMatrix (a QuantileDMatrix unless in external memory)
+    """
+    paths = list_split_files(channel_dir, data_format)
+    if shard is not None:
+        rank, workers = shard
+        if len(paths) < workers:
+            raise ValueError(f"{channel_dir} has {len(paths)} file(s) for {workers} workers; write more split parts.")
+        paths = paths[rank::workers]
+    if external_memory_dir is not None:
+        name = pathlib.Path(channel_dir).name
+        cache_prefix = os.path.join(external_memory_dir, name if shard is None else f"{name}-{shard[0]}")
+        return xgboost.DMatrix(SplitIterator(paths, data_format, chunk_size, cache_prefix, num_features))
+    if data_format == "dmatrix" and len(paths) == 1:
+        return xgboost.DMatrix(paths[0])
+    iterator = SplitIterator(paths, data_format, chunk_size, num_features=num_features)
+    return xgboost.QuantileDMatrix(iterator, max_bin=max_bin, ref=ref)
+
+
+def download_approved_model(model_package_group_name, model_dir):
+    """Downloads the model.tar.gz of the latest approved package of a model package group
+
+    Looked up when the job runs, so training continues the model approved at that time.
+
+    Args:
+        model_package_group_name: name of the model package group
+        model_dir: directory to download the model.tar.gz into
+
+    Returns:
+        `model_dir`, or None if the group has no approved package
+    """
+    import boto3
+
+    sagemaker_client = boto3.client("sagemaker")
+    pages = sagemaker_client.get_paginator("list_model_packages").paginate(
+        ModelPackageGroupName=model_package_group_name,
+        ModelApprovalStatus="Approved",
+        SortBy="CreationTime",
+        SortOrder="Descending",
+    )
+    for page in pages:
+        for package in page["ModelPackageSummaryList"]:
+            model_package_arn = package["ModelPackageArn"]
+            response = sagemaker_client.describe_model_package(ModelPackageName=model_package_arn)
+            model_data = response["InferenceSpecification"]["Containers"][0]["ModelDataUrl"]
+            logger.info("Continuing %s of the approved model package %s.", model_data, model_package_arn)
+            bucket, _, key = model_data[len("s3://") :].partition("/")
+            pathlib.Path(model_dir).mkdir(parents=True, exist_ok=True)
+            boto3.client("s3").download_file(bucket, key, os.path.join(model_dir, "model.tar.gz"))
+            return model_dir
+    return None
+
+
+def load_base_model(base_model_dir):
+    """Loads the booster to continue from a model.tar.gz (or its extracted files) in `base_model_dir`.
+
+    Reads native JSON/UBJ models as well as the pickled booster written by the
+    built-in algorithm container.
+    """
+    models = {}
+    for path in sorted(pathlib.Path(base_model_dir).rglob("*")):
+        if path.name.endswith(".tar.gz"):
+            with tarfile.open(path) as tar:
+                for member in tar.getmembers():
+                    if member.isfile() and pathlib.Path(member.name).name.startswith("xgboost-model"):
+                        models[pathlib.Path(member.name).name] = tar.extractfile(member).read()
+        elif path.name.startswith("xgboost-model"):
+            models[path.name] = path.read_bytes()
+    for name in ["xgboost-model.json", "xgboost-model.ubj"]:
+        if name in models:
+            return xgboost.Booster(model_file=bytearray(models[name]))
+    if "xgboost-model" in models:
+        return pickle.loads(models["xgboost-model"])
+    raise FileNotFoundError(f"No XGBoost model under {base_model_dir}")
+
+
+def latest_checkpoint(checkpoint_dir):
+    """Loads the checkpoint with the most boosting rounds from `checkpoint_dir`, or returns None."""
+    paths = sorted(pathlib.Path(checkpoint_dir).glob("checkpoint-*.ubj"))
+    if not paths:
+        return None
+    return xgboost.Booster(model_file=str(paths[-1]))
+
+
+def save_checkpoint(booster, checkpoint_dir):
+    """Atomically writes `checkpoint-<rounds>.ubj` and removes the older checkpoints."""
+    pathlib.Path(checkpoint_dir).mkdir(parents=True, exist_ok=True)
+    path = os.path.join(checkpoint_dir, f"checkpoint-{booster.num_boosted_rounds():06d}.ubj")
+    booster.save_model(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    for old in pathlib.Path(checkpoint_dir).glob("checkpoint-*.ubj"):
+        if str(old) != path:
+            old.unlink()
+
+
+def boost(params, dtrain, evals, rounds, booster=None, seed=0, interval=10, checkpoint_dir=None):
+    """Boosts `booster` up to `rounds` rounds in total, one segment of `interval` rounds at a time.
+
+    The random state XGBoost samples rows and columns with is not part of a
+    saved model, so each segment is seeded from its first round instead.
+    Segments start at multiples of `interval`, which makes a run resumed from
+    a checkpoint train exactly the same trees as an uninterrupted one.
+    """
+    done = 0 if booster is None else booster.num_boosted_rounds()
+    while done < rounds:
+        segment = min(interval - done % interval, rounds - done)
+        booster = xgboost.train(
+            {**params, "seed": seed + done}, dtrain, segment, evals=evals, verbose_eval=True, xgb_model=booster
+        )
+        done += segment
+        if checkpoint_dir is not None and collective.get_rank() == 0:
+            save_checkpoint(booster, checkpoint_dir)
+    return booster
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process so far (ru_maxrss is in KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_params(args):
+    return {
+        "objective": args.objective,
+        "tree_method": "hist",
+        "max_bin": args.max_bin,
+        "nthread": args.nthread,
+        "max_depth": args.max_depth,
+        "eta": args.eta,
+        "gamma": args.gamma,
+        "min_child_weight": args.min_child_weight,
+        "subsample": args.subsample,
+        "eval_metric": "rmse",
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train", type=str, default=os.environ.get("SM_CHANNEL_TRAIN"))
+    parser.add_argument("--validation", type=str, default=os.environ.get("SM_CHANNEL_VALIDATION"))
+    parser.add_argument("--model-dir", type=str, default=os.environ.get("SM_MODEL_DIR", "model"))
+    parser.add_argument(
+        "--base-model",
+        type=str,
+        default=os.environ.get("SM_CHANNEL_BASE_MODEL"),
+        help="Directory holding a model to continue boosting from instead of training from scratch.",
+    )
+    parser.add_argument(
+        "--preprocessor",
+        type=str,
+        default=os.environ.get("SM_CHANNEL_PREPROCESSOR"),
+        help="Directory holding the preprocessor.json of the splits, which sets the width of libsvm splits.",
+    )
+    parser.add_argument(
+        "--base-model-package-group",
+        type=str,
+        default=None,
+        help="Continue boosting the latest approved model of this model package group, looked up at run time "
+        "(trains from scratch if the group has none).",
+    )
+    parser.add_argument("--base-model-dir", type=str, default="/tmp/base-model")
+    parser.add_argument("--max-added-rounds", type=int, default=20, help="Cap on the rounds added to a base model.")
+    parser.add_argument("--data-format", type=str, default="csv", choices=data_formats)
+    parser.add_argument("--model-format", type=str, default="json", choices=["json", "ubj"])
+    parser.add_argument(
+        "--external-memory",
+        action="store_true",
+        help="Page the training data to local disk, for splits larger than memory.",
+    )
+    parser.add_argument("--external-memory-dir", type=str, default="/tmp/xgboost-cache")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Train with this many local worker processes, each on its share of the split files.",
+    )
+    parser.add_argument("--tracker-port", type=int, default=9099)
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=str,
+        default=None,
+        help="Write boosting checkpoints here and resume from the latest one, e.g. /opt/ml/checkpoints.",
+    )
+    parser.add_argument("--checkpoint-interval", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nthread", type=int, default=int(os.environ.get("SM_NUM_CPUS", os.cpu_count())))
+    parser.add_argument("--num-round", type=int, default=50)
+    parser.add_argument("--objective", type=str, default="reg:squarederror")
+    parser.add_argument("--max-bin", type=int, default=256)
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--eta", type=float, default=0.2)
+    parser.add_argument("--gamma", type=float, default=4)
+    parser.add_argument("--min-child-weight", type=float, default=6)
+    parser.add_argument("--subsample", type=float, default=0.7)
+    args = parser.parse_args(argv)
+    if args.train is None:
+        parser.error("--train (or SM_CHANNEL_TRAIN) is required")
+    return args
+
+
+def train(args, shard=None):
+    """Trains on this process's share of the channels and saves the model from rank 0.
+
+    Runs on its own or as one worker of a collective, in which case XGBoost
+    synchronises the histograms across workers every round.
+    """
+    params = get_params(args)
+    external_memory_dir = None
+    if args.external_memory:
+        external_memory_dir = args.external_memory_dir
+        pathlib.Path(external_memory_dir).mkdir(parents=True, exist_ok=True)
+
+    num_features = None
+    if args.preprocessor:
+        num_features = read_num_features(os.path.join(args.preprocessor, "preprocessor.json"))
+
+    logger.info("Loading %s splits with %d threads.", args.data_format, args.nthread)
+    start = time.perf_counter()
+    dtrain = load_split(
+        args.train,
+        args.data_format,
+        args.max_bin,
+        external_memory_dir=external_memory_dir,
+        chunk_size=args.chunk_size,
+        shard=shard,
+        num_features=num_features,
+    )
+    evals = [(dtrain, "train")]
+    if args.validation:
+        dvalidation = load_split(
+            args.validation,
+            args.data_format,
+            args.max_bin,
+            dtrain,
+            external_memory_dir,
+            args.chunk_size,
+            shard,
+            num_features,
+        )
+        evals.append((dvalidation, "validation"))
+    load_seconds = time.perf_counter() - start
+    rows = dtrain.num_row()
+    if collective.is_distributed():
+        rows = int(collective.allreduce(np.array([rows], dtype=np.float64), collective.Op.SUM)[0])
+
+    rounds = args.num_round
+    booster = None
+    if args.base_model:
+        booster = load_base_model(args.base_model)
+        rounds = booster.num_boosted_rounds() + min(args.num_round, args.max_added_rounds)
+        logger.info("Continuing a %d-round base model.", booster.num_boosted_rounds())
+    if args.checkpoint_dir:
+        checkpoint = latest_checkpoint(args.checkpoint_dir)
+        if checkpoint is not None:
+            booster = checkpoint
+            logger.info("Resuming from the checkpoint at round %d.", booster.num_boosted_rounds())
+
+    num_round = rounds - (0 if booster is None else booster.num_boosted_rounds())
+    logger.info("Training on %d rows for %d rounds.", rows, num_round)
+    start = time.perf_counter()
+    booster = boost(
+        params, dtrain, evals, rounds, booster, args.seed, args.checkpoint_interval, args.checkpoint_dir
+    )
+    train_seconds = time.perf_counter() - start
+
+    if collective.get_rank() != 0:
+        return booster
+
+    pathlib.Path(args.model_dir).mkdir(parents=True, exist_ok=True)
+    model_path = os.path.join(args.model_dir, f"xgboost-model.{args.model_format}")
+    booster.save_model(model_path)
+    logger.info("Saved model to %s.", model_path)
+
+    # picked up by the metric definitions of the training job
+    logger.info("load_rows_per_sec=%.1f;", rows / load_seconds)
+    # every boosting round passes over all rows
+    logger.info("train_rows_per_sec=%.1f;", rows * num_round / max(train_seconds, 1e-9))
+    logger.info("peak_memory_mb=%.1f;", peak_memory_mb())
+    return booster
+
+
+def train_worker(args, tracker_args, rank, shard=None):
+    """Joins the collective through the tracker as task `rank` and trains."""
+    with collective.CommunicatorContext(**tracker_args, dmlc_task_id=f"{rank:05d}", dmlc_retry=10):
+        return train(args, shard)
+
+
+def start_tracker(workers, host_ip, port=0):
+    """Starts the rendezvous tracker; ranks follow the task ids passed by `train_worker`."""
+    tracker = RabitTracker(n_workers=workers, host_ip=host_ip, port=port, sortby="task")
+    tracker.start()
+    return tracker
+
+
+def train_local_cluster(args):
+    """Trains with `args.workers` processes on localhost, the stand-in for a multi-instance job.
+
+    Each process reads its own share of the split files, as the instances of a
+    job with ShardedByS3Key channels do, and the threads are divided between
+    the processes.
+    """
+    tracker = start_tracker(args.workers, "127.0.0.1")
+    worker_args = argparse.Namespace(**{**vars(args), "nthread": max(1, args.nthread // args.workers)})
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=train_worker, args=(worker_args, tracker.worker_args(), rank, (rank, args.workers)))
+        for rank in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed = [rank for rank, process in enumerate(processes) if process.exitcode != 0]
+    if failed:
+        tracker.free()
+        raise RuntimeError(f"Training workers {failed} failed.")
+    tracker.wait_for()
+    return xgboost.Booster(model_file=os.path.join(args.model_dir, f"xgboost-model.{args.model_format}"))
+
+
+def train_cluster(args, hosts, current_host):
+    """Trains as one instance of a multi-instance job; the first host also runs the tracker."""
+    rank = hosts.index(current_host)
+    tracker_ip = socket.gethostbyname(hosts[0])
+    logger.info("Training as rank %d of %d hosts, tracker on %s:%d.", rank, len(hosts), tracker_ip, args.tracker_port)
+    tracker = start_tracker(len(hosts), tracker_ip, args.tracker_port) if rank == 0 else None
+    tracker_args = {"dmlc_tracker_uri": tracker_ip, "dmlc_tracker_port": args.tracker_port}
+    booster = train_worker(args, tracker_args, rank)
+    if tracker is not None:
+        tracker.wait_for()
+    return booster
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.base_model_package_group and not args.base_model:
+        args.base_model = download_approved_model(args.base_model_package_group, args.base_model_dir)
+        if args.base_model is None:
+            logger.warning("No approved model in %s; training from scratch.", args.base_model_package_group)
+    hosts = json.loads(os.environ.get("SM_HOSTS", "[]"))
+    if args.workers > 1:
+        return train_local_cluster(args)
+    if len(hosts) > 1:
+        return train_cluster(args, hosts, os.environ["SM_CURRENT_HOST"])
+    return train(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Tests for the script-mode XGBoost trainer, run against the abalone dataset."""
+import importlib.util
+import pathlib
+import pickle
+import subprocess
+import sys
+import tarfile
+import time
+
+import numpy as np
+import pytest
+import xgboost
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parents[1]
+SOURCE_SCRIPTS = SCRIPT_DIR.parents[1]
+DATASET = SOURCE_SCRIPTS.parent / "ml_pipelines" / "data" / "abalone-dataset.csv"
+
+
+def load_script(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+train = load_script(SCRIPT_DIR / "__main__.py", "train_xgboost")
+preprocess = load_script(SOURCE_SCRIPTS / "preprocessing" / "prepare_abalone_data" / "main.py", "prepare_abalone_data")
+evaluate = load_script(SOURCE_SCRIPTS / "evaluate" / "evaluate_xgboost" / "main.py", "evaluate_xgboost")
+
+
+@pytest.fixture(scope="module")
+def splits(tmp_path_factory):
+    """The abalone dataset preprocessed into splits in every format."""
+    base_dir = tmp_path_factory.mktemp("splits")
+    numeric_features = [c for c in preprocess.feature_columns_names if c != "sex"]
+    for output_format in preprocess.split_writers:
+        for name in preprocess.split_names:
+            (base_dir / output_format / name).mkdir(parents=True)
+        preprocess.preprocess_in_memory(
+            [str(DATASET)],
+            base_dir / output_format,
+            numeric_features,
+            ["sex"],
+            output_format,
+            seed=0,
+            dmatrix_cache=output_format == "csv",
+        )
+    return base_dir
+
+
+def validation_rmse(booster, splits):
+    y, dtest = evaluate.load_test_data(splits / "csv" / "validation")
+    return np.sqrt(np.mean((booster.predict(dtest) - y) ** 2))
+
+
+@pytest.mark.parametrize("data_format", ["csv", "libsvm", "parquet", "dmatrix"])
+def test_trains_on_every_split_format(splits, tmp_path, data_format):
+    base_dir = splits / ("csv/dmatrix" if data_format == "dmatrix" else data_format)
+    model_dir = tmp_path / "model"
+    booster = train.main(
+        ["--train", str(base_dir / "train"), "--validation", str(base_dir / "validation")]
+        + ["--model-dir", str(model_dir), "--data-format", data_format]
+    )
+
+    assert validation_rmse(booster, splits) < 2.5
+    saved = xgboost.Booster(model_file=str(model_dir / "xgboost-model.json"))
+    assert saved.num_boosted_rounds() == 50
+
+
+def test_external_memory_matches_in_memory(splits, tmp_path):
+    args = ["--train", str(splits / "csv" / "train"), "--num-round", "10", "--chunk-size", "500"]
+    in_memory = train.main(args + ["--model-dir", str(tmp_path / "in-memory")])
+    external = train.main(
+        args
+        + ["--model-dir", str(tmp_path / "external"), "--model-format", "ubj", "--external-memory"]
+        + ["--external-memory-dir", str(tmp_path / "cache")]
+    )
+
+    assert (tmp_path / "external" / "xgboost-model.ubj").exists()
+    assert abs(validation_rmse(in_memory, splits) - validation_rmse(external, splits)) < 0.1
+
+
+@pytest.mark.parametrize("model_name", ["xgboost-model.json", "xgboost-model"])
+def test_warm_start_continues_the_base_model_for_capped_rounds(splits, tmp_path, model_name):
+    args = ["--train", str(splits / "csv" / "train"), "--num-round", "10"]
+    base = train.main(args + ["--model-dir", str(tmp_path / "base")])
+    if model_name == "xgboost-model":
+        # the built-in algorithm container pickles the booster
+        (tmp_path / "base" / model_name).write_bytes(pickle.dumps(base))
+    (tmp_path / "package").mkdir()
+    with tarfile.open(tmp_path / "package" / "model.tar.gz", "w:gz") as tar:
+        tar.add(tmp_path / "base" / model_name, arcname=model_name)
+
+    continued = train.main(
+        args
+        + ["--model-dir", str(tmp_path / "continued"), "--base-model", str(tmp_path / "package")]
+        + ["--max-added-rounds", "5"]
+    )
+
+    assert continued.num_boosted_rounds() == 15
+    assert validation_rmse(continued, splits) < validation_rmse(base, splits)
+
+
+def test_local_workers_train_on_their_share_of_the_parts(tmp_path):
+    numeric_features = [c for c in preprocess.feature_columns_names if c != "sex"]
+    for name in preprocess.split_names:
+        (tmp_path / name).mkdir()
+    preprocess.preprocess_in_memory([str(DATASET)], tmp_path, numeric_features, ["sex"], seed=0, split_parts=2)
+    args = ["--train", str(tmp_path / "train"), "--validation", str(tmp_path / "validation"), "--num-round", "20"]
+
+    single = train.main(args + ["--model-dir", str(tmp_path / "single")])
+    distributed = train.main(args + ["--model-dir", str(tmp_path / "distributed"), "--workers", "2"])
+
+    assert distributed.num_boosted_rounds() == 20
+    y, dtest = evaluate.load_test_data(tmp_path / "test")
+    rmse = [np.sqrt(np.mean((booster.predict(dtest) - y) ** 2)) for booster in (single, distributed)]
+    assert rmse[1] == pytest.approx(rmse[0], rel=0.05)
+
+    with pytest.raises(ValueError, match="split parts"):
+        train.load_split(tmp_path / "train", "csv", shard=(0, 3))
+
+
+def test_resumes_a_killed_run_from_its_latest_checkpoint(splits, tmp_path):
+    args = ["--train", str(splits / "csv" / "train"), "--num-round", "400", "--subsample", "0.7", "--seed", "7"]
+    args += ["--max-depth", "8", "--checkpoint-interval", "5"]
+    checkpoints = tmp_path / "checkpoints"
+    command = [sys.executable, str(SCRIPT_DIR / "__main__.py"), *args, "--checkpoint-dir", str(checkpoints)]
+    command += ["--model-dir", str(tmp_path / "resumed")]
+
+    # a spot interruption: the trainer is killed without warning part way through
+    trainer = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while not list(checkpoints.glob("checkpoint-0000[2-9]*.ubj")) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    trainer.kill()
+    assert trainer.wait() == -9
+    interrupted_at = train.latest_checkpoint(checkpoints).num_boosted_rounds()
+    assert 0 < interrupted_at < 400
+
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    resumed = xgboost.Booster(model_file=str(tmp_path / "resumed" / "xgboost-model.json"))
+    uninterrupted = train.main(args + ["--model-dir", str(tmp_path / "uninterrupted")])
+
+    assert resumed.num_boosted_rounds() == 400
+    _, dtest = evaluate.load_test_data(splits / "csv" / "test")
+    np.testing.assert_array_equal(resumed.predict(dtest), uninterrupted.predict(dtest))
@@ -0,0 +1,310 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Hyperparameter search for the abalone XGBoost model with successive halving.
+
+Configurations are sampled at random and trained for a few boosting rounds
+first; only the best `1 / reduction_factor` of them are continued to the next
+rung, so bad configurations are dropped early. With `--hyperband`, several
+such brackets trade off the number of configurations against their starting
+budget. Trials run on a local process pool that shares one loaded copy of the
+train and validation splits.
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import pathlib
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+# name -> (kind, low, high), sampled uniformly ("log": log-uniformly)
+search_space = {
+    "max_depth": ("int", 3, 10),
+    "eta": ("log", 0.01, 0.3),
+    "gamma": ("float", 0.0, 5.0),
+    "min_child_weight": ("float", 1.0, 10.0),
+    "subsample": ("float", 0.5, 1.0),
+}
+fixed_params = {"objective": "reg:squarederror", "tree_method": "hist", "eval_metric": "rmse"}
+
+# train and validation (X, y), loaded by the parent before the worker pool forks
+_dataset = {}
+_dmatrices = {}
+
+
+def sample_configs(n, seed=None):
+    """Draws `n` random configurations from `search_space`."""
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, (kind, low, high) in search_space.items():
+            if kind == "int":
+                config[name] = int(rng.integers(low, high + 1))
+            elif kind == "log":
+                config[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                config[name] = float(rng.uniform(low, high))
+        configs.append(config)
+    return configs
+
+
+def read_num_features(preprocessor_path):
+    """Number of features the preprocessing step's preprocessor.json transforms the input into."""
+    with open(preprocessor_path) as f:
+        params = json.load(f)["params"]
+    return len(params["numeric_features"]) + sum(len(categories) for categories in params["categories"])
+
+
+def load_split(split_dir, split_format="csv", num_features=None):
+    """Reads all split files of a directory into labels and a feature matrix.
+
+    libsvm rows omit zero-valued features, so the width of a libsvm split is only
+    known from `num_features`; otherwise it is inferred from the files read.
+    """
+    paths = sorted(str(p) for p in pathlib.Path(split_dir).glob(f"*.{split_format}"))
+    if not paths:
+        raise FileNotFoundError(f"No {split_format} files under {split_dir}")
+    if split_format == "libsvm":
+        import scipy.sparse
+        from sklearn.datasets import load_svmlight_files
+
+        loaded = load_svmlight_files(paths, n_features=num_features, zero_based=True, dtype=np.float32)
+        return scipy.sparse.vstack(loaded[0::2]).tocsr(), np.concatenate(loaded[1::2])
+    if split_format == "parquet":
+        rows = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True).to_numpy(np.float32)
+    else:
+        rows = np.concatenate([pd.read_csv(path, header=None, dtype=np.float32).to_numpy() for path in paths])
+    return rows[:, 1:], rows[:, 0]
+
+
+def set_dataset(train, validation):
+    """Makes the (X, y) splits available to `run_trial` in this process and in workers forked after it."""
+    _dataset["train"] = train
+    _dataset["validation"] = validation
+    _dmatrices.clear()
+
+
+def get_dmatrices(max_bin=256):
+    if not _dmatrices:
+        X, y = _dataset["train"]
+        _dmatrices["train"] = xgboost.QuantileDMatrix(X, label=y, max_bin=max_bin)
+        X, y = _dataset["validation"]
+        _dmatrices["validation"] = xgboost.QuantileDMatrix(X, label=y, ref=_dmatrices["train"])
+    return _dmatrices["train"], _dmatrices["validation"]
+
+
+def run_trial(config, num_round, model=None, nthread=1):
+    """Boosts a configuration up to `num_round` rounds and scores it on the validation split.
+
+    Args:
+        config: the hyperparameters being tried
+        num_round: total number of boosting rounds after this trial
+        model: the raw booster of this configuration's previous rung, continued
+            instead of retrained
+        nthread: threads of this trial
+
+    Returns:
+        the validation MSE and the raw (UBJ) booster
+    """
+    dtrain, dvalidation = get_dmatrices()
+    params = {**fixed_params, **config, "nthread": nthread}
+    booster = None if model is None else xgboost.Booster(params, model_file=bytearray(model))
+    done = 0 if booster is None else booster.num_boosted_rounds()
+    booster = xgboost.train(params, dtrain, num_round - done, xgb_model=booster)
+    predictions = booster.predict(dvalidation)
+    mse = float(np.mean((dvalidation.get_label() - predictions) ** 2))
+    return mse, bytes(booster.save_raw("ubj"))
+
+
+def hyperband_brackets(num_configs, min_rounds, max_rounds, reduction_factor, hyperband=False):
+    """Lists the (configurations, starting rounds) of each successive halving bracket.
+
+    Plain successive halving is the single most aggressive bracket; Hyperband
+    adds brackets that start fewer configurations on larger budgets, down to
+    one that trains every configuration for `max_rounds`.
+    """
+    if not hyperband:
+        return [(num_configs, min_rounds)]
+    s_max = int(math.log(max_rounds / min_rounds, reduction_factor) + 1e-9)
+    return [
+        (
+            max(1, math.ceil(num_configs * reduction_factor**s / reduction_factor**s_max)),
+            max(min_rounds, int(max_rounds / reduction_factor**s)),
+        )
+        for s in range(s_max, -1, -1)
+    ]
+
+
+class SearchLog:
+    """Records every evaluation and the best validation MSE over wall time."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.evaluations = []
+        self.best = None
+        self.best_mse_vs_time = []
+
+    def record(self, trial_id, config, num_round, mse):
+        seconds = time.perf_counter() - self.start
+        self.evaluations.append(
+            {"trial": trial_id, "num_round": num_round, "mse": mse, "seconds": round(seconds, 3)}
+        )
+        if self.best is None or mse < self.best["mse"]:
+            self.best = {"trial": trial_id, "mse": mse, "num_round": num_round, "hyperparameters": config}
+            self.best_mse_vs_time.append({"seconds": round(seconds, 3), "mse": mse})
+            logger.info("New best MSE %.4f after %.1fs: trial %d, %d rounds.", mse, seconds, trial_id, num_round)
+
+    def report(self, max_rounds):
+        seconds = time.perf_counter() - self.start
+        trials = len({evaluation["trial"] for evaluation in self.evaluations})
+        rounds = {}
+        for evaluation in self.evaluations:
+            rounds[evaluation["trial"]] = max(rounds.get(evaluation["trial"], 0), evaluation["num_round"])
+        return {
+            "best": self.best,
+            "trials": trials,
+            "evaluations": len(self.evaluations),
+            "wall_seconds": seconds,
+            "trials_per_hour": trials * 3600 / seconds,
+            "boosting_rounds": sum(rounds.values()),
+            "full_budget_rounds": trials * max_rounds,
+            "best_mse_vs_time": self.best_mse_vs_time,
+            "history": self.evaluations,
+        }
+
+
+def successive_halving(configs, min_rounds, max_rounds, reduction_factor, executor, log, nthread=1, first_id=0):
+    """Runs one bracket: every rung trains the survivors further and keeps the best fraction."""
+    survivors = {first_id + i: (config, None) for i, config in enumerate(configs)}
+    num_round = min_rounds
+    while True:
+        futures = {
+            trial_id: executor.submit(run_trial, config, num_round, model, nthread)
+            for trial_id, (config, model) in survivors.items()
+        }
+        scores = {}
+        for trial_id, future in futures.items():
+            mse, model = future.result()
+            config = survivors[trial_id][0]
+            log.record(trial_id, config, num_round, mse)
+            survivors[trial_id] = (config, model)
+            scores[trial_id] = mse
+        if num_round >= max_rounds or len(survivors) == 1:
+            return
+        keep = sorted(scores, key=scores.get)[: max(1, len(survivors) // reduction_factor)]
+        survivors = {trial_id: survivors[trial_id] for trial_id in keep}
+        num_round = min(num_round * reduction_factor, max_rounds)
+
+
+def search(
+    num_configs,
+    min_rounds,
+    max_rounds,
+    reduction_factor=3,
+    hyperband=False,
+    workers=None,
+    seed=None,
+):
+    """Runs the search over the splits passed to `set_dataset`.
+
+    Args:
+        num_configs: configurations started by the most aggressive bracket
+        min_rounds: boosting rounds of the first rung
+        max_rounds: boosting rounds of the last rung
+        reduction_factor: rungs keep 1 / reduction_factor of the configurations
+            and multiply their rounds by reduction_factor
+        hyperband: run all Hyperband brackets instead of plain successive halving
+        workers: trial processes; defaults to one per core
+        seed: seed of the configuration sampling
+
+    Returns:
+        the search report, with the best configuration under "best"
+    """
+    workers = workers or os.cpu_count()
+    nthread = max(1, os.cpu_count() // workers)
+    log = SearchLog()
+    brackets = hyperband_brackets(num_configs, min_rounds, max_rounds, reduction_factor, hyperband)
+    configs = sample_configs(sum(n for n, _ in brackets), seed)
+    logger.info("Searching %d configurations in %d bracket(s) on %d worker(s).", len(configs), len(brackets), workers)
+    # fork, so the workers share the parent's copy of the dataset
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        first_id = 0
+        for n, rounds in brackets:
+            bracket = configs[first_id : first_id + n]
+            successive_halving(bracket, rounds, max_rounds, reduction_factor, executor, log, nthread, first_id)
+            first_id += n
+    return log.report(max_rounds)
+
+
+if __name__ == "__main__":
+    logger.debug("Starting hyperparameter search.")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--split-format", type=str, default="csv", choices=["csv", "libsvm", "parquet"])
+    parser.add_argument("--num-configs", type=int, default=27)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=270)
+    parser.add_argument("--reduction-factor", type=int, default=3)
+    parser.add_argument("--hyperband", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    # the local pipeline runner points this at a per-job directory
+    base_dir = os.environ.get("PROCESSING_DIR", "/opt/ml/processing")
+    num_features = None
+    if pathlib.Path(f"{base_dir}/preprocessor/preprocessor.json").exists():
+        num_features = read_num_features(f"{base_dir}/preprocessor/preprocessor.json")
+    logger.info("Loading train and validation splits.")
+    set_dataset(
+        load_split(f"{base_dir}/train", args.split_format, num_features),
+        load_split(f"{base_dir}/validation", args.split_format, num_features),
+    )
+    report = search(
+        args.num_configs,
+        args.min_rounds,
+        args.max_rounds,
+        args.reduction_factor,
+        args.hyperband,
+        args.workers,
+        args.seed,
+    )
+    logger.info(
+        "%d trials in %.1fs (%.0f trials/hour); best MSE %.4f with %d rounds.",
+        report["trials"],
+        report["wall_seconds"],
+        report["trials_per_hour"],
+        report["best"]["mse"],
+        report["best"]["num_round"],
+    )
+
+    output_dir = f"{base_dir}/tuning"
+    pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with open(f"{output_dir}/tuning.json", "w") as f:
+        json.dump(report, f)
@@ -0,0 +1,69 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Tests for the successive halving hyperparameter search."""
+import importlib.util
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parents[1]
+
+spec = importlib.util.spec_from_file_location("tune_xgboost", SCRIPT_DIR / "main.py")
+main = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = main  # trials are pickled by reference to the pool workers
+spec.loader.exec_module(main)
+
+
+@pytest.fixture
+def dataset():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 5)).astype(np.float32)
+    y = (3 * X[:, 0] + X[:, 1] ** 2 + rng.normal(scale=0.1, size=len(X))).astype(np.float32)
+    main.set_dataset((X[:1500], y[:1500]), (X[1500:], y[1500:]))
+
+
+def test_continued_trial_adds_rounds(dataset):
+    config = main.sample_configs(1, seed=0)[0]
+    _, model = main.run_trial(config, 5)
+    mse, model = main.run_trial(config, 15, model)
+
+    booster = main.xgboost.Booster(model_file=bytearray(model))
+    assert booster.num_boosted_rounds() == 15
+    assert mse < np.var(main._dataset["validation"][1])
+
+
+def test_successive_halving_drops_configs_early(dataset):
+    report = main.search(num_configs=9, min_rounds=2, max_rounds=18, reduction_factor=3, workers=2, seed=0)
+
+    assert report["trials"] == 9
+    assert [e["num_round"] for e in report["history"]].count(18) == 1
+    assert report["boosting_rounds"] < report["full_budget_rounds"]
+    assert report["best"]["mse"] == min(e["mse"] for e in report["history"])
+    assert [p["mse"] for p in report["best_mse_vs_time"]] == sorted(
+        (p["mse"] for p in report["best_mse_vs_time"]), reverse=True
+    )
+    assert set(report["best"]["hyperparameters"]) == set(main.search_space)
+
+
+def test_hyperband_brackets_trade_configs_for_rounds():
+    brackets = main.hyperband_brackets(27, 10, 270, 3, hyperband=True)
+
+    assert brackets == [(27, 10), (9, 30), (3, 90), (1, 270)]
+    assert main.hyperband_brackets(27, 10, 270, 3) == [(27, 10)]